@@ -12,17 +12,41 @@ XBRL to Excel Converter - Web Application
 2. MAIN ROUTE (13-79行)
    - メインページの表示とファイル変換処理
    - convert_xbrl_to_excel.py の process_xbrl_zips を呼び出し
+   - アップロードZIPは SpooledTemporaryFile に保持し（XBRL_UPLOAD_SPOOL_MB 超過分のみディスクへ）、
+     展開せずファイルオブジェクトのまま変換エンジンへ渡す
+   - フォームの絞り込み条件（statements / scope / years）を process_xbrl_zips に渡す
+   - XBRL_PROFILE_DIR を設定すると変換ごとのプロファイル（JSON / Chromeトレース）を保存
    - 将来の分割先: web/routes/converter.py
 
-3. BOOKMARKLET ROUTES (81-87行)
+3. RESPONSE CACHE
+   - 同一アップロード（ZIP内容のハッシュ集合＋変換エンジン/辞書のバージョン）の結果を再利用
+   - サイズ上限付きのLRU削除、ETag / If-None-Match 対応
+   - 将来の分割先: web/cache.py
+
+4. JOB SUBSYSTEM
+   - 非同期変換ジョブ（POST /jobs → ジョブID、GET /jobs/<id> で進捗、/download で取得）
+   - バックグラウンドのワーカープール（プロセス間で同時実行数を制限）
+   - 将来の分割先: web/jobs.py, web/routes/jobs.py
+
+5. INSPECT ROUTE
+   - POST /inspect: ZIPの企業・期間・会計基準・財務諸表の種類をJSONで返す（変換はしない）
+   - POST /jobs もこの確認で変換できないZIPをキュー投入前に拒否
+   - 将来の分割先: web/routes/inspect.py
+
+6. TEMP JANITOR
+   - temp_uploads の自動掃除（TTL＋容量上限、リクエストとは別スレッドで実行）
+   - 実行中のジョブ（.job.lock がロック中）のディレクトリは削除しない
+   - 将来の分割先: web/janitor.py
+
+7. BOOKMARKLET ROUTES (81-87行)
    - ブックマークレット用ページ表示
    - 将来の分割先: web/routes/bookmarklets.py
 
-4. TEMP CLEAR ROUTE (89-99行)
-   - 一時ファイルクリア機能
+8. TEMP CLEAR ROUTE (89-99行)
+   - 一時ファイルクリア機能（ジャニターを即時実行。実行中のジョブは残す）
    - 将来の分割先: web/routes/admin.py
 
-5. LOCAL TESTING ENTRY POINT (101-103行)
+9. LOCAL TESTING ENTRY POINT (101-103行)
    - ローカル開発用のエントリポイント
    - 将来の分割先: dev/run_local.py
 
@@ -38,10 +62,22 @@ XBRL to Excel Converter - Web Application
 """
 
 import os
+import re
+import json
+import hashlib
+import time
 import tempfile
+import threading
+import contextlib
 import urllib.parse
 import shutil
 
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
 # ========================================================================
 # APPLICATION SETUP
 # ========================================================================
@@ -49,11 +85,192 @@ import shutil
 
 # LiteSpeedサーバー（コアサーバー等）でのマルチスレッド問題を回避
 os.environ['OPENBLAS_NUM_THREADS'] = "1"
-from flask import Flask, render_template, request, send_file, flash, redirect, url_for
+from flask import Flask, Request, render_template, request, send_file, flash, redirect, url_for, jsonify
+
+# アップロードはこのサイズまでメモリ上に保持し、超えた分だけ一時ファイルへ退避する
+UPLOAD_SPOOL_MAX_BYTES = int(float(os.environ.get('XBRL_UPLOAD_SPOOL_MB', '16')) * 1024 * 1024)
+
+class SpooledRequest(Request):
+    """Keep multipart uploads in memory up to UPLOAD_SPOOL_MAX_BYTES."""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES, dir=_base_temp_dir())
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
 app.secret_key = 'xbrl_to_excel_secret'
 
+def _base_temp_dir():
+    """プロジェクト内の temp_uploads ディレクトリ（権限問題を回避）"""
+    base_temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_uploads')
+    if not os.path.exists(base_temp_dir):
+        os.makedirs(base_temp_dir, exist_ok=True)
+    return base_temp_dir
+
+def _zip_uploads(files):
+    """Return the uploaded .zip files; the converter reads them as file-like objects."""
+    return [file for file in files if file and file.filename.endswith('.zip')]
+
+def _detach_uploads(uploads):
+    """Copy uploads into spooled buffers that outlive the request (for background jobs)."""
+    from werkzeug.datastructures import FileStorage
+    detached = []
+    for upload in uploads:
+        buf = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES, dir=_base_temp_dir())
+        upload.stream.seek(0)
+        shutil.copyfileobj(upload.stream, buf)
+        buf.seek(0)
+        detached.append(FileStorage(stream=buf, filename=upload.filename))
+    return detached
+
+def _conversion_options(form):
+    """Statement / period selection of the form as process_xbrl_zips keyword arguments.
+
+    Fields: statements (repeatable, e.g. bs, pl, cf), scope (consolidated / standalone), years.
+    Values are checked by process_xbrl_zips; only an invalid years raises ValueError here.
+    """
+    options = {}
+    statements = sorted(set(s for s in form.getlist('statements') if s))
+    if statements:
+        options['statements'] = statements
+    if form.get('scope'):
+        options['scope'] = form.get('scope')
+    if (form.get('years') or '').strip():
+        options['years'] = int(form.get('years'))
+    return options
+
+# 変換のプロファイル（フェーズ別の所要時間・件数・ピークメモリ）をこのディレクトリへ保存する（未設定なら無効）
+PROFILE_DIR = os.environ.get('XBRL_PROFILE_DIR')
+PROFILE_FORMAT = os.environ.get('XBRL_PROFILE_FORMAT', 'json')  # json / chrome
+
+def _conversion_profile(converter, label):
+    """Context manager profiling one conversion into PROFILE_DIR (a no-op when unset)."""
+    if not PROFILE_DIR:
+        return contextlib.nullcontext()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    suffix = '.trace.json' if PROFILE_FORMAT == 'chrome' else '.json'
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{label}{suffix}")
+    return converter.profiling(path, PROFILE_FORMAT, request=label)
+
+def _send_workbook(out_excel, etag=True):
+    """Send the generated Excel file back to the browser."""
+    filename = os.path.basename(out_excel)
+    encoded_filename = urllib.parse.quote(filename)
+    
+    response = send_file(
+        out_excel,
+        as_attachment=True,
+        download_name=filename,
+        etag=etag
+    )
+    
+    # Make sure the Japanese filename displays correctly in the browser download prompt
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{encoded_filename}"
+    return response
+
+# ========================================================================
+# RESPONSE CACHE - 同一アップロードの変換結果キャッシュ
+# ========================================================================
+# 【将来の分割先】web/cache.py
+#
+# キー: アップロードされたZIPの内容ハッシュ（ソート済み）＋変換エンジンと
+#       タクソノミ辞書のファイルハッシュ（＋絞り込み条件）。ヒット時は process_xbrl_zips を呼ばずに返す。
+# - 保存先: XBRL_CACHE_DIR（既定: response_cache/、temp_uploads とは別で /clear の対象外）
+# - 上限: XBRL_CACHE_MAX_MB（既定: 200MB）。超えたら最終利用が古いものから削除
+# - エントリ: <key>/<ワークブック名>（一時ディレクトリに書いてから rename で公開）
+# - キーをそのまま ETag として使う（If-None-Match が一致すれば 304）
+
+CACHE_DIR = os.environ.get('XBRL_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'response_cache')
+CACHE_MAX_BYTES = int(float(os.environ.get('XBRL_CACHE_MAX_MB', '200')) * 1024 * 1024)
+_CACHE_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+def _get_converter_version():
+    """Hash of the converter and taxonomy dictionary sources (changes invalidate the cache).
+
+    Imports the converter, so under CGI even a cache hit pays for that import.
+    """
+    import convert_xbrl_to_excel
+    return convert_xbrl_to_excel.converter_version()
+
+def _upload_cache_key(files, options=None):
+    """Cache key of an upload set (and selection options), or None when there is no .zip file."""
+    hashes = []
+    for file in files:
+        if file and file.filename.endswith('.zip'):
+            h = hashlib.sha256()
+            for chunk in iter(lambda: file.stream.read(1024 * 1024), b''):
+                h.update(chunk)
+            file.stream.seek(0)
+            hashes.append(h.hexdigest())
+    if not hashes:
+        return None
+    parts = [_get_converter_version()] + sorted(hashes)
+    if options:
+        parts.append(json.dumps(options, sort_keys=True))
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+def _cached_workbook(cache_key):
+    """Path of the cached workbook for cache_key, or None (a hit refreshes its LRU time)."""
+    if not cache_key or not _CACHE_KEY_RE.match(cache_key):
+        return None
+    entry_dir = os.path.join(CACHE_DIR, cache_key)
+    try:
+        names = os.listdir(entry_dir)
+    except OSError:
+        return None
+    if len(names) != 1:
+        return None
+    try:
+        os.utime(entry_dir)
+    except OSError:
+        pass
+    return os.path.join(entry_dir, names[0])
+
+def _store_in_cache(cache_key, out_excel):
+    """Publish a converted workbook under cache_key and evict old entries over the quota."""
+    if not cache_key:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        entry_dir = os.path.join(CACHE_DIR, cache_key)
+        if os.path.isdir(entry_dir):
+            return
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp_', dir=CACHE_DIR)
+        shutil.copy2(out_excel, os.path.join(tmp_dir, os.path.basename(out_excel)))
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another request published the same key first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        _evict_cache()
+    except Exception as e:
+        app.logger.error(f"Error storing conversion result in cache: {e}")
+
+def _evict_cache():
+    entries = []
+    total = 0
+    for name in os.listdir(CACHE_DIR):
+        if not _CACHE_KEY_RE.match(name):
+            continue
+        entry_dir = os.path.join(CACHE_DIR, name)
+        try:
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+            entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+        except OSError:
+            continue
+        total += size
+    entries.sort()
+    while entries and total > CACHE_MAX_BYTES:
+        _, size, entry_dir = entries.pop(0)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+
+@app.route('/cache/<cache_key>')
+def cached_download(cache_key):
+    out_excel = _cached_workbook(cache_key)
+    if not out_excel:
+        return jsonify(error='変換結果がありません。'), 404
+    return _send_workbook(out_excel, etag=cache_key)
+
 # ========================================================================
 # MAIN ROUTE - ファイルアップロードと変換処理
 # ========================================================================
@@ -62,10 +279,6 @@ app.secret_key = 'xbrl_to_excel_secret'
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
-        # Lazy imports to speed up CGI startup on GET requests
-        from werkzeug.utils import secure_filename
-        import convert_xbrl_to_excel
-        
         if 'files' not in request.files:
             flash('ファイルがアップロードされていません。')
             return redirect(request.url)
@@ -75,47 +288,38 @@ def index():
             flash('ファイルが選択されていません。')
             return redirect(request.url)
 
-        # プロジェクト内の temp_uploads ディレクトリを使用（権限問題を回避）
-        base_temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_uploads')
-        if not os.path.exists(base_temp_dir):
-            os.makedirs(base_temp_dir, exist_ok=True)
-            
-        temp_dir = tempfile.mkdtemp(dir=base_temp_dir)
+        try:
+            options = _conversion_options(request.form)
+        except ValueError:
+            flash('年数には数値を指定してください。')
+            return redirect(request.url)
+
+        # Identical upload set already converted: skip the conversion entirely
+        cache_key = _upload_cache_key(files, options)
+        cached = _cached_workbook(cache_key)
+        if cached:
+            return _send_workbook(cached, etag=cache_key)
+
+        # Lazy imports to speed up CGI startup on GET requests
+        import convert_xbrl_to_excel
+
+        uploads = _zip_uploads(files)
+        if not uploads:
+            flash('有効な .zip ファイルをアップロードしてください。')
+            return redirect(request.url)
+
+        # ZIPはメモリ上のまま渡す。ディスクに置くのは出力ブックだけ（send_file / キャッシュ用）
+        temp_dir = tempfile.mkdtemp(dir=_base_temp_dir())
+        temp_lock = _lock_job(temp_dir)  # ジャニターに削除されないよう変換中はロックしておく
         
-        saved_paths = []
         try:
-            for file in files:
-                if file and file.filename.endswith('.zip'):
-                    filename = secure_filename(file.filename)
-                    # if the user uploaded something with Japanese characters, secure_filename might empty it
-                    # fallback if empty
-                    if not filename:
-                        filename = "upload.zip"
-                    file_path = os.path.join(temp_dir, filename)
-                    file.save(file_path)
-                    saved_paths.append(file_path)
-            
-            if not saved_paths:
-                flash('有効な .zip ファイルをアップロードしてください。')
-                return redirect(request.url)
-                
             # Call the updated parsing logic
-            out_excel = convert_xbrl_to_excel.process_xbrl_zips(saved_paths, output_dir=temp_dir)
+            with _conversion_profile(convert_xbrl_to_excel, os.path.basename(temp_dir)):
+                out_excel = convert_xbrl_to_excel.process_xbrl_zips(uploads, output_dir=temp_dir, **options)
             
             if out_excel and os.path.exists(out_excel):
-                # Send the Excel file back to the browser
-                filename = os.path.basename(out_excel)
-                encoded_filename = urllib.parse.quote(filename)
-                
-                response = send_file(
-                    out_excel,
-                    as_attachment=True,
-                    download_name=filename
-                )
-                
-                # Make sure the Japanese filename displays correctly in the browser download prompt
-                response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{encoded_filename}"
-                return response
+                _store_in_cache(cache_key, out_excel)
+                return _send_workbook(out_excel, etag=cache_key or True)
             else:
                 flash("Excelファイルの生成に失敗しました。")
                 return redirect(request.url)
@@ -124,9 +328,383 @@ def index():
             app.logger.error(f"Error during conversion: {e}")
             flash(f"エラーが発生しました: {str(e)}")
             return redirect(request.url)
+        finally:
+            # send_file は既にファイルを開いているので、ディレクトリごと削除してよい（POSIX）
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            temp_lock.close()
             
     return render_template('index.html')
 
+# ========================================================================
+# JOB SUBSYSTEM - 非同期変換ジョブ
+# ========================================================================
+# 【将来の分割先】web/jobs.py, web/routes/jobs.py
+#
+# POST /jobs はアップロードを保存してジョブIDを即時に返し、変換はバックグラウンドの
+# ワーカープールで実行する。状態は temp_uploads/<job_id>/job.json に保存するため、
+# 別プロセス（CGIではリクエストごとに別プロセス）からも GET /jobs/<id> で参照できる。
+# - 同時実行数: XBRL_JOB_WORKERS（プロセス内のスレッド数 兼 プロセス間で共有する
+#   スロットロック temp_uploads/.job_slots/slot_N.lock の数）
+# - ジョブの実行中（待機中を含む）は <job_dir>/.job.lock をロックし続ける
+# - CGIでは index.cgi が応答後に標準出力を閉じ、プロセスはジョブ完了まで残る
+
+JOB_WORKERS = max(1, int(os.environ.get('XBRL_JOB_WORKERS', '2')))
+JOB_STATE_FILE = 'job.json'
+JOB_LOCK_FILE = '.job.lock'
+_JOB_ID_RE = re.compile(r'^job_[A-Za-z0-9_]+$')
+
+_job_executor = None
+_job_executor_lock = threading.Lock()
+_job_state_lock = threading.Lock()
+
+def _job_dir(job_id):
+    """Directory of an existing job, or None (also rejects malformed ids)."""
+    if not _JOB_ID_RE.match(job_id or ''):
+        return None
+    job_dir = os.path.join(_base_temp_dir(), job_id)
+    return job_dir if os.path.isdir(job_dir) else None
+
+def _read_job(job_dir):
+    try:
+        with open(os.path.join(job_dir, JOB_STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _update_job(job_dir, **fields):
+    """Merge fields into job.json (atomic replace, so readers never see a partial file)."""
+    with _job_state_lock:
+        state = _read_job(job_dir) or {}
+        state.update(fields)
+        state['updated'] = time.time()
+        tmp_path = os.path.join(job_dir, JOB_STATE_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(job_dir, JOB_STATE_FILE))
+    return state
+
+def _lock_job(job_dir):
+    """Lock the job directory for the lifetime of the job (released when the file is closed).
+
+    The temp janitor never removes a directory whose lock is held."""
+    lock_file = open(os.path.join(job_dir, JOB_LOCK_FILE), 'w')
+    if HAS_FCNTL:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    return lock_file
+
+def _acquire_job_slot():
+    """Block until one of the JOB_WORKERS slots shared by all processes is free."""
+    if not HAS_FCNTL:
+        return None
+    slot_dir = os.path.join(_base_temp_dir(), '.job_slots')
+    os.makedirs(slot_dir, exist_ok=True)
+    while True:
+        for i in range(JOB_WORKERS):
+            slot_file = open(os.path.join(slot_dir, f'slot_{i}.lock'), 'w')
+            try:
+                fcntl.flock(slot_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot_file
+            except (IOError, OSError):
+                slot_file.close()
+        time.sleep(1)
+
+def _run_job(job_dir, uploads, job_lock, options=None):
+    import convert_xbrl_to_excel
+    slot = None
+    try:
+        slot = _acquire_job_slot()
+        _update_job(job_dir, status='running', phase='parse', started=time.time())
+
+        def on_progress(phase, done, total):
+            fields = {'phase': phase}
+            if done is not None:
+                fields.update(done=done, total=total)
+            _update_job(job_dir, **fields)
+
+        with _conversion_profile(convert_xbrl_to_excel, os.path.basename(job_dir)):
+            out_excel = convert_xbrl_to_excel.process_xbrl_zips(
+                uploads, output_dir=job_dir, progress_callback=on_progress, **(options or {}))
+        if out_excel and os.path.exists(out_excel):
+            _store_in_cache(_read_job(job_dir).get('cache_key'), out_excel)
+            _update_job(job_dir, status='done', phase='done', result=os.path.basename(out_excel),
+                        finished=time.time())
+        else:
+            _update_job(job_dir, status='error', error='Excelファイルの生成に失敗しました。', finished=time.time())
+    except Exception as e:
+        app.logger.error(f"Error during conversion job {os.path.basename(job_dir)}: {e}")
+        _update_job(job_dir, status='error', error=f'エラーが発生しました: {str(e)}', finished=time.time())
+    finally:
+        for upload in uploads:
+            upload.close()
+        if slot:
+            slot.close()
+        job_lock.close()
+
+def _submit_job(job_dir, uploads, cache_key=None, options=None):
+    global _job_executor
+    with _job_executor_lock:
+        if _job_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS)
+    job_lock = _lock_job(job_dir)
+    _update_job(job_dir, id=os.path.basename(job_dir), status='queued', phase='queued',
+                files=[u.filename for u in uploads], cache_key=cache_key, options=options or {},
+                created=time.time())
+    _job_executor.submit(_run_job, job_dir, uploads, job_lock, options)
+
+def _fail_abandoned_job(job_dir, state):
+    """Mark a queued/running job as failed when no process holds its lock any more.
+
+    The running process keeps .job.lock locked until job.json says done or error, so a
+    free lock means the process died (killed CGI process, OOM, daemon worker crash).
+    """
+    lock_file = _try_lock_idle_dir(job_dir)
+    if lock_file is None:
+        return state
+    try:
+        # Re-read under the lock: the job may have finished just before it was released
+        state = _read_job(job_dir) or state
+        if state.get('status') in ('queued', 'running'):
+            state = _update_job(job_dir, status='error', error='変換プロセスが終了しました。',
+                                finished=time.time())
+    finally:
+        if lock_file:
+            lock_file.close()
+    return state
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    files = request.files.getlist('files')
+    if not files or files[0].filename == '':
+        return jsonify(error='ファイルが選択されていません。'), 400
+
+    try:
+        options = _conversion_options(request.form)
+    except ValueError:
+        return jsonify(error='年数には数値を指定してください。'), 400
+
+    # Cache hit: no job needed, the result can be downloaded right away
+    cache_key = _upload_cache_key(files, options)
+    if _cached_workbook(cache_key):
+        return jsonify(status='done', phase='done', cached=True,
+                       download_url=url_for('cached_download', cache_key=cache_key))
+
+    uploads = _zip_uploads(files)
+    if not uploads:
+        return jsonify(error='有効な .zip ファイルをアップロードしてください。'), 400
+
+    # Reject uploads that cannot be converted before queuing (central directory + cover only)
+    rejected = _rejected_uploads_message(_inspect_uploads(uploads))
+    if rejected:
+        return jsonify(error=rejected), 400
+
+    # The request's file streams are closed at teardown; the job keeps its own spooled copies.
+    # job_dir only holds job.json, the lock file and the generated workbook.
+    job_dir = tempfile.mkdtemp(prefix='job_', dir=_base_temp_dir())
+    job_id = os.path.basename(job_dir)
+    _submit_job(job_dir, _detach_uploads(uploads), cache_key, options)
+    return jsonify(job_id=job_id, status='queued', status_url=url_for('job_status', job_id=job_id)), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job_dir = _job_dir(job_id)
+    state = _read_job(job_dir) if job_dir else None
+    if state is None:
+        return jsonify(error='ジョブが見つかりません。'), 404
+    if state.get('status') in ('queued', 'running'):
+        state = _fail_abandoned_job(job_dir, state)
+    if state.get('status') == 'done':
+        state['download_url'] = url_for('job_download', job_id=job_id)
+    return jsonify(state)
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    job_dir = _job_dir(job_id)
+    state = _read_job(job_dir) if job_dir else None
+    if not state or state.get('status') != 'done':
+        return jsonify(error='変換結果がありません。'), 404
+    out_excel = os.path.join(job_dir, os.path.basename(state['result']))
+    if not os.path.exists(out_excel):
+        return jsonify(error='変換結果がありません。'), 404
+    return _send_workbook(out_excel, etag=state.get('cache_key') or True)
+
+# ========================================================================
+# TEMP JANITOR - temp_uploads の自動掃除
+# ========================================================================
+# 【将来の分割先】web/janitor.py
+#
+# - TTL: XBRL_TEMP_TTL_HOURS（既定: 24時間）より古いディレクトリを削除
+# - 容量: XBRL_TEMP_MAX_MB（既定: 500MB）を超えたら、古いものから上限以下になるまで削除
+# - 実行: リクエストごとに stamp ファイルの更新時刻だけを見て、XBRL_JANITOR_INTERVAL 秒
+#   （既定: 600）ごとにバックグラウンドスレッドで掃除する（リクエスト処理は待たない）
+# - .job.lock がロックされているディレクトリ（実行中・待機中のジョブ、変換中の同期リクエスト）は
+#   削除しない。ドットで始まるエントリ（.job_slots 等）も対象外
+
+TEMP_TTL_SECONDS = float(os.environ.get('XBRL_TEMP_TTL_HOURS', '24')) * 3600
+TEMP_MAX_BYTES = int(float(os.environ.get('XBRL_TEMP_MAX_MB', '500')) * 1024 * 1024)
+JANITOR_INTERVAL_SECONDS = float(os.environ.get('XBRL_JANITOR_INTERVAL', '600'))
+JANITOR_STAMP_FILE = '.janitor_stamp'
+# ロックファイルがまだ作られていない直後のディレクトリ（mkdtemp → ロック取得の間）を守る猶予
+JANITOR_GRACE_SECONDS = 60
+
+_janitor_thread = None
+_janitor_pending_ttl = None
+_janitor_thread_lock = threading.Lock()
+
+def _entry_size_and_mtime(path):
+    """Total size and newest mtime of a file or directory tree."""
+    if not os.path.isdir(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+    size = 0
+    mtime = os.stat(path).st_mtime
+    for root, _dirs, names in os.walk(path):
+        for name in names:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            size += st.st_size
+            mtime = max(mtime, st.st_mtime)
+    return size, mtime
+
+def _try_lock_idle_dir(path):
+    """Lock a temp dir that nobody is using; returns the held lock file, or None if it is active."""
+    lock_path = os.path.join(path, JOB_LOCK_FILE)
+    if not HAS_FCNTL:
+        # Without flock, fall back to the job state: queued/running jobs are treated as active
+        state = _read_job(path)
+        return None if state and state.get('status') in ('queued', 'running') else False
+    if not os.path.exists(lock_path):
+        return False
+    try:
+        lock_file = open(lock_path, 'a')
+    except OSError:
+        return None
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return lock_file
+    except (IOError, OSError):
+        lock_file.close()
+        return None
+
+def _sweep_temp_dirs(ttl=None, max_bytes=None):
+    """Remove expired temp entries, then the oldest ones while over the quota. Active dirs are kept."""
+    ttl = TEMP_TTL_SECONDS if ttl is None else ttl
+    max_bytes = TEMP_MAX_BYTES if max_bytes is None else max_bytes
+    base_temp_dir = _base_temp_dir()
+    now = time.time()
+
+    entries = []
+    for name in os.listdir(base_temp_dir):
+        if name.startswith('.'):
+            continue
+        path = os.path.join(base_temp_dir, name)
+        try:
+            size, mtime = _entry_size_and_mtime(path)
+        except OSError:
+            continue
+        entries.append((mtime, size, path))
+    entries.sort()
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        if now - mtime < ttl and total <= max_bytes:
+            break
+        held = _try_lock_idle_dir(path) if os.path.isdir(path) else False
+        if held is None or (held is False and now - mtime < JANITOR_GRACE_SECONDS):
+            continue
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+            total -= size
+            removed += 1
+        except OSError as e:
+            app.logger.warning(f"Temp janitor could not remove {path}: {e}")
+        finally:
+            if held:
+                held.close()
+    if removed:
+        app.logger.info(f"Temp janitor removed {removed} entries ({total / 1024 / 1024:.1f} MB left)")
+    return removed
+
+def _run_janitor(ttl=None):
+    global _janitor_thread, _janitor_pending_ttl
+    while True:
+        try:
+            _sweep_temp_dirs(ttl=ttl)
+        except Exception as e:
+            app.logger.error(f"Temp janitor failed: {e}")
+        with _janitor_thread_lock:
+            # A forced sweep (/clear) requested while this one was running
+            if _janitor_pending_ttl is not None:
+                ttl, _janitor_pending_ttl = _janitor_pending_ttl, None
+                continue
+            _janitor_thread = None
+            return
+
+def _schedule_janitor(force=False, ttl=None):
+    """Start a sweep in the background if the last one (in any process) is older than the interval."""
+    global _janitor_thread, _janitor_pending_ttl
+    stamp_path = os.path.join(_base_temp_dir(), JANITOR_STAMP_FILE)
+    if not force:
+        try:
+            if time.time() - os.path.getmtime(stamp_path) < JANITOR_INTERVAL_SECONDS:
+                return False
+        except OSError:
+            pass
+    with _janitor_thread_lock:
+        if _janitor_thread is not None:
+            if force:
+                _janitor_pending_ttl = TEMP_TTL_SECONDS if ttl is None else ttl
+            return force
+        # Touch the stamp first so that concurrent requests/processes do not start another sweep
+        with open(stamp_path, 'a'):
+            os.utime(stamp_path, None)
+        # Not a daemon thread: under CGI the process finishes the sweep after the response is sent
+        _janitor_thread = threading.Thread(target=_run_janitor, args=(ttl,), name='temp-janitor')
+        _janitor_thread.start()
+    return True
+
+@app.before_request
+def _janitor_before_request():
+    try:
+        _schedule_janitor()
+    except OSError as e:
+        app.logger.warning(f"Temp janitor could not be scheduled: {e}")
+
+# ========================================================================
+# INSPECT ROUTE - 変換前のZIP確認
+# ========================================================================
+# 【将来の分割先】web/routes/inspect.py
+#
+# POST /inspect はアップロードされたZIPの企業・期間・会計基準・財務諸表の種類をJSONで返す。
+# 変換エンジンの inspect_filing を使い、中央ディレクトリ、manifest、表紙のDEI、
+# ロールURIだけを読む（ラベル辞書の構築やファクト抽出はしない）。POST /jobs も同じ確認で
+# 変換できないZIPをキュー投入前に拒否する。
+
+def _inspect_uploads(uploads):
+    import convert_xbrl_to_excel
+    filings = [convert_xbrl_to_excel.inspect_filing(upload) for upload in uploads]
+    for upload in uploads:
+        upload.stream.seek(0)
+    return filings
+
+def _rejected_uploads_message(filings):
+    """Error message listing uploads that cannot be converted, or None."""
+    rejected = [f"{f['file']}（{f['error']}）" for f in filings if f.get('error')]
+    return ('変換できないZIPファイルがあります: ' + '、'.join(rejected)) if rejected else None
+
+@app.route('/inspect', methods=['POST'])
+def inspect_uploads():
+    uploads = _zip_uploads(request.files.getlist('files'))
+    if not uploads:
+        return jsonify(error='有効な .zip ファイルをアップロードしてください。'), 400
+    return jsonify(filings=_inspect_uploads(uploads))
+
 # ========================================================================
 # BOOKMARKLET ROUTES - ブックマークレット用ページ
 # ========================================================================
@@ -147,12 +725,10 @@ def csv_bookmarklets():
 
 @app.route('/clear', methods=['POST'])
 def clear_temp():
+    # 実行中のジョブを壊さないよう、削除はジャニターに任せる（TTLを0にして即時に掃除）
     try:
-        base_temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_uploads')
-        if os.path.exists(base_temp_dir):
-            shutil.rmtree(base_temp_dir)
-            os.makedirs(base_temp_dir, exist_ok=True)
-        flash('サーバー上の一次ファイルをクリアしました。')
+        _schedule_janitor(force=True, ttl=0)
+        flash('サーバー上の一時ファイルのクリアを開始しました（実行中の変換は除きます）。')
     except Exception as e:
         flash(f'クリア中にエラーが発生しました: {str(e)}')
     return redirect(url_for('index'))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Logging Overhead Benchmark
+
+変換の merge / hierarchy / シート生成のループでは、要素ごとに [Type-Filter] や [Mapping] などの
+ログが出る。このスクリプトは、要素ごとのログ処理のコストを従来方式と現在方式で比較する。
+
+【計測項目】
+1. 要素ごとのログ（合成）: 従来方式（f文字列で整形し、FileHandler へ同期書き込み）と
+   現在方式（log_count でカテゴリ別件数に集約。詳細行は DEBUG のときだけ遅延整形）
+2. 実ファイルの変換（ZIPを指定した場合）: XBRL_LOG_LEVEL=INFO（既定）と DEBUG（要素ごとの
+   詳細行をすべて書き出す。従来の既定に相当）で新規プロセスの変換時間とログ増加量を比較
+
+Usage:
+    python bench_logging.py                         # 合成ベンチマーク（200,000 件）
+    python bench_logging.py --events 1000000
+    python bench_logging.py S100XXXX.zip -n 3       # 大きな提出書類での変換時間
+    python bench_logging.py --json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Mix of the per-element categories of a large filing's merge / hierarchy / sheet phases
+CATEGORIES = [
+    ('Type-Filter-Skip', "P/L element '%s' type mismatch ignored (expected: %s, mapped: %s)", 3),
+    ('Skip-Judgment', "Element '%s' not in mapping (shared) - skipping judgment, continuing output", 1),
+    ('CF-Fallback-Filter', "Skipped non-CF element: %s", 1),
+    ('Mapping', "Element '%s' appears in multiple statement types (%s, %s) - marked as shared", 3),
+]
+
+
+def bench_before(events, log_path):
+    """Former debug_log: f-string per element, synchronous FileHandler at INFO."""
+    logger = logging.getLogger('bench_logging_before')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = logging.FileHandler(log_path, mode='a', encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    logger.addHandler(handler)
+    t = time.perf_counter()
+    for i in range(events):
+        category, _, _ = CATEGORIES[i % len(CATEGORIES)]
+        el = f'jppfs_cor_Element{i}'
+        logger.info(f"  [{category}] Element '{el}' in role 'rol_BalanceSheet' (expected: BalanceSheet, mapped: StatementOfIncome)")
+    elapsed = time.perf_counter() - t
+    logger.removeHandler(handler)
+    handler.close()
+    return elapsed
+
+
+def bench_after(events):
+    """log_count: per-category counter; the detail line is formatted only when DEBUG is enabled."""
+    sys.path.insert(0, SCRIPT_DIR)
+    import convert_xbrl_to_excel as c
+    c.reset_log_counts()
+    t = time.perf_counter()
+    for i in range(events):
+        category, message, nargs = CATEGORIES[i % len(CATEGORIES)]
+        el = f'jppfs_cor_Element{i}'
+        c.log_count(category, message, el, *(['BalanceSheet', 'StatementOfIncome'][:nargs - 1]))
+    elapsed = time.perf_counter() - t
+    c.reset_log_counts()
+    return elapsed
+
+
+def convert_in_fresh_process(zip_paths, level):
+    """Convert zip_paths in a new interpreter at the given log level; returns (seconds, log bytes)."""
+    log_file = os.path.join(SCRIPT_DIR, 'convert_xbrl_debug.log')
+    size_before = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    with tempfile.TemporaryDirectory() as out_dir:
+        script = (
+            "import sys, time\n"
+            "import convert_xbrl_to_excel as c\n"
+            "_t = time.perf_counter()\n"
+            f"c.process_xbrl_zips({zip_paths!r}, output_dir={out_dir!r})\n"
+            "sys.stdout.write('%.3f' % (time.perf_counter() - _t))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script],
+            cwd=SCRIPT_DIR,
+            capture_output=True,
+            text=True,
+            env=dict(os.environ, XBRL_LOG_LEVEL=level, XBRL_VERBOSE='0'),
+        )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'benchmark failed')
+    size_after = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    return float(result.stdout.strip().splitlines()[-1]), size_after - size_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-element logging overhead.')
+    parser.add_argument('zips', nargs='*', help='EDINET ZIP files to convert (optional)')
+    parser.add_argument('--events', type=int, default=200000, help='synthetic per-element log events (default: 200000)')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='runs per case (default: 3)')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, 'before.log')
+        samples = [bench_before(args.events, log_path) for _ in range(args.repeat)]
+        results['per-element logging, before (f-string + file I/O)'] = {
+            'median_ms': round(statistics.median(samples) * 1000, 1),
+            'log_bytes': os.path.getsize(log_path) // args.repeat,
+        }
+    samples = [bench_after(args.events) for _ in range(args.repeat)]
+    results['per-element logging, after (log_count, INFO)'] = {
+        'median_ms': round(statistics.median(samples) * 1000, 1),
+        'log_bytes': 0,
+    }
+
+    if args.zips:
+        zip_paths = [os.path.abspath(p) for p in args.zips]
+        convert_in_fresh_process(zip_paths, 'INFO')  # warm-up: taxonomy caches, .pyc
+        for level in ('DEBUG', 'INFO'):
+            runs = [convert_in_fresh_process(zip_paths, level) for _ in range(args.repeat)]
+            results[f'conversion, XBRL_LOG_LEVEL={level}'] = {
+                'median_ms': round(statistics.median(r[0] for r in runs) * 1000, 1),
+                'log_bytes': int(statistics.median(r[1] for r in runs)),
+            }
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"Python {sys.version.split()[0]}, {args.events} synthetic events, {args.repeat} runs per case")
+        for name, r in results.items():
+            print(f"  {name:<52} median {r['median_ms']:>9.1f} ms  log {r['log_bytes']:>11,} bytes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
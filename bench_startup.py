@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CGI Cold Start Benchmark
+
+CGIではリクエストごとに新しいPythonプロセスが起動するため、import時間がそのまま応答遅延になる。
+このスクリプトは、新規プロセスでの import 時間と共通辞書の初回ロード時間を計測して表示する。
+
+【計測項目】
+1. import app                       : GET / や キャッシュヒット時のCGI起動コスト
+2. import convert_xbrl_to_excel     : 変換を行うリクエストの追加コスト
+3. get_edinet_common_dict()（初回）  : marshal キャッシュからの共通辞書ロード
+4. edinet_taxonomy_dict.py のコンパイル : .pyc が使えない場合（キャッシュ無効時）の参考値
+
+Usage:
+    python bench_startup.py            # 各項目 7 回計測し中央値を表示
+    python bench_startup.py -n 15
+    python bench_startup.py --json     # 結果をJSONで出力
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CASES = [
+    ('import app', "import app"),
+    ('import convert_xbrl_to_excel', "import convert_xbrl_to_excel"),
+    ('get_edinet_common_dict() (first use)',
+     "import convert_xbrl_to_excel as c\n"
+     "_t = time.perf_counter()\n"
+     "c.get_edinet_common_dict()"),
+    ('compile edinet_taxonomy_dict.py (no .pyc)',
+     "_src = open('edinet_taxonomy_dict.py', encoding='utf-8').read()\n"
+     "_t = time.perf_counter()\n"
+     "exec(compile(_src, 'edinet_taxonomy_dict.py', 'exec'), {})"),
+]
+
+
+def time_in_fresh_process(code):
+    """Run code in a new interpreter and return the elapsed milliseconds it reports."""
+    script = (
+        "import time, sys\n"
+        "_t = time.perf_counter()\n"
+        + code + "\n"
+        "sys.stdout.write('%.3f' % ((time.perf_counter() - _t) * 1000))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, XBRL_VERBOSE='0'),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'benchmark failed')
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure CGI cold start (import) time.')
+    parser.add_argument('-n', '--repeat', type=int, default=7, help='runs per case (default: 7)')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    # Warm-up run: writes .pyc files and the common dict artifact like the first real request would
+    time_in_fresh_process("import app, convert_xbrl_to_excel\nconvert_xbrl_to_excel.get_edinet_common_dict()")
+
+    results = {}
+    for name, code in CASES:
+        samples = [time_in_fresh_process(code) for _ in range(args.repeat)]
+        results[name] = {
+            'median_ms': round(statistics.median(samples), 1),
+            'min_ms': round(min(samples), 1),
+            'max_ms': round(max(samples), 1),
+        }
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"Python {sys.version.split()[0]}, {args.repeat} runs per case")
+        for name, r in results.items():
+            print(f"  {name:<45} median {r['median_ms']:>7.1f} ms  (min {r['min_ms']:.1f}, max {r['max_ms']:.1f})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
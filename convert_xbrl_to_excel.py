@@ -11,7 +11,7 @@ XBRL to Excel Converter
 - 分割: 不要（将来必要になった時のみ実施）
 
 【プログラム構成】
-このファイルは以下の5つの層で構成されています：
+このファイルは以下の8つの層で構成されています：
 
 1. INFRASTRUCTURE LAYER (61-380行)
    - ログ管理、ファイル操作、セキュリティチェック
@@ -29,7 +29,19 @@ XBRL to Excel Converter
    - メイン処理パイプライン（process_xbrl_zips）
    - 将来の分割先: core/processor.py, pipeline.py, model/xbrl_data.py
 
-5. CLI LAYER (3652-3680行)
+5. WAREHOUSE LAYER
+   - SQLiteファクトウェアハウス（ZIP単位の差分取り込み・DBからの再出力）
+   - 将来の分割先: storage/warehouse.py
+
+6. OUTPUT LAYER
+   - 出力バックエンド（Excel横展開 / CSV・Parquetの縦持ちファクト表）
+   - 将来の分割先: output/excel/writer.py, output/table.py
+
+7. BATCH LAYER
+   - 企業（EDINETコード）単位の一括変換（プロセスプール、未変更企業のスキップ、再開可能なマニフェスト）
+   - 将来の分割先: batch.py
+
+8. CLI LAYER
    - コマンドライン引数処理
    - 将来の分割先: cli.py
 
@@ -43,6 +55,7 @@ XBRL to Excel Converter
 詳細は「将来の分割案.md」を参照してください。
 """
 
+import io
 import os
 import sys
 import zipfile
@@ -51,12 +64,13 @@ import shutil
 import glob
 import time
 import json
-import urllib.request
 import re
 import gzip
 import logging
+import marshal
 import subprocess
-from threading import Lock
+from threading import Lock, Condition, current_thread as _current_thread, local as _thread_local
+from collections import ChainMap
 from contextlib import contextmanager
 
 try:
@@ -65,6 +79,11 @@ try:
 except ImportError:
     HAS_FCNTL = False
 
+try:
+    import resource  # peak memory of profile spans (Unix only)
+except ImportError:
+    resource = None
+
 try:
     from lxml import etree
     HAS_LXML = True
@@ -72,8 +91,8 @@ except ImportError:
     import xml.etree.ElementTree as etree
     HAS_LXML = False
 
-# Import EDINET Taxonomy Dictionary
-from edinet_taxonomy_dict import common_dict as EDINET_COMMON_DICT
+# EDINET Taxonomy Dictionary (edinet_taxonomy_dict.py) is loaded lazily on first use
+# via get_edinet_common_dict() - see TAXONOMY LAYER
 
 # Base directory for the script and caching
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -82,8 +101,11 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 HAS_PANDAS = False
 HAS_OPENPYXL = False
 
-# Control verbose logging via environment variable (default: enabled for debugging)
-VERBOSE_LOGGING = os.environ.get('XBRL_VERBOSE', '1') == '1'
+# Log level via environment variable: XBRL_LOG_LEVEL (DEBUG / INFO / WARNING, default: INFO).
+# XBRL_VERBOSE=1 is the older switch for DEBUG (per-element detail lines and vprint output)
+VERBOSE_LOGGING = os.environ.get('XBRL_VERBOSE', '0') == '1'
+LOG_LEVEL = getattr(logging, os.environ.get('XBRL_LOG_LEVEL', 'DEBUG' if VERBOSE_LOGGING else 'INFO').upper(),
+                    logging.INFO)
 
 # Thread lock for taxonomy cache operations to prevent race conditions
 # when multiple workers try to download/extract/write taxonomy cache simultaneously
@@ -110,11 +132,15 @@ _LOG_FILE = os.path.join(SCRIPT_DIR, 'convert_xbrl_debug.log')
 # このセクションには以下が含まれます:
 # - TimestampFormatter (61-87行): ログフォーマッタ
 # - rotate_logs_manually (184-222行): ログローテーション
-# - debug_log (224-238行): デバッグログ出力
+# - debug_log (224-238行): デバッグログ出力（レベル判定後に%形式で遅延整形、QueueHandler経由で非同期書き込み）
+# - log_count / flush_log_counts: 要素ごとのログをカテゴリ別件数に集約（詳細行はDEBUG時のみ）
+# - profiling / profile_span / profile_begin・profile_end: フェーズ別プロファイル（JSON / Chromeトレース）
 # - vprint (342-347行): 詳細ログ出力
-# - validate_zip_path (240-248行): ZIPパス検証
 # - check_zip_bomb (249-264行): ZIP爆弾チェック
+# - read_zip_members / wait_member: ZIPメンバーの並行展開（スレッドごとのZipFileハンドル、展開中バイト数の上限）
 # - file_lock (266-316行): ファイルロック
+# - publish_cache_file / read_cache_file: キャッシュファイルの原子的な公開と検証付き読み込み（ロック不要）
+# - download_file: 再開・条件付きGET・チェックサム検証付きダウンロード（共有キャッシュ、update_edinet_taxonomy.py からも使用）
 # ============================================================================
 
 # Custom formatter that includes timestamp
@@ -122,29 +148,88 @@ class TimestampFormatter(logging.Formatter):
     def formatTime(self, record, datefmt=None):
         return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))
 
+class RotateOnOpenFileHandler(logging.FileHandler):
+    """FileHandler that runs rotate_logs_manually right before it opens the log file.
+
+    Created with delay=True behind the queue listener, so the rotation (and the gzip of the
+    previous log) happens in the listener thread on the first record, not on the request path.
+    """
+    def _open(self):
+        rotate_logs_manually(self.baseFilename)
+        return super()._open()
+
 # Set up the logger
+# ハンドラー（ログファイルのオープン、ローテーション確認）は最初のログ出力時に設定する。
+# CGIでは毎リクエストが新規プロセスのため、importだけで済む経路（キャッシュヒット等）の負担を減らす
+# 呼び出し側は QueueHandler でキューに積むだけで、ファイル/標準エラーへの書き込みとローテーションは
+# QueueListener のスレッドで行う（終了時に atexit で書き残しを吐き出す）
 _logger = logging.getLogger('xbrl_converter')
-_logger.setLevel(logging.DEBUG if VERBOSE_LOGGING else logging.INFO)
-
-# File handler with buffering
-_file_handler = logging.FileHandler(_LOG_FILE, mode='a', encoding='utf-8')
-_file_handler.setLevel(logging.DEBUG)
-_file_formatter = TimestampFormatter('%(asctime)s %(message)s')
-_file_handler.setFormatter(_file_formatter)
-_logger.addHandler(_file_handler)
-
-# Console handler (stderr) for server log visibility
-_console_handler = logging.StreamHandler(sys.stderr)
-_console_handler.setLevel(logging.INFO)
-_console_formatter = logging.Formatter('%(message)s')
-_console_handler.setFormatter(_console_formatter)
-_logger.addHandler(_console_handler)
+_logger.setLevel(LOG_LEVEL)
 
 # Prevent propagation to root logger
 _logger.propagate = False
 
-# Flag to ensure log rotation is only checked once per session
-_log_rotation_checked = False
+_log_setup_lock = Lock()
+
+def _ensure_log_handlers():
+    """Attach the queue handler and start its listener on first use in this process."""
+    global _log_handlers_pid, _log_listener
+    if _log_handlers_pid == os.getpid():
+        return
+    with _log_setup_lock:
+        if _log_handlers_pid == os.getpid():
+            return
+        import atexit
+        import queue
+        from logging.handlers import QueueHandler, QueueListener
+
+        # A forked child (batch worker) inherits the handlers but not the listener thread
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+        _log_listener = None
+
+        # File handler: opened (and the log rotated) by the listener thread on the first record
+        file_handler = RotateOnOpenFileHandler(_LOG_FILE, mode='a', encoding='utf-8', delay=True)
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(TimestampFormatter('%(asctime)s %(message)s'))
+
+        # Console handler (stderr) for server log visibility
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(logging.Formatter('%(message)s'))
+
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        listener.start()
+        if _log_handlers_pid is None:
+            atexit.register(shutdown_logging)
+        _log_listener = listener
+        _logger.addHandler(QueueHandler(log_queue))
+
+        _log_handlers_pid = os.getpid()
+
+def shutdown_logging():
+    """Write out the queued log records, stop the listener and close the log file.
+
+    Runs at exit; call it explicitly before os._exit (daemon workers, process pool workers),
+    which skips atexit. Logging afterwards sets the handlers up again.
+    """
+    global _log_handlers_pid, _log_listener
+    with _log_setup_lock:
+        if _log_handlers_pid != os.getpid() or _log_listener is None:
+            return
+        listener, _log_listener = _log_listener, None
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        _log_handlers_pid = 0
+
+# Process that attached the log handlers (handlers are attached once per process;
+# 0 once shutdown_logging has run, None before the first setup)
+_log_handlers_pid = None
+_log_listener = None
 
 # Flag to ensure EDINET taxonomy dict update is checked at most once per session
 # (keyed by the highest taxonomy_year seen so far)
@@ -157,11 +242,14 @@ _taxonomy_dict_last_checked_year = None
 #
 # このセクションには以下が含まれます:
 # - get_edinet_taxonomy_dict_year (93-116行): タクソノミ年度取得
+# - get_edinet_common_dict: 共通辞書の遅延ロード（marshal 形式のプリコンパイル済みキャッシュ）
+# - write_edinet_dict_artifact: 共通辞書の marshal 形式ファイル出力（update_edinet_taxonomy.py からも使用）
 # - check_and_update_edinet_taxonomy (118-182行): タクソノミ更新チェック
 # - fetch_taxonomy_url (479-534行): タクソノミURL取得
 # - get_standard_labels (536-730行): タクソノミラベル取得（メイン）
 # - parse_labels_file (732-850行): ラベルファイル解析
-# - build_suffix_index (318-340行): サフィックスインデックス構築
+# - taxonomy_label_members: タクソノミZIPから _lab.xml を名前だけで選別（展開しない）
+# - build_suffix_index (318-340行): サフィックスインデックス構築（標準ラベル分は standard_labels.json に保存）
 #
 # 分割時の注意:
 # - repository.py: I/O処理のみ（キャッシュ・取得）
@@ -194,13 +282,142 @@ def get_edinet_taxonomy_dict_year():
     return None
 
 
+# Lazily loaded EDINET common dictionary (element name -> Japanese label)
+_EDINET_COMMON_DICT = None
+_EDINET_DICT_LOCK = Lock()
+# Compact binary copy of the dict, written alongside the .py (also by update_edinet_taxonomy.py)
+_EDINET_DICT_ARTIFACT = os.path.join(SCRIPT_DIR, 'edinet_taxonomy_dict.marshal')
+_EDINET_DICT_MAGIC = b'XBRLDICT1'
+_EDINET_DICT_STAMP = None
+_EDINET_DICT_CHECKED_AT = 0.0
+# How often a long-running process (xbrl_daemon.py worker) re-checks edinet_taxonomy_dict.py
+_EDINET_DICT_RECHECK_SECONDS = 30
+# Minimum interval between background refreshes started by check_and_update_edinet_taxonomy
+_EDINET_DICT_REFRESH_INTERVAL = 3600
+
+
+def _edinet_dict_stamp(dict_path):
+    """Identify the source dict file plus the interpreter's marshal format."""
+    st = os.stat(dict_path)
+    return '%d:%d:%d:%d.%d' % (st.st_mtime_ns, st.st_size, marshal.version,
+                               sys.version_info[0], sys.version_info[1])
+
+
+def _load_edinet_dict(dict_path, stamp):
+    """Load the dict from the marshal artifact, or from the .py (rewriting the artifact)."""
+    if stamp:
+        try:
+            # Read in one go: marshal.loads on a buffer is much faster than marshal.load(file)
+            with open(_EDINET_DICT_ARTIFACT, 'rb') as f:
+                data = f.read()
+            header_end = data.index(b'\n')
+            if data[:header_end] == _EDINET_DICT_MAGIC + b' ' + stamp:
+                return marshal.loads(memoryview(data)[header_end + 1:])
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+    if 'edinet_taxonomy_dict' not in sys.modules:
+        import edinet_taxonomy_dict
+        common_dict = edinet_taxonomy_dict.common_dict
+    else:
+        # Refreshed file: execute it into a fresh namespace instead of importlib.reload,
+        # which would rebind the module other threads may be reading
+        with open(dict_path, 'r', encoding='utf-8') as f:
+            namespace = {}
+            exec(compile(f.read(), dict_path, 'exec'), namespace)
+        common_dict = namespace['common_dict']
+
+    if stamp:
+        try:
+            write_edinet_dict_artifact(common_dict, dict_path)
+        except OSError as e:
+            debug_log(f"[TaxonomyDict] WARNING: Could not write {_EDINET_DICT_ARTIFACT}: {e}")
+    return common_dict
+
+
+def write_edinet_dict_artifact(common_dict, dict_path=None):
+    """Write the marshal artifact for common_dict, stamped with dict_path's current mtime/size.
+
+    The header line identifies the source .py, so a stale artifact is never used.
+    Written to a temp file and os.replace()d, so readers see the old or the new file only.
+    """
+    if dict_path is None:
+        dict_path = os.path.join(SCRIPT_DIR, 'edinet_taxonomy_dict.py')
+    stamp = _edinet_dict_stamp(dict_path).encode('ascii')
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(_EDINET_DICT_ARTIFACT), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_EDINET_DICT_MAGIC + b' ' + stamp + b'\n')
+            marshal.dump(common_dict, f)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, _EDINET_DICT_ARTIFACT)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def get_edinet_common_dict():
+    """Return the EDINET common dictionary, loading it on first use.
+
+    Compiling the 4,000-entry dict literal in edinet_taxonomy_dict.py costs tens of
+    milliseconds whenever its .pyc is missing or stale (CGI: every process start), so
+    the dict is kept in a marshal artifact (edinet_taxonomy_dict.marshal) and only
+    rebuilt from the .py when its mtime/size change.
+
+    Long-running processes re-check the .py at most every _EDINET_DICT_RECHECK_SECONDS.
+    After a background refresh (check_and_update_edinet_taxonomy) the new dict replaces
+    the old one with a single reference swap; callers that already hold the old dict
+    keep using it until they ask again.
+
+    Returns:
+        dict: Element name -> Japanese label.
+    """
+    global _EDINET_COMMON_DICT, _EDINET_DICT_STAMP, _EDINET_DICT_CHECKED_AT
+    now = time.time()
+    if _EDINET_COMMON_DICT is not None and now - _EDINET_DICT_CHECKED_AT < _EDINET_DICT_RECHECK_SECONDS:
+        return _EDINET_COMMON_DICT
+    with _EDINET_DICT_LOCK:
+        if _EDINET_COMMON_DICT is not None and now - _EDINET_DICT_CHECKED_AT < _EDINET_DICT_RECHECK_SECONDS:
+            return _EDINET_COMMON_DICT
+
+        dict_path = os.path.join(SCRIPT_DIR, 'edinet_taxonomy_dict.py')
+        try:
+            stamp = _edinet_dict_stamp(dict_path).encode('ascii')
+        except OSError:
+            stamp = None
+        _EDINET_DICT_CHECKED_AT = now
+        if _EDINET_COMMON_DICT is not None and stamp == _EDINET_DICT_STAMP:
+            return _EDINET_COMMON_DICT
+
+        try:
+            common_dict = _load_edinet_dict(dict_path, stamp)
+        except Exception as e:
+            if _EDINET_COMMON_DICT is None:
+                raise
+            debug_log(f"[TaxonomyDict] WARNING: Could not load refreshed edinet_taxonomy_dict, keeping the current one: {e}")
+            return _EDINET_COMMON_DICT
+        if _EDINET_COMMON_DICT is not None:
+            debug_log(f"[TaxonomyDict] edinet_taxonomy_dict reloaded ({len(common_dict)} items).")
+        _EDINET_COMMON_DICT, _EDINET_DICT_STAMP = common_dict, stamp
+        return _EDINET_COMMON_DICT
+
+
 def check_and_update_edinet_taxonomy(taxonomy_year):
-    """Run update_edinet_taxonomy.py when the XBRL references a newer taxonomy year.
+    """Start a background refresh of edinet_taxonomy_dict.py when the XBRL references a newer taxonomy year.
 
     This is triggered once per session for the highest taxonomy_year encountered.
     It compares the year embedded in edinet_taxonomy_dict.py against the year
     found in the XBRL _pre.xml file.  If the XBRL references a newer year, the
-    update script is called as a subprocess so the dict stays current.
+    update script is started as a detached process and this call returns at once:
+    the current request keeps the current dict, and get_edinet_common_dict() picks
+    up the regenerated file for later requests.
+
+    Refreshers are deduplicated across processes with the updater's own lock file
+    (.edinet_taxonomy_update.lock): nothing is started while it is locked, or if
+    a refresh was started within _EDINET_DICT_REFRESH_INTERVAL seconds (the
+    lock file's mtime marks the last start), and the updater is run with
+    --if-idle so that a racing second copy exits immediately.
 
     Args:
         taxonomy_year (str): Four-digit year extracted from the XBRL file
@@ -220,44 +437,48 @@ def check_and_update_edinet_taxonomy(taxonomy_year):
     dict_year = get_edinet_taxonomy_dict_year()
     debug_log(f"[TaxonomyDict] XBRL year={taxonomy_year}, dict_year={dict_year}")
 
+    if dict_year is not None and taxonomy_year <= dict_year:
+        debug_log(f"[TaxonomyDict] Dict is up-to-date (year {dict_year} >= {taxonomy_year}), skipping update.")
+        return
+
     # Trigger update when the XBRL references a newer year than the current dict
-    if dict_year is None or taxonomy_year > dict_year:
-        debug_log(f"[TaxonomyDict] Newer taxonomy detected ({taxonomy_year} > {dict_year}). Running update_edinet_taxonomy.py...")
-        update_script = os.path.join(SCRIPT_DIR, 'update_edinet_taxonomy.py')
-        if not os.path.exists(update_script):
-            debug_log(f"[TaxonomyDict] update_edinet_taxonomy.py not found at {update_script}, skipping.")
+    update_script = os.path.join(SCRIPT_DIR, 'update_edinet_taxonomy.py')
+    if not os.path.exists(update_script):
+        debug_log(f"[TaxonomyDict] update_edinet_taxonomy.py not found at {update_script}, skipping.")
+        return
+
+    lock_path = os.path.join(SCRIPT_DIR, '.edinet_taxonomy_update.lock')
+    try:
+        if time.time() - os.path.getmtime(lock_path) < _EDINET_DICT_REFRESH_INTERVAL:
+            debug_log(f"[TaxonomyDict] Refresh already started within the last {_EDINET_DICT_REFRESH_INTERVAL}s, skipping.")
             return
-        try:
-            result = subprocess.run(
-                [sys.executable, update_script],
-                capture_output=True,
-                text=True,
-                timeout=120,
-                cwd=SCRIPT_DIR,
-            )
-            if result.returncode == 0:
-                debug_log(f"[TaxonomyDict] update_edinet_taxonomy.py completed successfully.")
-                # Reload the updated module so this session uses the new dict
-                import importlib
-                try:
-                    import edinet_taxonomy_dict
-                    importlib.reload(edinet_taxonomy_dict)
-                    # Re-bind the global EDINET_COMMON_DICT to the refreshed module
-                    global EDINET_COMMON_DICT
-                    EDINET_COMMON_DICT = edinet_taxonomy_dict.common_dict
-                    debug_log(f"[TaxonomyDict] edinet_taxonomy_dict reloaded ({len(EDINET_COMMON_DICT)} items).")
-                except Exception as e:
-                    debug_log(f"[TaxonomyDict] WARNING: Could not reload edinet_taxonomy_dict: {e}")
-            else:
-                debug_log(f"[TaxonomyDict] update_edinet_taxonomy.py exited with code {result.returncode}.")
-                if result.stderr:
-                    debug_log(f"[TaxonomyDict] stderr: {result.stderr[:500]}")
-        except subprocess.TimeoutExpired:
-            debug_log("[TaxonomyDict] update_edinet_taxonomy.py timed out after 120s.")
-        except Exception as e:
-            debug_log(f"[TaxonomyDict] ERROR running update_edinet_taxonomy.py: {e}")
-    else:
-        debug_log(f"[TaxonomyDict] Dict is up-to-date (year {dict_year} >= {taxonomy_year}), skipping update.")
+    except OSError:
+        pass
+    try:
+        with open(lock_path, 'a') as lock_file:
+            if HAS_FCNTL:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            # Mark the start time for the refresh interval check above
+            os.utime(lock_path, None)
+    except (IOError, OSError):
+        debug_log("[TaxonomyDict] update_edinet_taxonomy.py is already running, skipping.")
+        return
+
+    debug_log(f"[TaxonomyDict] Newer taxonomy detected ({taxonomy_year} > {dict_year}). Starting update_edinet_taxonomy.py in the background...")
+    try:
+        # Detached (own session) so that it outlives a CGI request; output goes to update_edinet_taxonomy.log
+        subprocess.Popen(
+            [sys.executable, update_script, '--if-idle'],
+            cwd=SCRIPT_DIR,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            close_fds=True,
+            start_new_session=True,
+        )
+    except Exception as e:
+        debug_log(f"[TaxonomyDict] ERROR starting update_edinet_taxonomy.py: {e}")
 
 
 def rotate_logs_manually(log_file):
@@ -300,30 +521,246 @@ def rotate_logs_manually(log_file):
         # ログローテーション自体のエラーはstderrにのみ出力（デッドロック回避）
         print(f"Log rotation error: {e}", file=sys.stderr)
 
-def debug_log(message):
-    """Write message to a persistent debug log file for user visibility.
+def debug_log(message, *args, level=logging.INFO):
+    """Write message to the persistent debug log file (and stderr) for user visibility.
+
+    message may use %-style placeholders filled from args; nothing is formatted or queued
+    unless level is enabled (XBRL_LOG_LEVEL). Writing happens in the queue listener thread.
+    """
+    if not _logger.isEnabledFor(level):
+        return
+    _ensure_log_handlers()
+    _logger.log(level, message, *args)
+
+# Per-category counters of per-element log lines (log_count), kept per thread so that
+# concurrent conversions in one process do not mix
+_log_counts = _thread_local()
+
+def log_count(category, message=None, *args):
+    """Count one per-element event of category on this thread.
+
+    The detail line ('[category] ' + message % args) is written only at DEBUG level; at the
+    default level only the totals are logged once per conversion (flush_log_counts).
+    """
+    counts = getattr(_log_counts, 'counts', None)
+    if counts is None:
+        counts = _log_counts.counts = {}
+    counts[category] = counts.get(category, 0) + 1
+    if message is not None and _logger.isEnabledFor(logging.DEBUG):
+        _ensure_log_handlers()
+        _logger.debug('  [%s] ' + message, category, *args)
+
+def reset_log_counts():
+    """Drop the counters of this thread (start of a conversion)."""
+    _log_counts.counts = {}
+
+def flush_log_counts():
+    """Log the counters of this thread as one line and reset them."""
+    counts = getattr(_log_counts, 'counts', None)
+    if counts:
+        reset_log_counts()
+        debug_log('Log summary: %s', ', '.join(f'[{k}] {v}' for k, v in sorted(counts.items())))
+
+# ----------------------------------------------------------------------------
+# Profiling (--profile / XBRL_PROFILE_DIR)
+# ----------------------------------------------------------------------------
+# 名前付きスパン（開始・所要時間・件数・ピークメモリ）を入れ子で記録し、JSON または
+# Chrome トレース形式（chrome://tracing / Perfetto で表示）で書き出す。
+# プロファイルはそれを開始したスレッドに属し、ワーカースレッドへは bound_to_profile で引き継ぐ
+# （同じプロセス内の別の変換とは混ざらない）。無効時のコストは属性参照1回のみ。
+
+_profile_local = _thread_local()
+
+def _peak_rss_mb():
+    """Peak resident set size of the process in MB (None where the resource module is missing)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def profile_begin(name, **args):
+    """Open a span on the profile of this thread. Returns None when profiling is off.
 
-    Now uses Python's logging module for better performance (buffering)
-    and thread safety instead of manual file I/O.
+    args describe the span (zip, file, ...); counts are added by profile_end.
     """
-    global _log_rotation_checked
+    profile = getattr(_profile_local, 'profile', None)
+    if profile is None:
+        return None
+    stack = _profile_local.stack
+    span = {
+        'id': next(profile['ids']),
+        'parent': stack[-1]['id'] if stack else None,
+        'name': name,
+        'args': args,
+        'counts': {},
+        'thread': _current_thread().name,
+        'tid': _current_thread().ident,
+        'start': time.perf_counter() - profile['t0'],
+    }
+    stack.append(span)
+    return span
+
+def profile_end(span, **counts):
+    """Close a span from profile_begin (None is ignored) and record it with counts."""
+    if span is None:
+        return
+    profile = _profile_local.profile
+    span['duration'] = time.perf_counter() - profile['t0'] - span['start']
+    span['counts'].update(counts)
+    span['peak_rss_mb'] = _peak_rss_mb()
+    stack = _profile_local.stack
+    # Spans left open inside this one (an exception skipped their profile_end) end here too
+    while stack:
+        top = stack.pop()
+        if top is span:
+            break
+        _close_unclosed_span(profile, top, span)
+    profile['spans'].append(span)
+
+def _close_unclosed_span(profile, span, closed_by):
+    """Record a span whose profile_end was skipped, ending it with the enclosing span."""
+    span['duration'] = closed_by['start'] + closed_by['duration'] - span['start']
+    span['counts']['unclosed'] = True
+    span['peak_rss_mb'] = closed_by['peak_rss_mb']
+    profile['spans'].append(span)
+
+@contextmanager
+def profile_span(name, **args):
+    """Span around a block; yields the counts dict of the span ({} when profiling is off)."""
+    span = profile_begin(name, **args)
+    try:
+        yield span['counts'] if span is not None else {}
+    finally:
+        profile_end(span)
+
+def current_profile():
+    """(profile, innermost open span) of this thread, or None when profiling is off."""
+    profile = getattr(_profile_local, 'profile', None)
+    if profile is None:
+        return None
+    stack = _profile_local.stack
+    return profile, (stack[-1] if stack else None)
+
+@contextmanager
+def bind_profile(handle):
+    """Record the spans of this thread into handle (from current_profile), below its open span."""
+    if handle is None:
+        yield
+        return
+    saved = (getattr(_profile_local, 'profile', None), getattr(_profile_local, 'stack', None))
+    _profile_local.profile = handle[0]
+    _profile_local.stack = [handle[1]] if handle[1] is not None else []
+    base = len(_profile_local.stack)
+    try:
+        yield
+    finally:
+        stack = _profile_local.stack
+        if len(stack) > base:
+            profile_end(stack[base])
+        _profile_local.profile, _profile_local.stack = saved
+
+def bound_to_profile(fn):
+    """fn wrapped so that worker threads record into the calling thread's profile."""
+    handle = current_profile()
+    if handle is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with bind_profile(handle):
+            return fn(*args, **kwargs)
+    return run
+
+def _profile_tree(profile):
+    """JSON profile: span tree plus a per-name summary (total time, calls, slowest)."""
+    nodes = {}
+    for span in sorted(profile['spans'], key=lambda s: s['start']):
+        node = {
+            'name': span['name'],
+            'start_ms': round(span['start'] * 1000, 3),
+            'duration_ms': round(span['duration'] * 1000, 3),
+            'thread': span['thread'],
+            'peak_rss_mb': span['peak_rss_mb'],
+        }
+        if span['args']:
+            node['args'] = span['args']
+        if span['counts']:
+            node['counts'] = span['counts']
+        node['children'] = []
+        nodes[span['id']] = (span['parent'], node)
+    roots = []
+    for parent, node in nodes.values():
+        (nodes[parent][1]['children'] if parent in nodes else roots).append(node)
+    summary = {}
+    for span in profile['spans']:
+        entry = summary.setdefault(span['name'], {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        ms = span['duration'] * 1000
+        entry['calls'] += 1
+        entry['total_ms'] += ms
+        entry['max_ms'] = max(entry['max_ms'], ms)
+    for entry in summary.values():
+        entry['total_ms'] = round(entry['total_ms'], 3)
+        entry['max_ms'] = round(entry['max_ms'], 3)
+    return {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(profile['started'])),
+        'duration_ms': round(max((s['start'] + s['duration'] for s in profile['spans']), default=0) * 1000, 3),
+        'peak_rss_mb': _peak_rss_mb(),
+        'summary': dict(sorted(summary.items(), key=lambda kv: -kv[1]['total_ms'])),
+        'spans': roots,
+    }
+
+def _chrome_trace(profile):
+    """Chrome trace event format: one complete event per span, a counter for the peak RSS."""
+    pid = os.getpid()
+    events = []
+    threads = {}
+    for span in sorted(profile['spans'], key=lambda s: s['start']):
+        threads.setdefault(span['tid'], span['thread'])
+        events.append({
+            'name': span['name'], 'cat': 'xbrl', 'ph': 'X', 'pid': pid, 'tid': span['tid'],
+            'ts': round(span['start'] * 1e6, 1), 'dur': round(span['duration'] * 1e6, 1),
+            'args': dict(span['args'], **span['counts']),
+        })
+        if span['peak_rss_mb'] is not None:
+            events.append({'name': 'peak_rss_mb', 'ph': 'C', 'pid': pid,
+                           'ts': round((span['start'] + span['duration']) * 1e6, 1),
+                           'args': {'MB': span['peak_rss_mb']}})
+    for tid, name in threads.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+# Profile output formats selectable via profiling(fmt=...) / --profile-format / XBRL_PROFILE_FORMAT
+PROFILE_FORMATS = {
+    'json': _profile_tree,
+    'chrome': _chrome_trace,
+}
 
-    # Check for manual rotation (only once per session for performance)
-    if not _log_rotation_checked:
-        rotate_logs_manually(_LOG_FILE)
-        _log_rotation_checked = True
+@contextmanager
+def profiling(path=None, fmt='json', name='convert', **args):
+    """Profile everything this thread (and workers bound with bound_to_profile) does in the block.
 
-    # Use logging module which handles buffering and thread safety
-    _logger.info(message)
+    The block runs inside a root span `name`. On exit (also on errors) the profile is
+    written to path in the given PROFILE_FORMATS format, if path is given.
 
-def validate_zip_path(target_path, base_dir):
-    """Ensure the target path is within the base directory to prevent Zip Slip."""
-    abs_target = os.path.abspath(target_path)
-    abs_base = os.path.abspath(base_dir)
-    # Use commonpath to ensure target is actually within base_dir
-    # (prevents prefix match bypass where '/tmp/base_dir_extra' starts with '/tmp/base_dir')
-    if os.path.commonpath([abs_target, abs_base]) != abs_base:
-        raise Exception(f"Zip Slip detected: {abs_target} is outside of {abs_base}")
+    Yields:
+        dict: The profile (see PROFILE_FORMATS for rendering it)
+    """
+    if fmt not in PROFILE_FORMATS:
+        raise ValueError(f"Unknown profile format: {fmt} (choose from {', '.join(PROFILE_FORMATS)})")
+    import itertools
+    profile = {'t0': time.perf_counter(), 'started': time.time(), 'ids': itertools.count(1), 'spans': []}
+    try:
+        with bind_profile((profile, None)):
+            with profile_span(name, **args):
+                yield profile
+    finally:
+        if path:
+            try:
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(PROFILE_FORMATS[fmt](profile), f, ensure_ascii=False, indent=1, default=str)
+                debug_log(f"Profile written to {path} ({len(profile['spans'])} spans)")
+            except OSError as e:
+                debug_log(f"ERROR: Failed to write profile {path}: {e}")
 
 def check_zip_bomb(zip_ref, max_size=500 * 1024 * 1024):
     """Check for ZIP bomb attacks by validating total uncompressed size.
@@ -341,6 +778,249 @@ def check_zip_bomb(zip_ref, max_size=500 * 1024 * 1024):
         if total_size > max_size:
             raise Exception(f"ZIP bomb detected: total uncompressed size ({total_size:,} bytes) exceeds limit ({max_size:,} bytes)")
 
+def zip_source_name(src):
+    """Name of a ZIP source: a path, or a file-like object (uploads carry .filename, files .name)."""
+    if isinstance(src, str):
+        return src
+    return getattr(src, 'filename', None) or getattr(src, 'name', None) or '<memory>'
+
+def source_name(src):
+    """Name of a parser source: a path, or an in-memory ZIP member (BytesIO with .name)."""
+    return src if isinstance(src, str) else getattr(src, 'name', '<memory>')
+
+def wait_member(src):
+    """Block until a ZIP member that is still being inflated in the background is complete.
+
+    Raises the read error of the member, if any. Paths and ordinary sources return at once.
+    """
+    pending = getattr(src, 'pending', None)
+    if pending is not None:
+        pending.result()
+    return src
+
+def rewind_source(src):
+    """Return src ready to be parsed from the start (paths are returned unchanged)."""
+    if not isinstance(src, str):
+        wait_member(src).seek(0)
+    return src
+
+def read_source_text(src):
+    """Whole source decoded as UTF-8 (undecodable bytes replaced)."""
+    if isinstance(src, str):
+        with open(src, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    return wait_member(src).getvalue().decode('utf-8', errors='replace')
+
+def read_source_head(src, max_chars):
+    """First max_chars characters of a source decoded as UTF-8, without decoding the rest."""
+    if isinstance(src, str):
+        with open(src, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read(max_chars)
+    # A character takes at most 4 bytes in UTF-8
+    return wait_member(src).getbuffer()[:max_chars * 4].tobytes().decode('utf-8', errors='replace')[:max_chars]
+
+# Concurrent member inflation (read_zip_members): zlib releases the GIL, so members are
+# inflated by a few threads, each with its own ZipFile handle. The byte budget caps the
+# uncompressed size being inflated at once across all filings (one member always proceeds).
+ZIP_READ_WORKERS = 4
+ZIP_READ_BUDGET = int(os.environ.get('XBRL_ZIP_READ_BUDGET_MB', '64')) * 1024 * 1024
+# Below this total size the members are simply read one after another
+ZIP_PARALLEL_MIN_SIZE = 2 * 1024 * 1024
+_zip_read_cond = Condition()
+_zip_read_inflight = 0
+
+def _acquire_read_budget(size):
+    global _zip_read_inflight
+    with _zip_read_cond:
+        while _zip_read_inflight and _zip_read_inflight + size > ZIP_READ_BUDGET:
+            _zip_read_cond.wait()
+        _zip_read_inflight += size
+
+def _release_read_budget(size):
+    global _zip_read_inflight
+    with _zip_read_cond:
+        _zip_read_inflight -= size
+        _zip_read_cond.notify_all()
+
+class _PreadFile(io.RawIOBase):
+    """Read-only view of an open file descriptor with its own position (os.pread).
+
+    Lets several ZipFile handles read one spooled upload file concurrently without
+    sharing (or copying) it; the descriptor stays owned by the upload.
+    """
+    def __init__(self, fd):
+        self._fd = fd
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += os.fstat(self._fd).st_size
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, b):
+        data = os.pread(self._fd, len(b), self._pos)
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+def _zip_handle_opener(source):
+    """Return a function opening an independent ZipFile on source, or None if there is none.
+
+    - path: each handle opens the file itself
+    - upload spooled in memory (BytesIO / SpooledTemporaryFile below its max_size): the
+      handles share the bytes that are already in memory
+    - upload spooled to disk or other real file: each handle reopens it by name, or reads the
+      descriptor with os.pread, so the compressed data is not read back into memory
+    - anything else (pipes, unknown streams): None, members are read sequentially
+    """
+    if isinstance(source, str):
+        return lambda: zipfile.ZipFile(source, 'r')
+    # werkzeug FileStorage -> SpooledTemporaryFile -> BytesIO or (unnamed) temporary file
+    stream = getattr(source, 'stream', source)
+    if isinstance(stream, tempfile.SpooledTemporaryFile):
+        stream = stream._file
+    if isinstance(stream, io.BytesIO):
+        data = stream.getvalue()
+        return lambda: zipfile.ZipFile(io.BytesIO(data), 'r')
+    name = getattr(stream, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return lambda: zipfile.ZipFile(name, 'r')
+    if hasattr(os, 'pread'):
+        try:
+            fd = stream.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return None
+        return lambda: zipfile.ZipFile(io.BufferedReader(_PreadFile(fd)), 'r')
+    return None
+
+def close_zip_members(members):
+    """Stop the background inflation of read_zip_members members that nobody is going to read.
+
+    Cancels the members not started yet and waits for the running ones, so that no thread
+    reads the source after its owner closes it (an upload is closed at the end of the
+    request or job). Complete members are left as they are.
+    """
+    from concurrent.futures import wait
+    running = [buf.pending for buf in members.values()
+               if getattr(buf, 'pending', None) is not None and not buf.pending.cancel()]
+    wait(running)
+
+def read_zip_members(zip_ref, source=None):
+    """Read the members needed for conversion into memory.
+
+    Nothing is extracted to disk; member paths are only used for file matching.
+
+    With source (the ZIP path or seekable file-like object zip_ref was opened from) and a
+    large enough filing, the members are inflated concurrently (ZIP_READ_WORKERS threads,
+    one ZipFile handle each, bounded by ZIP_READ_BUDGET; see _zip_handle_opener - an upload
+    spooled to disk stays on disk, and sources without independent handles are read
+    sequentially). Manifest, instance and linkbases
+    are complete on return; the iXBRL documents keep inflating in the background in name
+    order and carry a .pending future until then, so that fact parsing can start on the
+    first document while later ones are still being inflated. Consumers go through
+    wait_member (read_source_text / read_source_head do so); a caller that gives up on the
+    members calls close_zip_members before the source is closed.
+
+    Returns:
+        dict: {member path ('/' separated): BytesIO with .name set to the member path}
+    """
+    wanted = []
+    for info in zip_ref.infolist():
+        # Skip directories
+        if info.is_dir():
+            continue
+        # Normalize Windows backslashes in paths
+        name = info.filename.replace('\\', '/')
+        filename_lower = name.lower()
+
+        # Read only necessary files:
+        # 1. Japanese label linkbases (exclude English versions)
+        # 2. Presentation linkbases
+        # 3. XBRL instance files
+        # 4. iXBRL HTML files (in PublicDoc only, skip AuditDoc)
+        # 5. manifest.xml / manifest_PublicDoc.xml (filing metadata, see locate_filing)
+        should_read = (
+            (filename_lower.endswith('_lab.xml') and not filename_lower.endswith('_lab-en.xml')) or
+            filename_lower.endswith('_pre.xml') or
+            filename_lower.endswith('.xbrl') or
+            (filename_lower.endswith(('.htm', '.html')) and 'publicdoc' in filename_lower) or
+            (filename_lower.rsplit('/', 1)[-1].startswith('manifest') and filename_lower.endswith('.xml'))
+        )
+        if should_read:
+            wanted.append((name, info))
+
+    members = {}
+    open_handle = None
+    if source is not None and len(wanted) >= 2 and sum(i.file_size for _, i in wanted) >= ZIP_PARALLEL_MIN_SIZE:
+        open_handle = _zip_handle_opener(source)
+    if open_handle is None:
+        for name, info in wanted:
+            buf = io.BytesIO(zip_ref.read(info))
+            buf.name = name
+            members[name] = buf
+        return members
+
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    local = threading.local()
+    handles = []
+    handles_lock = Lock()
+
+    def inflate(buf, info):
+        handle = getattr(local, 'handle', None)
+        if handle is None:
+            handle = local.handle = open_handle()
+            with handles_lock:
+                handles.append(handle)
+        _acquire_read_budget(info.file_size)
+        try:
+            buf.write(handle.read(info))
+        finally:
+            _release_read_budget(info.file_size)
+        buf.seek(0)
+
+    # Documents last (in name order, which is document order), everything else first
+    wanted.sort(key=lambda w: (w[0].lower().endswith(('.htm', '.html')), w[0]))
+    executor = ThreadPoolExecutor(max_workers=min(len(wanted), ZIP_READ_WORKERS))
+    futures = []
+    for name, info in wanted:
+        buf = io.BytesIO()
+        buf.name = name
+        buf.pending = executor.submit(inflate, buf, info)
+        members[name] = buf
+        futures.append(buf.pending)
+    # Workers exit once the queue is drained; the handles are closed by the last read
+    executor.shutdown(wait=False)
+    remaining = [len(futures)]
+
+    def on_done(_):
+        with handles_lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                for handle in handles:
+                    handle.close()
+
+    for f in futures:
+        f.add_done_callback(on_done)
+
+    for name, buf in members.items():
+        if not name.lower().endswith(('.htm', '.html')):
+            wait_member(buf)
+    return members
+
 @contextmanager
 def file_lock(lock_path, timeout=60):
     """Cross-process file lock using fcntl (Unix) with fallback to threading.Lock.
@@ -394,6 +1074,253 @@ def file_lock(lock_path, timeout=60):
             except Exception:
                 pass
 
+# Header line of cache artifacts written by publish_cache_file:
+#   XBRLCACHE1 <version> <payload length> <sha256 of payload>\n
+_CACHE_FILE_MAGIC = b'XBRLCACHE1'
+
+def publish_cache_file(path, payload, version):
+    """Atomically publish a cache artifact (bytes) with a version/checksum header.
+
+    The payload is written to a temp file in the same directory and os.replace()d into place,
+    so lock-free readers (read_cache_file) see either the previous file or the complete new one.
+    """
+    import hashlib
+    header = b'%s %s %d %s\n' % (_CACHE_FILE_MAGIC, version.encode('ascii'), len(payload),
+                                 hashlib.sha256(payload).hexdigest().encode('ascii'))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def read_cache_file(path, version):
+    """Return the payload of a cache artifact written by publish_cache_file, or None.
+
+    None means missing, another version, or failed length/checksum validation (treated as a miss).
+    Files without the header (written by older versions) are returned as-is for the caller to parse.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(_CACHE_FILE_MAGIC + b' '):
+        return data
+    import hashlib
+    try:
+        header_end = data.index(b'\n')
+        _, file_version, length, digest = data[:header_end].split(b' ')
+        payload = memoryview(data)[header_end + 1:]
+        if (file_version.decode('ascii') != version or int(length) != len(payload)
+                or hashlib.sha256(payload).hexdigest().encode('ascii') != digest):
+            debug_log(f"Cache file ignored (version/checksum mismatch): {path}")
+            return None
+    except ValueError:
+        debug_log(f"Cache file ignored (bad header): {path}")
+        return None
+    return payload.tobytes()
+
+# Shared on-disk cache for remote files (taxonomy ZIPs, ESE140115.xlsx), also used by update_edinet_taxonomy.py
+DOWNLOAD_CACHE_DIR = os.environ.get('XBRL_DOWNLOAD_CACHE_DIR') or os.path.join(SCRIPT_DIR, 'edinet_taxonomies', 'downloads')
+_DOWNLOAD_META_VERSION = 'download-1'
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Resume attempts within one download_file call when the connection drops mid-transfer
+_DOWNLOAD_ATTEMPTS = 3
+# Another process may be downloading the same (large) file; wait this long for its lock
+_DOWNLOAD_LOCK_TIMEOUT = 900
+
+def download_cache_path(url, cache_dir=None):
+    """Path of the cached copy of url: <cache_dir>/<url hash>_<file name>."""
+    import hashlib
+    name = os.path.basename(url.split('?')[0]) or 'download'
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir or DOWNLOAD_CACHE_DIR, f'{key}_{name}')
+
+def _read_download_meta(meta_path):
+    data = read_cache_file(meta_path, _DOWNLOAD_META_VERSION)
+    try:
+        meta = json.loads(data) if data else None
+    except ValueError:
+        return None
+    return meta if isinstance(meta, dict) else None
+
+def _write_download_meta(meta_path, meta):
+    publish_cache_file(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'), _DOWNLOAD_META_VERSION)
+
+def _remove_files(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _fetch_into_part(url, part_path, part_meta_path, cached_meta, timeout):
+    """One GET of url into part_path, resuming an earlier partial download if possible.
+
+    Returns the response status (200, 206 or 304) and the expected total size (or None).
+    """
+    import urllib.request
+    import urllib.error
+
+    headers = {}
+    if cached_meta is not None:
+        # Revalidate the complete cached copy
+        if cached_meta.get('etag'):
+            headers['If-None-Match'] = cached_meta['etag']
+        elif cached_meta.get('last_modified'):
+            headers['If-Modified-Since'] = cached_meta['last_modified']
+
+    part_meta = _read_download_meta(part_meta_path)
+    offset = os.path.getsize(part_path) if part_meta is not None and os.path.exists(part_path) else 0
+    validator = part_meta and (part_meta.get('etag') or part_meta.get('last_modified'))
+    if offset and validator:
+        # If-Range: the server sends the rest only if the remote file is still the same, otherwise all of it
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = validator
+    else:
+        offset = 0
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached_meta is not None:
+            return 304, None
+        if e.code == 416 and offset:
+            # Partial file no longer matches the remote one: start over on the next attempt
+            _remove_files(part_path, part_meta_path)
+            raise ConnectionError(f"Range not satisfiable for {url}, restarting download")
+        raise
+
+    with response:
+        status = response.status
+        total = None
+        if status == 206:
+            # Content-Range: bytes <start>-<end>/<total>
+            content_range = response.headers.get('Content-Range', '')
+            match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', content_range)
+            if not match or int(match.group(1)) != offset:
+                _remove_files(part_path, part_meta_path)
+                raise ConnectionError(f"Unexpected Content-Range '{content_range}' for {url}, restarting download")
+            total = int(match.group(2)) if match.group(2) != '*' else None
+            mode = 'ab'
+            debug_log(f"[Download] Resuming {url} at byte {offset}")
+        else:
+            length = response.headers.get('Content-Length')
+            total = int(length) if length and length.isdigit() else None
+            mode = 'wb'
+            _write_download_meta(part_meta_path, {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            })
+        with open(part_path, mode) as f:
+            while True:
+                chunk = response.read(_DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+    if total is not None and os.path.getsize(part_path) < total:
+        # Connection closed early: keep the partial file and resume it on the next attempt
+        raise ConnectionError(f"Connection closed at {os.path.getsize(part_path)} of {total} bytes")
+    return status, total
+
+def download_file(url, cache_dir=None, revalidate=True, force=False, expected_sha256=None,
+                  validate=None, timeout=60):
+    """Download url into the shared download cache and return its metadata.
+
+    - An interrupted download stays as <entry>.part and is resumed with an HTTP Range request
+      (guarded by If-Range, so a changed remote file is fetched from the start).
+    - An existing entry is revalidated with If-None-Match / If-Modified-Since unless revalidate=False;
+      on 304 or a network error the cached copy is returned.
+    - The body is checked against Content-Length, expected_sha256 and validate(path) before it is
+      published with os.replace; one process downloads a given URL at a time (file_lock).
+    - force=True ignores the cached entry and downloads again.
+
+    Returns a dict with 'path', 'modified' (True if a new body was downloaded),
+    'etag', 'last_modified', 'size' and 'sha256'. Raises if no usable copy could be obtained.
+    """
+    path = download_cache_path(url, cache_dir)
+    meta_path = path + '.meta'
+    part_path = path + '.part'
+    part_meta_path = part_path + '.meta'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with file_lock(path + '.lock', timeout=_DOWNLOAD_LOCK_TIMEOUT):
+        meta = None if force else _read_download_meta(meta_path)
+        if meta is not None:
+            try:
+                st = os.stat(path)
+                if st.st_size != meta.get('size') or st.st_mtime_ns != meta.get('mtime_ns'):
+                    meta = None
+            except OSError:
+                meta = None
+        if meta is not None and not revalidate:
+            return dict(meta, path=path, modified=False)
+
+        for attempt in range(1, _DOWNLOAD_ATTEMPTS + 1):
+            try:
+                status, total = _fetch_into_part(url, part_path, part_meta_path, meta, timeout)
+                break
+            except Exception as e:
+                if meta is not None:
+                    debug_log(f"[Download] Could not revalidate {url} ({e}), using cached copy")
+                    return dict(meta, path=path, modified=False)
+                if attempt == _DOWNLOAD_ATTEMPTS or not isinstance(e, (OSError, EOFError)):
+                    raise
+                debug_log(f"[Download] Attempt {attempt} for {url} failed ({e}), retrying")
+
+        if status == 304:
+            debug_log(f"[Download] Not modified: {url}")
+            return dict(meta, path=path, modified=False)
+
+        size = os.path.getsize(part_path)
+        if total is not None and size != total:
+            _remove_files(part_path, part_meta_path)
+            raise IOError(f"Download of {url} is larger than announced: {size} of {total} bytes")
+        digest = file_sha256(part_path)
+        try:
+            if expected_sha256 and digest != expected_sha256.lower():
+                raise ValueError(f"Checksum mismatch for {url}: {digest}")
+            if validate:
+                validate(part_path)
+        except Exception:
+            _remove_files(part_path, part_meta_path)
+            raise
+
+        part_meta = _read_download_meta(part_meta_path) or {}
+        os.chmod(part_path, 0o644)
+        os.replace(part_path, path)
+        _remove_files(part_meta_path)
+        st = os.stat(path)
+        meta = {
+            'url': url,
+            'etag': part_meta.get('etag'),
+            'last_modified': part_meta.get('last_modified'),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha256': digest,
+            'fetched_at': time.time(),
+        }
+        _write_download_meta(meta_path, meta)
+        debug_log(f"[Download] Saved {url} -> {path} ({st.st_size} bytes)")
+        return dict(meta, path=path, modified=True)
+
+# id(standard labels) -> (standard labels, suffix index); filled from the persisted index in
+# standard_labels.json (see _load_standard_labels_cache) or on first use by build_suffix_index
+_BASE_SUFFIX_INDEX_MEMO = {}
+
+def register_suffix_index(base_labels, suffix_index):
+    """Remember the suffix index of a shared (never mutated) standard label dict."""
+    if len(_BASE_SUFFIX_INDEX_MEMO) >= 8:
+        _BASE_SUFFIX_INDEX_MEMO.clear()
+    _BASE_SUFFIX_INDEX_MEMO[id(base_labels)] = (base_labels, suffix_index)
+
 def build_suffix_index(labels_map):
     """Build a suffix index for O(1) label lookups.
 
@@ -401,28 +1328,49 @@ def build_suffix_index(labels_map):
     For a labels_map with 20,000+ entries, this significantly improves performance
     when searching for labels by suffix (e.g., '_OperatingRevenue').
 
+    For a layered label map (ChainMap(overlay, base), see process_xbrl_zips) the index of the
+    shared base is reused (persisted with the taxonomy cache) and only the overlay is indexed:
+    the result is ChainMap(overlay suffixes, base index).
+
     Args:
         labels_map: dict mapping element names to labels
 
     Returns:
-        dict: suffix -> (full_key, label) mapping
+        dict: suffix -> full_key mapping (look the label up in labels_map)
             Keys are element suffixes after the last '_' (e.g., 'OperatingRevenue')
     """
+    if isinstance(labels_map, ChainMap) and len(labels_map.maps) == 2:
+        overlay, base = labels_map.maps
+        memo = _BASE_SUFFIX_INDEX_MEMO.get(id(base))
+        if memo is None or memo[0] is not base:
+            memo = (base, build_suffix_index(base))
+            register_suffix_index(base, memo[1])
+        base_index = memo[1]
+        # Overlay keys only add suffixes the base does not have; overridden labels are
+        # picked up through labels_map, since the index stores element names only
+        overlay_index = {}
+        for full_key in overlay:
+            if '_' in full_key:
+                suffix = full_key.split('_')[-1]
+                if suffix not in base_index and suffix not in overlay_index:
+                    overlay_index[suffix] = full_key
+        return ChainMap(overlay_index, base_index)
+
     suffix_index = {}
-    for full_key, label in labels_map.items():
+    for full_key in labels_map:
         if '_' in full_key:
             # Extract suffix after last underscore
             suffix = full_key.split('_')[-1]
             # Only keep the first match for each suffix (priority)
             if suffix not in suffix_index:
-                suffix_index[suffix] = (full_key, label)
+                suffix_index[suffix] = full_key
     return suffix_index
 
 def vprint(*args, **kwargs):
-    """Verbose print - only prints if VERBOSE_LOGGING is enabled."""
-    if VERBOSE_LOGGING:
-       msg = " ".join(map(str, args))
-       _logger.debug(f"[VERBOSE] {msg}")
+    """Verbose print - only logs at DEBUG level (XBRL_LOG_LEVEL=DEBUG or XBRL_VERBOSE=1)."""
+    if _logger.isEnabledFor(logging.DEBUG):
+       _ensure_log_handlers()
+       _logger.debug("[VERBOSE] %s", " ".join(map(str, args)))
 
 
 # ============================================================================
@@ -432,7 +1380,8 @@ def vprint(*args, **kwargs):
 #
 # このセクションには以下が含まれます:
 # - safe_xpath (349-430行): XPath実行ヘルパー
-# - find_xbrl_files (432-478行): XBRLファイル検出
+# - find_xbrl_files (432-478行): XBRLファイル検出（メンバー名を1回走査）
+# - locate_filing: マニフェスト優先のファイル特定＋タクソノミ年度・会計基準の判定（1回で実施）
 # - clean_label (852-874行): ラベルクリーンアップ
 # - convert_camel_case_to_title (876-880行): キャメルケース変換
 # - parse_presentation_linkbase (882-1004行): プレゼンテーション解析
@@ -542,53 +1491,145 @@ IFRS_LABEL_MAPPING = {
     'jpigp_cor_LiabilitiesIFRS': '負債合計',
 }
 
-# Helper to find specific linkbase/instance files in the unzipped folder
-def find_xbrl_files(extract_dir):
+# Helper to find specific linkbase/instance files among the ZIP members
+def find_xbrl_files(members):
+    """Locate linkbases, instance and iXBRL files with one scan of the member names.
+
+    Args:
+        members: {member path: source} from read_zip_members
+
+    Returns:
+        dict | None: {'lab': [src], 'pre': src, 'xbrl': src, 'ixbrl': [src], 'manifest': src | None}
+            or None. 'ixbrl' lists the *_ixbrl.htm(l) files next to the instance, sorted by name.
+    """
     files = {'lab': []}
-    
-    # 1. Global Label Collection (Resilient to structure)
-    # Collect ALL Japanese label linkbases from the entire package
-    for root, _, filenames in os.walk(extract_dir):
-        for f in filenames:
-            fl = f.lower()
-            if fl.endswith('_lab.xml') and not fl.endswith('_lab-en.xml'):
-                files['lab'].append(os.path.join(root, f))
-    
-    # 2. Instance and Presentation Lookup
-    # Prefer PublicDoc but fallback to any identified file
     base_path = None
-    for root, dirs, _ in os.walk(extract_dir):
-        if 'PublicDoc' in dirs:
-            base_path = os.path.join(root, 'PublicDoc')
-            break
-    
-    # Priority 1: Files in PublicDoc
-    if base_path and os.path.exists(base_path):
-        for f in os.listdir(base_path):
-            fl = f.lower()
-            full_path = os.path.join(base_path, f)
-            if 'pre' not in files and fl.endswith('_pre.xml'):
-                files['pre'] = full_path
-            elif 'xbrl' not in files and fl.endswith('.xbrl'):
-                files['xbrl'] = full_path
-            elif fl.endswith('.htm') or fl.endswith('.html'):
-                if 'ixbrl' not in files: files['ixbrl'] = []
-                files['ixbrl'].append(full_path)
-    
-    # Priority 2: Fallback to global search if missing
-    if 'pre' not in files or 'xbrl' not in files:
-        for root, _, filenames in os.walk(extract_dir):
+    by_dir = {}     # {directory: {'pre': src, 'xbrl': src}} (first match per directory)
+    fallback = {}   # first match anywhere except AuditDoc
+    ixbrl_by_dir = {}
+    manifest_by_dir = {}
+    for name in sorted(members):
+        parent, _, f = name.rpartition('/')
+        fl = f.lower()
+        src = members[name]
+
+        # 1. Global Label Collection (Resilient to structure)
+        # Collect ALL Japanese label linkbases from the entire package
+        if fl.endswith('_lab.xml') and not fl.endswith('_lab-en.xml'):
+            files['lab'].append(src)
+
+        # 2. Instance and Presentation Lookup
+        # Prefer PublicDoc but fallback to any identified file
+        if base_path is None:
+            parts = name.split('/')[:-1]
+            if 'PublicDoc' in parts:
+                base_path = '/'.join(parts[:parts.index('PublicDoc') + 1])
+        kind = 'pre' if fl.endswith('_pre.xml') else 'xbrl' if fl.endswith('.xbrl') else None
+        if kind:
+            by_dir.setdefault(parent, {}).setdefault(kind, src)
             # Skip AuditDoc for fallback instance search to avoid wrong facts
-            if 'AuditDoc' in root: continue 
-            for f in filenames:
-                fl = f.lower()
-                full_path = os.path.join(root, f)
-                if 'pre' not in files and fl.endswith('_pre.xml'):
-                    files['pre'] = full_path
-                elif 'xbrl' not in files and fl.endswith('.xbrl'):
-                    files['xbrl'] = full_path
-    
-    return files if 'pre' in files and 'xbrl' in files else None
+            if 'AuditDoc' not in parent:
+                fallback.setdefault(kind, src)
+        elif '_ixbrl' in fl and (fl.endswith('.htm') or fl.endswith('.html')):
+            ixbrl_by_dir.setdefault(parent, []).append(src)
+        elif fl.startswith('manifest') and fl.endswith('.xml'):
+            manifest_by_dir.setdefault(parent, src)
+
+    # Priority 1: Files in PublicDoc, Priority 2: Fallback to global search if missing
+    primary = by_dir.get(base_path, {}) if base_path else {}
+    for kind in ('pre', 'xbrl'):
+        src = primary.get(kind) or fallback.get(kind)
+        if src is not None:
+            files[kind] = src
+    if 'pre' not in files or 'xbrl' not in files:
+        return None
+
+    instance_dir = source_name(files['xbrl']).rpartition('/')[0]
+    files['ixbrl'] = ixbrl_by_dir.get(instance_dir, [])
+    files['manifest'] = manifest_by_dir.get(instance_dir)
+    return files
+
+def read_filing_manifest(src):
+    """Read an EDINET manifest (manifest_PublicDoc.xml).
+
+    Returns:
+        list: [(instance file name, [iXBRL file names in document order])], paths relative
+            to the manifest's directory; [] if the manifest cannot be parsed
+    """
+    try:
+        if HAS_LXML:
+            parser = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
+            root = etree.parse(rewind_source(src), parser).getroot()
+        else:
+            root = etree.parse(rewind_source(src)).getroot()
+    except Exception as e:
+        debug_log(f"Could not parse manifest {source_name(src)}: {e}")
+        return []
+    if root is None:
+        return []
+    instances = []
+    for instance in root.iter('{*}instance'):
+        ixbrl = [el.text.strip() for el in instance.iter('{*}ixbrl') if el.text and el.text.strip()]
+        instances.append((instance.get('preferredFilename') or '', ixbrl))
+    return instances
+
+def sniff_report_std(search_content):
+    """Report-level accounting standard from lowercased pre / iXBRL heads ('JP', 'IFRS', 'US', 'JMIS' or None)."""
+    if 'jpigp' in search_content or 'ifrs.org' in search_content or 'ifrs-full' in search_content:
+        return 'IFRS'
+    if 'jpusp' in search_content or 'us-gaap' in search_content:
+        return 'US'
+    if 'jpmis' in search_content:
+        return 'JMIS'
+    if 'jppfs' in search_content:
+        return 'JP'
+    return None  # don't assume until detected
+
+def locate_filing(members):
+    """Filing metadata stage: documents, taxonomy year and accounting standard of one filing.
+
+    The manifest gives the instance and the iXBRL files in document order; without a usable
+    manifest the single name scan of find_xbrl_files is used as is. The head of the presentation
+    linkbase (and of the first iXBRL file) is decoded once for the year and standard sniffing.
+
+    Returns:
+        dict | None: find_xbrl_files() result plus 'taxonomy_year' and 'report_std' (or None)
+    """
+    files = find_xbrl_files(members)
+    if not files:
+        return None
+
+    if files['manifest'] is not None:
+        manifest_dir = source_name(files['manifest']).rpartition('/')[0]
+        prefix = manifest_dir + '/' if manifest_dir else ''
+        for instance_name, ixbrl_names in read_filing_manifest(files['manifest'])[:1]:
+            instance = members.get(prefix + instance_name)
+            if instance is not None:
+                files['xbrl'] = instance
+                stem = instance_name[:-len('.xbrl')] if instance_name.lower().endswith('.xbrl') else instance_name
+                files['pre'] = members.get(prefix + stem + '_pre.xml', files['pre'])
+            ixbrl = [members[prefix + n] for n in ixbrl_names if prefix + n in members]
+            if ixbrl:
+                files['ixbrl'] = ixbrl
+            debug_log(f"  Manifest {source_name(files['manifest'])}: {len(ixbrl)} iXBRL files")
+
+    taxonomy_year = None
+    pre_head = read_source_head(files['pre'], 40000)
+    m = _RE_TAXONOMY_YEAR.search(pre_head[:4000])
+    if m:
+        year_str = m.group(1)
+        taxonomy_year = '2021' if year_str == '2020' else year_str
+    files['taxonomy_year'] = taxonomy_year
+
+    # --- Detect Report-Level Accounting Standard (V13) ---
+    search_content = pre_head.lower()
+    if files['ixbrl']:
+        # Check first iXBRL file for standard indicators
+        search_content += read_source_head(files['ixbrl'][0], 40000).lower()
+    report_std = sniff_report_std(search_content)
+    files['report_std'] = report_std
+    debug_log("  [DEBUG] Report standard detected as: %s (from pre/ixbrl content)", report_std, level=logging.DEBUG)
+    return files
 
 def fetch_taxonomy_url(year):
     """Dynamically fetch EDINET taxonomy URL from FSA index page.
@@ -609,6 +1650,7 @@ def fetch_taxonomy_url(year):
         index_url = 'https://www.fsa.go.jp/search/EDINET_Taxonomy_All.html'
         debug_log(f"Fetching taxonomy index from {index_url}")
 
+        import urllib.request
         with urllib.request.urlopen(index_url, timeout=10) as response:
             html = response.read().decode('utf-8', errors='ignore')
 
@@ -647,6 +1689,76 @@ def fetch_taxonomy_url(year):
         debug_log(f"ERROR: Failed to fetch taxonomy URL for {year}: {e}")
         return None
 
+def taxonomy_zip_member_name(info):
+    """Decode a taxonomy ZIP member name.
+
+    The FSA taxonomy ZIP stores CP932 names without the UTF-8 flag, which zipfile
+    exposes as CP437; re-decode them so that names match on Linux/Unix as well.
+    """
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('cp932')
+    except Exception:
+        return info.filename
+
+def is_skipped_label_file(path):
+    """Deprecated and English label files are not used for the standard labels."""
+    return 'deprecated' in path or 'dep' in path or '-en.xml' in path
+
+def taxonomy_label_members(zip_ref):
+    """Japanese _lab.xml members of a taxonomy ZIP, filtered by name only (nothing is read).
+
+    Returns:
+        list: Sorted [(decoded member name, ZipInfo)]
+    """
+    members = []
+    for info in zip_ref.infolist():
+        if info.is_dir():
+            continue
+        name = taxonomy_zip_member_name(info).replace('\\', '/')
+        if name.endswith('_lab.xml') and not is_skipped_label_file(name):
+            members.append((name, info))
+    members.sort(key=lambda m: m[0])
+    return members
+
+# standard_labels.json path -> (mtime, (labels, priorities)); see get_standard_labels
+_STANDARD_LABELS_MEMO = {}
+# Bump when the layout of standard_labels.json changes; older caches are then rebuilt
+STANDARD_LABELS_CACHE_VERSION = 'labels-2'
+
+def _load_standard_labels_cache(labels_cache_file):
+    """Read standard_labels.json without locking. Returns (labels, priorities) or None on a miss."""
+    data = read_cache_file(labels_cache_file, STANDARD_LABELS_CACHE_VERSION)
+    if data is None:
+        return None
+    try:
+        data = json.loads(data)
+    except ValueError as e:
+        debug_log(f"ERROR: Cache read error for {labels_cache_file}: {e}")
+        return None
+    if isinstance(data, dict) and 'labels' in data:
+        if data.get('suffix_index') is not None:
+            register_suffix_index(data['labels'], data['suffix_index'])
+        return data['labels'], data.get('priorities', {})
+    # Legacy format compatibility (plain {element: label})
+    return data, {k: PRIORITY_LEGACY_DEFAULT for k in data}
+
+def _memoize_standard_labels(labels_cache_file, res, cache_mtime=None):
+    """Store res in _STANDARD_LABELS_MEMO under the cache file's mtime (skipped when the file is missing)."""
+    if cache_mtime is None:
+        try:
+            cache_mtime = os.path.getmtime(labels_cache_file)
+        except OSError:
+            return res
+    _STANDARD_LABELS_MEMO[labels_cache_file] = (cache_mtime, res)
+    return res
+
+def _validate_taxonomy_zip(path):
+    """download_file validator: the taxonomy must be a readable ZIP that passes check_zip_bomb."""
+    with zipfile.ZipFile(path, 'r') as zip_ref:
+        check_zip_bomb(zip_ref)
+
 def get_standard_labels(year, cache_dir=None):
     """Returns (all_labels, label_priorities) for the given taxonomy year.
     Uses cached standard_labels.json if it exists.
@@ -658,6 +1770,16 @@ def get_standard_labels(year, cache_dir=None):
     tax_dir = os.path.join(cache_dir, str(year))
     labels_cache_file = os.path.join(tax_dir, 'standard_labels.json')
 
+    # In-process memo (long-running workers, e.g. xbrl_daemon.py): reuse while the cache file is unchanged.
+    # Callers copy the result into their own dicts, so the memoized dicts are never mutated.
+    try:
+        cache_mtime = os.path.getmtime(labels_cache_file)
+    except OSError:
+        cache_mtime = None
+    memo = _STANDARD_LABELS_MEMO.get(labels_cache_file)
+    if memo and cache_mtime is not None and memo[0] == cache_mtime:
+        return memo[1]
+
     debug_log(f"Checking taxonomy cache: {labels_cache_file}")
 
     # Fallback URLs (hardcoded) - used if dynamic fetching fails
@@ -685,43 +1807,23 @@ def get_standard_labels(year, cache_dir=None):
             vprint(f"Taxonomy for year {year} not found (neither dynamic nor fallback).")
             return {}, {}
     
-    # Try to load from cache (fast path, no lock needed)
-    if os.path.exists(labels_cache_file):
-        try:
-            with open(labels_cache_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if isinstance(data, dict) and 'labels' in data:
-                    res = data['labels'], data.get('priorities', {})
-                    debug_log(f"SUCCESS: Loaded taxonomy cache for {year} in {time.time() - start_time:.2f}s")
-                    return res
-                else:
-                    # Legacy format compatibility
-                    priorities = {k: PRIORITY_LEGACY_DEFAULT for k in data}
-                    debug_log(f"SUCCESS: Loaded legacy taxonomy cache for {year} in {time.time() - start_time:.2f}s")
-                    return data, priorities
-        except Exception as e:
-            debug_log(f"ERROR: Cache read error for {year}: {e}")
-
-    # Cache doesn't exist - acquire locks to prevent race conditions
+    # Try to load from cache (fast path, no lock needed).
+    # The cache is published atomically (publish_cache_file), so a reader never sees a partial file.
+    res = _load_standard_labels_cache(labels_cache_file)
+    if res is not None:
+        debug_log(f"SUCCESS: Loaded taxonomy cache for {year} in {time.time() - start_time:.2f}s")
+        return _memoize_standard_labels(labels_cache_file, res, cache_mtime)
+
+    # Cache doesn't exist - acquire locks so that only one thread/process builds it
     # Use both thread lock (for multi-threaded processes) and file lock (for multi-process environments)
     lock_file_path = os.path.join(tax_dir, f'.taxonomy_{year}.lock')
     with file_lock(lock_file_path):
         with _TAXONOMY_LOCK:
             # Double-check: another thread/process may have created the cache while we were waiting
-            if os.path.exists(labels_cache_file):
-                try:
-                    with open(labels_cache_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        if isinstance(data, dict) and 'labels' in data:
-                            res = data['labels'], data.get('priorities', {})
-                            debug_log(f"SUCCESS: Loaded taxonomy cache for {year} (created by another thread/process) in {time.time() - start_time:.2f}s")
-                            return res
-                        else:
-                            priorities = {k: PRIORITY_LEGACY_DEFAULT for k in data}
-                            debug_log(f"SUCCESS: Loaded legacy taxonomy cache for {year} (created by another thread/process) in {time.time() - start_time:.2f}s")
-                            return data, priorities
-                except Exception as e:
-                    debug_log(f"ERROR: Cache read error for {year} after lock: {e}")
+            res = _load_standard_labels_cache(labels_cache_file)
+            if res is not None:
+                debug_log(f"SUCCESS: Loaded taxonomy cache for {year} (created by another thread/process) in {time.time() - start_time:.2f}s")
+                return _memoize_standard_labels(labels_cache_file, res)
 
             if not os.path.exists(tax_dir):
                 try:
@@ -736,68 +1838,49 @@ def get_standard_labels(year, cache_dir=None):
                         vprint(f"Fallback to /tmp failed for {year}: {e}")
                     labels_cache_file = os.path.join(tax_dir, 'standard_labels.json')
 
-            if not os.path.exists(labels_cache_file):
-                zip_path = os.path.join(tax_dir, 'taxonomy.zip')
-                if not os.path.exists(os.path.join(tax_dir, 'taxonomy')): # rudimentary check for extracted data
-                    vprint(f"Downloading EDINET taxonomy for {year} (takes a moment)...")
-                    try:
-                        urllib.request.urlretrieve(taxonomy_url, zip_path)
-                        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                            # Check for ZIP bomb before extraction
-                            check_zip_bomb(zip_ref)
-
-                            # Robust extraction: manually decode filenames using CP932 (shift_jis)
-                            # to avoid Mojibake on Linux/Unix systems that default to UTF-8
-                            for info in zip_ref.infolist():
-                                try:
-                                    # infolist().filename is often bytes or interpreted as CP437
-                                    # We re-encode and decode correctly
-                                    filename_raw = info.filename.encode('cp437')
-                                    filename = filename_raw.decode('cp932')
-                                except Exception:
-                                    filename = info.filename
-
-                                target_path = os.path.join(tax_dir, filename)
-                                validate_zip_path(target_path, tax_dir)
-                                if info.is_dir():
-                                    os.makedirs(target_path, exist_ok=True)
-                                else:
-                                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
-                                    with zip_ref.open(info) as source, open(target_path, 'wb') as target:
-                                        shutil.copyfileobj(source, target)
-                        os.remove(zip_path)
-
-                        # Canonical normalization: Rename any Mojibake "タクソノミ" folder to "taxonomy"
-                        for entry in os.listdir(tax_dir):
-                            full_p = os.path.join(tax_dir, entry)
-                            if os.path.isdir(full_p) and ('â^' in entry or 'タクソノミ' in entry):
-                                new_p = os.path.join(tax_dir, 'taxonomy')
-                                if not os.path.exists(new_p):
-                                    os.rename(full_p, new_p)
-                                    vprint(f"Normalized taxonomy directory: {entry} -> taxonomy")
-                    except Exception as e:
-                        vprint(f"Failed to download/extract taxonomy for {year}: {e}")
-                        return {}, {}
+            # The downloaded ZIP itself is the cached artifact: label files are read straight from it.
+            # It lives in the shared download cache (download_file); taxonomy.zip / taxonomy/ in tax_dir
+            # are layouts of older versions and are still used when present.
+            zip_path = os.path.join(tax_dir, 'taxonomy.zip')
+            legacy_dir = os.path.join(tax_dir, 'taxonomy')  # extracted tree of older versions
+            if not os.path.exists(zip_path) and not os.path.isdir(legacy_dir):
+                vprint(f"Downloading EDINET taxonomy for {year} (takes a moment)...")
+                try:
+                    # Taxonomy URLs are per release, so a cached copy is used without revalidation
+                    zip_path = download_file(taxonomy_url, revalidate=False, validate=_validate_taxonomy_zip)['path']
+                except Exception as e:
+                    vprint(f"Failed to download taxonomy for {year}: {e}")
+                    return {}, {}
 
             vprint(f"Parsing EDINET taxonomy labels for {year}... (First run only)")
-            # Use os.walk() instead of glob.glob() for better performance with thousands of files
-            # Performance: os.walk() ~0.003s vs glob.glob() ~0.007s for 2709 files
-            lab_files = []
-            for root, dirs, files in os.walk(tax_dir):
-                for file in files:
-                    if file.endswith('_lab.xml'):
-                        lab_files.append(os.path.join(root, file))
-            lab_files.sort()
             all_labels = {}
             label_priorities = {} # {element_name: priority}
 
             # Track which taxonomy types we're loading
             taxonomy_types = set()
 
-            for lf in lab_files:
-                if 'deprecated' in lf or 'dep' in lf or '-en.xml' in lf:
-                    continue
-
+            zip_ref = None
+            try:
+                if os.path.exists(zip_path):
+                    zip_ref = zipfile.ZipFile(zip_path, 'r')
+                    check_zip_bomb(zip_ref)
+                    lab_files = taxonomy_label_members(zip_ref)
+                else:
+                    # Use os.walk() instead of glob.glob() for better performance with thousands of files
+                    lab_files = []
+                    for root, dirs, files in os.walk(legacy_dir):
+                        for file in files:
+                            rel_path = os.path.relpath(os.path.join(root, file), tax_dir)
+                            if file.endswith('_lab.xml') and not is_skipped_label_file(rel_path):
+                                lab_files.append((rel_path, os.path.join(root, file)))
+                    lab_files.sort()
+            except Exception as e:
+                if zip_ref:
+                    zip_ref.close()
+                vprint(f"Failed to open taxonomy for {year}: {e}")
+                return {}, {}
+
+            for lf, member in lab_files:
                 # Extract taxonomy type (jpigp, jppfs, jpcrp, etc.)
                 basename = os.path.basename(lf)
                 if '_lab.xml' in basename:
@@ -807,7 +1890,13 @@ def get_standard_labels(year, cache_dir=None):
                 try:
                     # Determine taxonomy type from filename for domain-specific weighting
                     tax_type = os.path.basename(lf).split('_')[0]
-                    parsed_labels, parsed_priorities = parse_labels_file(lf)
+                    if zip_ref:
+                        # One member in memory at a time
+                        src = io.BytesIO(zip_ref.read(member))
+                        src.name = lf
+                    else:
+                        src = member
+                    parsed_labels, parsed_priorities = parse_labels_file(src)
 
                     for el, text in parsed_labels.items():
                         prio = parsed_priorities.get(el, 99)
@@ -824,6 +1913,8 @@ def get_standard_labels(year, cache_dir=None):
                             label_priorities[el] = prio
                 except Exception as e:
                     vprint(f"Error parsing labels from {lf}: {e}")
+            if zip_ref:
+                zip_ref.close()
 
             # Report which taxonomies were loaded
             if taxonomy_types:
@@ -834,13 +1925,19 @@ def get_standard_labels(year, cache_dir=None):
 
             if all_labels:
                 try:
-                    with open(labels_cache_file, 'w', encoding='utf-8') as f:
-                        json.dump({'labels': all_labels, 'priorities': label_priorities}, f, ensure_ascii=False, indent=2)
+                    # The suffix index of the standard labels is persisted too, so that it is not
+                    # rebuilt per filing (build_suffix_index only indexes the per-filing overlay)
+                    suffix_index = build_suffix_index(all_labels)
+                    register_suffix_index(all_labels, suffix_index)
+                    payload = json.dumps({'labels': all_labels, 'priorities': label_priorities,
+                                          'suffix_index': suffix_index}, ensure_ascii=False)
+                    publish_cache_file(labels_cache_file, payload.encode('utf-8'), STANDARD_LABELS_CACHE_VERSION)
                     debug_log(f"SUCCESS: Saved taxonomy cache to {labels_cache_file} in {time.time() - start_time:.2f}s")
                 except Exception as e:
                     debug_log(f"WARNING: Could not cache labels to {labels_cache_file}: {e}")
+                    return all_labels, label_priorities
 
-            return all_labels, label_priorities
+            return _memoize_standard_labels(labels_cache_file, (all_labels, label_priorities))
 
 
 def parse_labels_file(lab_file):
@@ -855,12 +1952,12 @@ def parse_labels_file(lab_file):
         if HAS_LXML:
             # Secure parser against XXE attacks
             parser = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
-            tree = etree.parse(lab_file, parser)
+            tree = etree.parse(rewind_source(lab_file), parser)
         else:
-            tree = etree.parse(lab_file)
+            tree = etree.parse(rewind_source(lab_file))
     except Exception as e:
         # If parsing fails, return empty mappings
-        vprint(f"Error parsing {lab_file}: {e}")
+        vprint(f"Error parsing {source_name(lab_file)}: {e}")
         return labels, priorities
 
     # Namespace map for XBRL linkbase
@@ -993,16 +2090,27 @@ def convert_camel_case_to_title(name):
     s1 = _RE_CAMEL_CASE_1.sub(r'\1 \2', name)
     return _RE_CAMEL_CASE_2.sub(r'\1 \2', s1).title()
 
-def parse_presentation_linkbase(pre_file):
-    vprint(f"Parsing presentation linkbase... {os.path.basename(pre_file)}")
+def is_jumbo_role(role_name):
+    """Return True for "jumbo" roles holding several statements (e.g. Cabinet Office Ordinance Form 3)."""
+    jumbo_indicators = ['formno3', 'cabinetofficeordinance', 'annualsecuritiesreport']
+    return any(ji in role_name.lower() for ji in jumbo_indicators)
+
+def parse_presentation_linkbase(pre_file, role_filter=None):
+    """Parse presentation links into {role_name: [arc]} (plus virtual roles cut out of jumbo roles).
+
+    role_filter: Optional callable(base_name) -> bool. Roles it rejects are skipped before
+                 their locators and arcs are read (jumbo roles are always read and only the
+                 accepted virtual roles are kept)
+    """
+    vprint(f"Parsing presentation linkbase... {os.path.basename(source_name(pre_file))}")
     try:
         # Use lxml for robust namespace handling if available
         if HAS_LXML:
             # Secure parser against XXE attacks
             parser = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
-            tree = etree.parse(pre_file, parser)
+            tree = etree.parse(rewind_source(pre_file), parser)
         else:
-            tree = etree.parse(pre_file)
+            tree = etree.parse(rewind_source(pre_file))
     except Exception as e:
         vprint(f"Error parsing presentation linkbase: {e}")
         return {}
@@ -1020,6 +2128,9 @@ def parse_presentation_linkbase(pre_file):
         role_uri = link.get("{http://www.w3.org/1999/xlink}role")
         if not role_uri:
             continue
+        role_name = role_uri.split('/')[-1]
+        if role_filter and not is_jumbo_role(role_name) and not role_filter(role_name.split('_')[-1]):
+            continue
         
         if role_uri not in role_to_content:
             role_to_content[role_uri] = {'locs': {}, 'arcs': []}
@@ -1072,12 +2183,12 @@ def parse_presentation_linkbase(pre_file):
             continue
         
         # Original role
-        statement_trees[role_name] = parent_child
+        if not role_filter or role_filter(role_name.split('_')[-1]):
+            statement_trees[role_name] = parent_child
         
         # Special logic for "jumbo" roles (e.g. Cabinet Office Ordinance Form 3)
         # These roles often contain many independent financial statements under specific Heading elements.
-        jumbo_indicators = ['formno3', 'cabinetofficeordinance', 'annualsecuritiesreport']
-        if any(ji in role_name.lower() for ji in jumbo_indicators):
+        if is_jumbo_role(role_name):
             major_headings = [
                 'ConsolidatedBalanceSheetHeading', 'ConsolidatedStatementOfIncomeHeading', 
                 'ConsolidatedStatementOfCashFlowsHeading', 'ConsolidatedStatementOfChangesInEquityHeading',
@@ -1113,27 +2224,30 @@ def parse_presentation_linkbase(pre_file):
                         virtual_role = h_element
                         if virtual_role.endswith('Heading'):
                             virtual_role = virtual_role[:-7]
+                        if role_filter and not role_filter(virtual_role.split('_')[-1]):
+                            continue
                         statement_trees[virtual_role] = subtree_arcs
                         
     return statement_trees
 
-def parse_instance_contexts_and_units(xbrl_file, labels_map):
-    vprint(f"Parsing XBRL contexts and units... {os.path.basename(xbrl_file)}")
+def parse_instance_contexts_and_units(xbrl_file, labels_map, suffix_index=None, reported_facts=None):
+    vprint(f"Parsing XBRL contexts and units... {os.path.basename(source_name(xbrl_file))}")
     try:
         # Use lxml for robust namespace handling if available
         if HAS_LXML:
             # Secure parser against XXE attacks
             parser = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
-            tree = etree.parse(xbrl_file, parser)
+            tree = etree.parse(rewind_source(xbrl_file), parser)
         else:
-            tree = etree.parse(xbrl_file)
+            tree = etree.parse(rewind_source(xbrl_file))
     except Exception as e:
         vprint(f"Error parsing XBRL instance: {e}")
         return {}, {}
 
     # Build suffix index for O(1) label lookups (performance optimization)
     # This converts O(N) suffix searches to O(1) hash lookups
-    suffix_index = build_suffix_index(labels_map)
+    if suffix_index is None:
+        suffix_index = build_suffix_index(labels_map)
 
     # Standard namespaces for XBRL instance and dimensions
     ns = {
@@ -1187,13 +2301,12 @@ def parse_instance_contexts_and_units(xbrl_file, labels_map):
                 # If not found, use suffix index for O(1) lookup
                 # (to catch standard elements from any taxonomy namespace)
                 if not label and member_val in suffix_index:
-                    _, label_text = suffix_index[member_val]
-                    label = clean_label(label_text)
+                    label = clean_label(labels_map[suffix_index[member_val]])
 
             # Fallback for company specific segment names found in _lab.xml
             if label: label = label.replace(' [メンバー]', '').replace(' [要素]', '').replace(' [区分]', '').strip()
             if not label and member_val in suffix_index:
-                _, label = suffix_index[member_val]
+                label = labels_map[suffix_index[member_val]]
             
             if label: label = label.replace(' [メンバー]', '').replace(' [要素]', '').replace(' [区分]', '').strip()
             if not label:
@@ -1252,21 +2365,64 @@ def parse_instance_contexts_and_units(xbrl_file, labels_map):
                 is_jpy = True
                 
         units[unit_id] = is_jpy
+
+    # 3. Facts reported in the instance itself: (element, context_id) pairs for period coverage
+    # (see covered_filing_contexts). Needs the element prefixes, i.e. lxml
+    if reported_facts is not None and HAS_LXML:
+        for el in tree.getroot():
+            ctx_ref = el.get('contextRef')
+            if ctx_ref and isinstance(el.tag, str) and el.prefix:
+                reported_facts.add((el.prefix + '_' + etree.QName(el).localname, ctx_ref))
                 
     return contexts, units
 
-def parse_ixbrl_facts(ixbrl_files, contexts, units):
+def parse_ixbrl_facts(ixbrl_files, contexts, units, relevant_elements=None, skip_contexts=None):
+    """Extract nonFraction / nonNumeric facts from Inline XBRL files.
+
+    Args:
+        ixbrl_files: iXBRL sources (paths or BytesIO)
+        contexts: {context_id: (period, dimension, start_date)}
+        units: {unit_id: is_jpy}
+        relevant_elements: Optional set from presentation_relevant_elements. When given,
+                           other facts are skipped before their value is read and
+                           normalized
+        skip_contexts: Optional {context_id: None or element set} (covered_filing_contexts,
+                       unselected_contexts). Facts in these contexts are skipped
+                       (only the listed elements when a set is given)
+
+    DEI / company name facts and EDINET_DOC_ROLE_MAP documents are never skipped.
+
+    Returns:
+        list: Fact dicts
+    """
     t_start = time.time()
     parser_info = 'lxml' if HAS_LXML else 'html.parser'
     debug_log(f"Starting Inline XBRL parsing using {parser_info} for {len(ixbrl_files)} files")
     facts = []
+    skipped_count = 0
+    fallback_doc_codes = tuple(EDINET_DOC_ROLE_MAP)
+
+    def is_skipped(ctx_ref, element_name):
+        if element_name.startswith('jpdei_cor_') or element_name.endswith(COMPANY_NAME_SUFFIXES):
+            return False
+        if relevant_elements is not None and element_name not in relevant_elements:
+            return True
+        if skip_contexts and ctx_ref in skip_contexts:
+            covered = skip_contexts[ctx_ref]
+            return covered is None or element_name in covered
+        return False
     
-    for f in ixbrl_files:
-        size_mb = os.path.getsize(f) / (1024 * 1024)
+    for src in ixbrl_files:
+        f = source_name(src)
+        span = profile_begin('ixbrl_file', file=os.path.basename(f))
+        facts_before = len(facts)
+        # Fallback documents feed the synthetic roles and are never pruned
+        skippable = ((relevant_elements is not None or bool(skip_contexts))
+                     and not os.path.basename(f).startswith(fallback_doc_codes))
+        size_mb = (os.path.getsize(src) if isinstance(src, str) else len(wait_member(src).getbuffer())) / (1024 * 1024)
         debug_log(f"  Parsing {os.path.basename(f)} ({size_mb:.2f} MB)...")
         try:
-            with open(f, 'r', encoding='utf-8', errors='replace') as file:
-                content = file.read()
+            content = read_source_text(src)
             
             if HAS_LXML:
                 try:
@@ -1314,6 +2470,9 @@ def parse_ixbrl_facts(ixbrl_files, contexts, units):
                     if not element_name: continue
                     if ':' in element_name:
                         element_name = element_name.replace(':', '_')
+                    if skippable and is_skipped(ctx_ref, element_name):
+                        skipped_count += 1
+                        continue
                     
                     value = tag.text_content().strip() if hasattr(tag, 'text_content') else (tag.text or "").strip()
                     local_name = tag.tag.split('}')[-1].lower() if isinstance(tag.tag, str) and '}' in tag.tag else (tag.tag.split(':')[-1].lower() if isinstance(tag.tag, str) else "")
@@ -1338,6 +2497,9 @@ def parse_ixbrl_facts(ixbrl_files, contexts, units):
                     if not element_name: continue
                     if ':' in element_name:
                         element_name = element_name.replace(':', '_')
+                    if skippable and is_skipped(ctx_ref, element_name):
+                        skipped_count += 1
+                        continue
                     
                     value = tag.get_text().strip()
                     local_name = tag.name.split(':')[-1].lower()
@@ -1400,7 +2562,10 @@ def parse_ixbrl_facts(ixbrl_files, contexts, units):
 
         except Exception as e:
             debug_log(f"ERROR: Error parsing file {f}: {e}")
+        profile_end(span, facts=len(facts) - facts_before, mb=round(size_mb, 2))
                 
+    if relevant_elements is not None or skip_contexts:
+        debug_log(f"  Skipped {skipped_count} facts (presentation / period pruning)")
     debug_log(f"COMPLETED: Parsed all Inline XBRL facts in {time.time() - t_start:.2f}s")
     return facts
 
@@ -1468,6 +2633,391 @@ def merge_sequences(master, new_seq):
             res.append(item)
     return res
 
+def tag_fact_values(facts, report_std):
+    """Tag parsed facts with their accounting standard and group them by column key.
+
+    Args:
+        facts: Fact dicts from parse_ixbrl_facts
+        report_std: Report-level accounting standard ('JP', 'IFRS', 'US', 'JMIS' or None)
+
+    Returns:
+        tuple: ({element: {(standard, dim_label, period): value}}, set(col_key))
+               '_metadata' holds startDate per col_key for periodStartLabel lookup
+    """
+    values = {}
+    periods = set()
+    for f in facts:
+        el = f['element']
+        period = f['period']
+        dim = f.get('dimension', '')
+        val = f['value']
+        dim_label = dim if dim else "全体"
+        
+        # --- Granular Fact Tagging (V13) ---
+        fact_std = None
+        if el.startswith('jpigp_cor'): fact_std = 'IFRS'
+        elif el.startswith('jppfs_cor'): fact_std = 'JP'
+        elif el.startswith('jpusp_cor'): fact_std = 'US'
+        elif el.startswith('jpmis_cor'): fact_std = 'JMIS'
+        elif el.startswith('jpcrp_cor'):
+            if 'IFRS' in el: fact_std = 'IFRS'
+            elif 'USGAAP' in el: fact_std = 'US'
+            elif 'JMIS' in el: fact_std = 'JMIS'
+            else: fact_std = report_std # fallback to document standard for jpcrp elements (general metadata)
+        else:
+            # Extension elements (e.g. E01766...)
+            fact_std = report_std
+        
+        # Use standard-aware column key to separate identical periods (e.g. 2020 JP vs 2020 IFRS)
+        col_key = (fact_std, dim_label, period)
+        if el not in values: values[el] = {}
+        values[el][col_key] = val
+        periods.add(col_key)
+        # Store extra metadata (startDate) for periodStartLabel lookup
+        if 'start_date' in f:
+            if '_metadata' not in values: values['_metadata'] = {}
+            values['_metadata'][col_key] = f['start_date']
+    return values, periods
+
+# iXBRL documents of the old EDINET format (e.g. 2016-2018) without usable presentation roles.
+# process_xbrl_zips builds synthetic roles from the element order in these files
+# (matched by the leading document code of the file name).
+EDINET_DOC_ROLE_MAP = {
+    '0105010': 'rol_ConsolidatedBalanceSheet',
+    '0105020': 'rol_ConsolidatedStatementOfIncome',
+    '0105025': 'rol_ConsolidatedStatementOfComprehensiveIncome',
+    '0105040': 'rol_ConsolidatedStatementOfChangesInNetAssets',
+    '0105050': 'rol_ConsolidatedStatementOfCashFlows',
+    # Notes and Accounting Policies
+    '0106010': 'rol_NotesAccountingPolicies',
+    '0107010': 'rol_Notes',
+    # Segment Information
+    '0114010': 'rol_SegmentInformation',
+}
+
+# Element suffixes searched (in this order) for the company name of the output file
+COMPANY_NAME_SUFFIXES = ('CompanyNameCoverPage', 'EntityNameCompanyName', 'EntityNameEntityReportingName')
+
+def is_accepted_role(base_name):
+    """Return True if a presentation role (last '_' part of its name) is rendered in the output."""
+    return (base_name.startswith('Consolidated') or base_name.startswith('Statement') or
+            base_name.startswith('BalanceSheet') or base_name.startswith('Notes') or
+            'BusinessResults' in base_name or 'SegmentInformation' in base_name or
+            'AnalysisOfOperatingResults' in base_name)
+
+def presentation_relevant_elements(trees):
+    """Return the set of elements that appear in accepted presentation roles.
+
+    Used with parse_ixbrl_facts(relevant_elements=...) to skip facts that can never
+    reach the output. DEI facts, company name facts and the EDINET_DOC_ROLE_MAP
+    fallback documents are always kept by parse_ixbrl_facts.
+
+    Args:
+        trees: {role: [arc]} from parse_presentation_linkbase
+
+    Returns:
+        set: Element names (parents and children of every arc)
+    """
+    relevant = set()
+    for role, arcs in trees.items():
+        if not is_accepted_role(role.split('_')[-1]):
+            continue
+        for arc in arcs:
+            relevant.add(arc['parent'])
+            relevant.add(arc['child'])
+    return relevant
+
+# Statement types selectable with process_xbrl_zips(statements=...) / --statements
+STATEMENT_TYPES = ('bs', 'pl', 'ci', 'ss', 'cf', 'summary', 'segment', 'notes')
+# Types that exist both consolidated and standalone (process_xbrl_zips(scope=...))
+SCOPED_STATEMENT_TYPES = ('bs', 'pl', 'ci', 'ss', 'cf', 'summary')
+
+def role_statement_type(base_name):
+    """Classify a presentation role (last '_' part of its name) into STATEMENT_TYPES, or None."""
+    if 'SegmentInformation' in base_name or 'AnalysisOfOperatingResults' in base_name:
+        return 'segment'
+    if 'BusinessResults' in base_name:
+        return 'summary'
+    if base_name.startswith('Notes'):
+        return 'notes'
+    if 'BalanceSheet' in base_name or 'FinancialPosition' in base_name:
+        return 'bs'
+    if 'CashFlows' in base_name:
+        return 'cf'
+    if 'ChangesInEquity' in base_name or 'ChangesInNetAssets' in base_name:
+        return 'ss'
+    if 'ComprehensiveIncome' in base_name and 'ProfitOrLossAnd' not in base_name and 'IncomeAnd' not in base_name:
+        return 'ci'
+    if 'StatementOfIncome' in base_name or 'ProfitOrLoss' in base_name:
+        return 'pl'
+    return None
+
+def role_is_consolidated(base_name):
+    """Return True for consolidated roles (same rule as the Excel sheet columns)."""
+    return (('Consolidated' in base_name and 'NonConsolidated' not in base_name)
+            or 'Group' in base_name or 'SummaryOfBusinessResults' in base_name)
+
+def role_selected(base_name, statements=None, scope=None):
+    """Return True if a role passes the statement type / consolidation scope selection.
+
+    Args:
+        base_name: Last '_' part of the role name
+        statements: Iterable of STATEMENT_TYPES to keep (None: all)
+        scope: 'consolidated', 'standalone' or None (both). Only applies to
+               SCOPED_STATEMENT_TYPES; notes and segments are kept as they are
+    """
+    statement_type = role_statement_type(base_name)
+    if statements is not None and statement_type not in statements:
+        return False
+    if scope and statement_type in SCOPED_STATEMENT_TYPES:
+        return role_is_consolidated(base_name) == (scope == 'consolidated')
+    return True
+
+def latest_report_period(contexts):
+    """Latest period (end date) of a filing's contexts, ignoring the DEI filing date contexts."""
+    periods = [p for ctx_id, (p, _dim, _start) in contexts.items() if not ctx_id.startswith('FilingDate')]
+    return max(periods) if periods else None
+
+def period_window_start(latest, years):
+    """Exclusive lower bound of a window of `years` fiscal years ending at `latest` ('YYYY-MM-DD')."""
+    return f"{int(latest[:4]) - years}{latest[4:]}"
+
+def scope_only_elements(trees):
+    """Elements that appear only in SCOPED_STATEMENT_TYPES roles of a filing.
+
+    Their standalone facts cannot appear in a consolidated-only output; elements that
+    notes, segments or other roles also use keep their standalone facts.
+    """
+    scoped, other = set(), set()
+    for role, arcs in trees.items():
+        base_name = role.split('_')[-1]
+        if not is_accepted_role(base_name):
+            continue
+        target = scoped if role_statement_type(base_name) in SCOPED_STATEMENT_TYPES else other
+        for arc in arcs:
+            target.add(arc['parent'])
+            target.add(arc['child'])
+    return frozenset(scoped - other)
+
+def unselected_contexts(contexts, scope=None, years=None, trees=None):
+    """Contexts whose facts cannot appear in the selected output.
+
+    Periods before the last `years` fiscal years of the filing itself are dropped entirely
+    (a later filing can only narrow the window further; process_xbrl_zips trims the merged
+    values to the final window). For scope='consolidated', standalone ('単体') contexts
+    are dropped only for the elements of the filing's presentation trees that appear
+    solely in SCOPED_STATEMENT_TYPES roles (scope_only_elements), since notes and segments
+    are kept regardless of scope (role_selected).
+
+    Returns:
+        dict: {context_id: None (skip every fact) or frozenset(element) (skip these)}
+    """
+    start = None
+    if years:
+        latest = latest_report_period(contexts)
+        start = period_window_start(latest, years) if latest else None
+    standalone_elements = scope_only_elements(trees or {}) if scope == 'consolidated' else None
+    skipped = {}
+    for ctx_id, (period, dim, _start) in contexts.items():
+        if ctx_id.startswith('FilingDate'):
+            continue
+        if start and period <= start:
+            skipped[ctx_id] = None
+        elif standalone_elements and dim == '単体':
+            skipped[ctx_id] = standalone_elements
+    return skipped
+
+def merge_skip_contexts(skip_contexts, more):
+    """Add the {context_id: None or element set} entries of more to skip_contexts (in place)."""
+    for ctx_id, elements in more.items():
+        if ctx_id not in skip_contexts:
+            skip_contexts[ctx_id] = elements
+        elif skip_contexts[ctx_id] is not None:
+            skip_contexts[ctx_id] = None if elements is None else skip_contexts[ctx_id] | elements
+    return skip_contexts
+
+def covered_filing_contexts(filings, fill_gaps=False):
+    """Find the contexts of each filing that newer filings already cover.
+
+    Every annual report repeats the prior year's figures, and the merge keeps the value
+    of the newest filing for a column. A context is covered when a newer filing of the
+    same accounting standard has a context with the same period (end / start date) and
+    dimension, so older filings can skip its facts while parsing. Newer means a strictly
+    later report period (latest_report_period): filings of the same period (e.g. an
+    amended report and the original) never cover each other, so the merge still sees
+    both values and applies its precision tie-break.
+
+    Args:
+        filings: [(report_std, contexts, reported_facts, report_period)] in merge order
+                 (newest first). reported_facts is the set of (element, context_id) pairs
+                 from parse_instance_contexts_and_units (only used with fill_gaps)
+        fill_gaps: Skip only the elements a newer filing actually reports in the covered
+                   period, so that values missing there are still filled from older filings
+
+    Returns:
+        list: Per filing {context_id: None (skip every fact) or frozenset(element)}
+    """
+    seen = []  # [(report_period, {(std, period, dim, start_date): set(element)})] of earlier filings
+    result = []
+    for report_std, contexts, reported_facts, report_period in filings:
+        ctx_keys = {ctx_id: (report_std, p, d, start) for ctx_id, (p, d, start) in contexts.items()}
+        newer = [own for period, own in seen if report_period and period and period > report_period]
+        covered = {}
+        for ctx_id, key in ctx_keys.items():
+            reported = [own[key] for own in newer if key in own]
+            if reported:
+                # New objects: the sets of later filings are not shared
+                covered[ctx_id] = frozenset().union(*reported) if fill_gaps else None
+        result.append(covered)
+        own = {key: set() for key in ctx_keys.values()}
+        if fill_gaps:
+            for element, ctx_id in reported_facts:
+                if ctx_id in ctx_keys:
+                    own[ctx_keys[ctx_id]].add(element)
+        seen.append((report_period, own))
+    return result
+
+_RE_EDINET_CODE = re.compile(r'_(E\d{5})-')
+
+def detect_edinet_code(facts, xbrl_path=None):
+    """Return the filer's EDINET code (e.g. 'E01766') from DEI facts or the instance file name."""
+    for f in facts:
+        if f['element'].endswith('EDINETCodeDEI') and f['value']:
+            return f['value'].strip()
+    if xbrl_path:
+        m = _RE_EDINET_CODE.search(os.path.basename(xbrl_path))
+        if m:
+            return m.group(1)
+    return None
+
+# ----------------------------------------------------------------------------
+# Filing inspection (--inspect / web /inspect)
+# ----------------------------------------------------------------------------
+# ZIPの中央ディレクトリ、manifest、表紙のDEI、プレゼンテーションのロールURIだけを読み、
+# ラベル辞書の構築やファクト抽出は行わない（1ZIPあたり数十ミリ秒）
+
+_RE_PRESENTATION_ROLE = re.compile(r'<(?:[\w-]+:)?presentationLink\b[^>]*?\brole="([^"]+)"')
+
+def read_cover_facts(src):
+    """DEI and company name facts of an iXBRL document: {element: value} (first value wins)."""
+    content = read_source_text(src)
+    facts = {}
+    if HAS_LXML:
+        from lxml import html
+        tree = html.fromstring(content, parser=html.HTMLParser(no_network=True))
+        tags = [(t.get('name'), t) for t in tree.iter()
+                if isinstance(t.tag, str) and t.tag.lower().endswith(('nonnumeric', 'nonfraction'))]
+        text_of = lambda t: t.text_content()
+    else:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(content, 'html.parser')
+        tags = [(t.get('name'), t) for t in soup.find_all(
+            lambda t: t.name and t.name.split(':')[-1].lower() in ('nonnumeric', 'nonfraction'))]
+        text_of = lambda t: t.get_text()
+    for name, tag in tags:
+        if not name:
+            continue
+        name = name.replace(':', '_')
+        if name.startswith('jpdei_cor_') or name.endswith(COMPANY_NAME_SUFFIXES):
+            facts.setdefault(name, text_of(tag).strip())
+    return facts
+
+def inspect_filing(zip_path):
+    """Summarize an EDINET ZIP without converting it.
+
+    Reads the ZIP central directory, the manifest, the DEI facts of the cover iXBRL document
+    and the role URIs of the presentation linkbase only.
+
+    Args:
+        zip_path: ZIP path or seekable file-like object (see process_xbrl_zips)
+
+    Returns:
+        dict: file, edinet_code, company_name, document_type, accounting_standards (DEI),
+              report_std, taxonomy_year, fiscal_year_start / fiscal_year_end, period_end,
+              consolidated (DEI), statements (STATEMENT_TYPES found), roles
+              ([{role, statement, consolidated}]), members, uncompressed_size.
+              On failure only file and error
+    """
+    t_start = time.time()
+    result = {'file': os.path.basename(zip_source_name(zip_path))}
+    try:
+        with zipfile.ZipFile(rewind_source(zip_path), 'r') as zip_ref:
+            check_zip_bomb(zip_ref)
+            infos = {info.filename.replace('\\', '/'): info for info in zip_ref.infolist() if not info.is_dir()}
+
+            def read_member(name):
+                buf = io.BytesIO(zip_ref.read(infos[name]))
+                buf.name = name
+                return buf
+
+            # Member names stand in for the sources: find_xbrl_files only matches names
+            files = find_xbrl_files({name: name for name in infos})
+            if not files:
+                result['error'] = 'XBRL instance / presentation linkbase not found'
+                return result
+            pre_name, ixbrl_names = files['pre'], files['ixbrl']
+            if files['manifest'] is not None:
+                manifest_dir = files['manifest'].rpartition('/')[0]
+                prefix = manifest_dir + '/' if manifest_dir else ''
+                for instance_name, manifest_ixbrl in read_filing_manifest(read_member(files['manifest']))[:1]:
+                    stem = instance_name[:-len('.xbrl')] if instance_name.lower().endswith('.xbrl') else instance_name
+                    if prefix + stem + '_pre.xml' in infos:
+                        pre_name = prefix + stem + '_pre.xml'
+                    ixbrl_names = [prefix + n for n in manifest_ixbrl if prefix + n in infos] or ixbrl_names
+
+            pre_text = read_source_text(read_member(pre_name))
+            cover = read_member(ixbrl_names[0]) if ixbrl_names else None
+            dei = read_cover_facts(cover) if cover is not None else {}
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+
+    def dei_value(suffix):
+        for name, value in dei.items():
+            if name.endswith(suffix) and value:
+                return value
+        return None
+
+    m = _RE_TAXONOMY_YEAR.search(pre_text[:4000])
+    taxonomy_year = ('2021' if m.group(1) == '2020' else m.group(1)) if m else None
+    search_content = pre_text[:40000].lower()
+    if cover is not None:
+        search_content += read_source_head(cover, 40000).lower()
+
+    roles = []
+    for role_uri in dict.fromkeys(_RE_PRESENTATION_ROLE.findall(pre_text)):
+        role_name = role_uri.split('/')[-1]
+        base_name = role_name.split('_')[-1]
+        if not is_accepted_role(base_name) and not is_jumbo_role(role_name):
+            continue
+        roles.append({'role': role_name, 'statement': role_statement_type(base_name),
+                      'consolidated': role_is_consolidated(base_name)})
+
+    consolidated = dei_value('WhetherConsolidatedFinancialStatementsArePreparedDEI')
+    company_name = None
+    for suffix in COMPANY_NAME_SUFFIXES + ('FilerNameInJapaneseDEI',):
+        company_name = dei_value(suffix)
+        if company_name:
+            break
+    result.update({
+        'edinet_code': dei_value('EDINETCodeDEI') or detect_edinet_code([], files['xbrl']),
+        'company_name': company_name,
+        'document_type': dei_value('DocumentTypeDEI'),
+        'accounting_standards': dei_value('AccountingStandardsDEI'),
+        'report_std': sniff_report_std(search_content),
+        'taxonomy_year': taxonomy_year,
+        'fiscal_year_start': dei_value('CurrentFiscalYearStartDateDEI'),
+        'fiscal_year_end': dei_value('CurrentFiscalYearEndDateDEI'),
+        'period_end': dei_value('CurrentPeriodEndDateDEI'),
+        'consolidated': None if consolidated is None else consolidated.strip().lower() in ('true', 'あり', '有'),
+        'statements': sorted({r['statement'] for r in roles if r['statement']}, key=STATEMENT_TYPES.index),
+        'roles': roles,
+        'members': len(infos),
+        'uncompressed_size': sum(info.file_size for info in infos.values()),
+    })
+    debug_log(f"Inspected {result['file']} in {time.time() - t_start:.3f}s")
+    return result
+
 # ============================================================================
 # CORE LAYER - Main Processing Pipeline
 # ============================================================================
@@ -1499,33 +3049,104 @@ def merge_sequences(master, new_seq):
 # 3. if文による分岐はStrategy Patternで解決（特にExcel層）
 # ============================================================================
 
-def process_xbrl_zips(zip_paths, output_dir=None):
-    overall_start = time.time()
-    if not zip_paths:
-        return None
-    zip_paths = sorted(zip_paths)
-        
-    global HAS_PANDAS, HAS_OPENPYXL
-    # Delay loading heavy libraries inside the function
-    try:
-        import pandas as pd
-        HAS_PANDAS = True
-    except ImportError:
-        pd = None
-        HAS_PANDAS = False
+def process_xbrl_zips(zip_paths, output_dir=None, output_format='excel', warehouse=None, edinet_codes=None,
+                      save_state=False, update_workbook=None, progress_callback=None, prune_facts=False,
+                      skip_covered_periods=False, fill_period_gaps=False, statements=None, scope=None,
+                      years=None):
+    """Convert EDINET XBRL ZIPs and write the result with the selected output backend.
+
+    Args:
+        zip_paths: List of EDINET ZIP files: paths or seekable file-like objects
+                   (e.g. spooled uploads; named by .filename or .name). ZIPs are read
+                   in memory and never extracted to disk
+        output_dir: Directory for the output file (default: current directory)
+        output_format: Key of OUTPUT_BACKENDS ('excel', 'csv', 'parquet')
+        warehouse: Path of a SQLite fact warehouse. When given, only ZIPs not yet
+                   ingested are parsed, and the output is rendered from every filing
+                   in the warehouse of the same companies (see WAREHOUSE LAYER)
+        edinet_codes: Additional EDINET codes to render from the warehouse
+                      (allows rendering without any ZIP)
+        save_state: Save a sidecar state file (<output>.state.db) next to the output
+                    so that new filings can later be merged with update_workbook
+        update_workbook: Path of a workbook generated with save_state. The given ZIPs
+                         are merged into its sidecar state and only sheets whose
+                         content changed are regenerated in place
+        progress_callback: Optional callable(phase, done, total) called when a phase
+                           starts ('parse', 'merge', 'hierarchy', 'output') and after
+                           each parsed ZIP (phase 'parse'). May be called from worker threads
+        prune_facts: Skip facts of elements outside the accepted presentation roles
+                     while parsing (see presentation_relevant_elements). Faster on large
+                     filings; periods that only occur in skipped facts get no column.
+                     Cannot be combined with warehouse / save_state / update_workbook
+        skip_covered_periods: Skip facts of older filings in periods (period, dimension,
+                              standard) that a newer filing of the upload already reports
+                              (see covered_filing_contexts). Same restrictions as prune_facts
+        fill_period_gaps: With skip_covered_periods, skip only the elements the newer
+                          filing reports, so values it lacks are still taken from older filings
+        statements: Statement types to convert (subset of STATEMENT_TYPES, None: all).
+                    Other presentation roles are skipped while parsing and their facts
+                    are not extracted
+        scope: 'consolidated' or 'standalone' statements only (None: both), see role_selected
+        years: Keep only the last N fiscal years (facts of older periods are skipped
+               while parsing)
+
+    Returns:
+        str | None: Path of the written output file, or None on failure
+    """
+    overall_start = time.time()
+    reset_log_counts()
 
-    try:
-        from openpyxl import Workbook
-        from openpyxl.utils.dataframe import dataframe_to_rows
-        HAS_OPENPYXL = True
-    except ImportError:
-        Workbook = None
-        HAS_OPENPYXL = False
+    def report_progress(phase, done=None, total=None):
+        if progress_callback:
+            try:
+                progress_callback(phase, done, total)
+            except Exception as e:
+                debug_log(f"Progress callback failed: {e}")
 
-    if not HAS_OPENPYXL:
-        print("Error: openpyxl is not installed. Excel generation is impossible.", file=sys.stderr)
+    if not zip_paths and not (warehouse and edinet_codes) and not update_workbook:
         return None
-        
+    if output_format not in OUTPUT_BACKENDS:
+        raise ValueError(f"Unknown output format: {output_format} (choose from {', '.join(OUTPUT_BACKENDS)})")
+    if warehouse and (save_state or update_workbook):
+        raise ValueError("warehouse cannot be combined with save_state / update_workbook")
+    if update_workbook and output_format != 'excel':
+        raise ValueError("update_workbook requires the excel output format")
+    if (prune_facts or skip_covered_periods) and (warehouse or save_state or update_workbook):
+        # Stored filings must keep every fact so that later renders are complete
+        raise ValueError("prune_facts / skip_covered_periods cannot be combined with warehouse / save_state / update_workbook")
+    if fill_period_gaps and not skip_covered_periods:
+        raise ValueError("fill_period_gaps requires skip_covered_periods")
+    if statements is not None:
+        statements = set(statements)
+        unknown = statements - set(STATEMENT_TYPES)
+        if unknown or not statements:
+            raise ValueError(f"Unknown statement types: {', '.join(sorted(unknown)) or '(none)'} (choose from {', '.join(STATEMENT_TYPES)})")
+    if scope not in (None, 'consolidated', 'standalone'):
+        raise ValueError(f"Unknown scope: {scope} (choose from consolidated, standalone)")
+    if years is not None and years < 1:
+        raise ValueError("years must be a positive number")
+    if (statements is not None or scope or years) and (warehouse or save_state or update_workbook):
+        # Stored filings must keep every fact so that later renders are complete
+        raise ValueError("statements / scope / years cannot be combined with warehouse / save_state / update_workbook")
+    role_filter = None
+    if statements is not None or scope:
+        def role_filter(base_name):
+            return role_selected(base_name, statements, scope)
+
+    # The sidecar state is a per-workbook fact warehouse holding every merged filing
+    state_path = None
+    if update_workbook:
+        state_path = workbook_state_path(update_workbook)
+        if not os.path.exists(state_path):
+            print(f"Error: State file not found: {state_path} (convert with --save-state first)", file=sys.stderr)
+            return None
+        warehouse = state_path
+    elif save_state:
+        fd, state_path = tempfile.mkstemp(suffix='.state.db', dir=output_dir or os.getcwd())
+        os.close(fd)
+        warehouse = state_path
+    zip_paths = sorted(zip_paths, key=zip_source_name)
+
     global_element_period_values = {} # {element: {col_key: value}}
     merged_trees = {} # {role_name: {(parent, child): order}}
     seen_children_in_role = {} # {role_name: set(children)}
@@ -1535,10 +3156,10 @@ def process_xbrl_zips(zip_paths, output_dir=None):
     
     periods_seen = set()
     all_facts = []  # Accumulate facts across all zips for fallback logic
-
-    # Use provided output_dir for temp files if possible to avoid permission issues in /tmp
-    parent_temp_dir = output_dir if output_dir and os.path.exists(output_dir) else None
-    temp_base = tempfile.mkdtemp(dir=parent_temp_dir)
+    wh_conn = None
+    # Set before the try: a failure during parsing or the warehouse step still reaches the merge timing below
+    t_merge_start = time.time()
+    merge_span = None
 
     try:
         # ========================================================================
@@ -1547,7 +3168,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
         # 【将来の分割先】load_phase() + parse_phase()
         #
         # 処理内容:
-        # - 各ZIPファイルを並列で展開
+        # - 各ZIPファイルから必要なメンバーだけをメモリに読み込む（ディスクへは展開しない）
         # - XBRLファイル（presentation, instance, iXBRL）を検出
         # - タクソノミラベルを取得
         # - プレゼンテーション階層、コンテキスト、事実値を解析
@@ -1559,102 +3180,60 @@ def process_xbrl_zips(zip_paths, output_dir=None):
         # ========================================================================
         from concurrent.futures import ThreadPoolExecutor
         
-        def process_single_zip(zip_idx, zip_path):
-            thread_labels = {}
-            thread_priorities = {}
-            thread_facts = []
-            thread_periods = set()
-            thread_values = {} # {el: {col: val}}
+        def prepare_single_zip(zip_path):
+            # Layered label maps: ChainMap(per-filing overlay, shared standard labels of the year).
+            # Writes go to the overlay only; the standard labels are never copied or mutated.
+            thread_labels = ChainMap({}, {})
+            thread_priorities = ChainMap({}, {})
             
-            debug_log(f"Starting worker for {os.path.basename(zip_path)}")
-            if not os.path.exists(zip_path):
+            zip_name = os.path.basename(zip_source_name(zip_path))
+            debug_log(f"Starting worker for {zip_name}")
+            if isinstance(zip_path, str) and not os.path.exists(zip_path):
                 return None
                 
-            extract_dir = os.path.join(temp_base, f"zip_{zip_idx}")
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # Check for ZIP bomb before extraction
+            # zip_path may be a path or a seekable file-like object (e.g. a spooled upload)
+            span = profile_begin('extract')
+            with zipfile.ZipFile(rewind_source(zip_path), 'r') as zip_ref:
+                # Check for ZIP bomb before reading
                 check_zip_bomb(zip_ref)
 
-                # Selective extraction: only extract files we actually need
+                # Selective in-memory read: only the files we actually need
                 # This significantly reduces I/O for large EDINET ZIPs (2000+ files)
-                for info in zip_ref.infolist():
-                    filename_lower = info.filename.lower()
-
-                    # Skip directories
-                    if info.is_dir():
-                        continue
-
-                    # Extract only necessary files:
-                    # 1. Japanese label linkbases (exclude English versions)
-                    # 2. Presentation linkbases
-                    # 3. XBRL instance files
-                    # 4. iXBRL HTML files (in PublicDoc only, skip AuditDoc)
-                    # 5. manifest.xml (for metadata)
-                    should_extract = (
-                        (filename_lower.endswith('_lab.xml') and not filename_lower.endswith('_lab-en.xml')) or
-                        filename_lower.endswith('_pre.xml') or
-                        filename_lower.endswith('.xbrl') or
-                        (filename_lower.endswith(('.htm', '.html')) and 'publicdoc' in filename_lower) or
-                        filename_lower.endswith('manifest.xml')
-                    )
-
-                    if should_extract:
-                        # Normalize Windows backslashes in paths
-                        info.filename = info.filename.replace('\\', '/')
-                        # Path validation to prevent Zip Slip
-                        target_path = os.path.join(extract_dir, info.filename)
-                        validate_zip_path(target_path, extract_dir)
-                        zip_ref.extract(info, extract_dir)
-                
-            subdirs = [d for d in os.listdir(extract_dir) if os.path.isdir(os.path.join(extract_dir, d))]
-            if len(subdirs) == 1:
-                extract_dir = os.path.join(extract_dir, subdirs[0])
-                
-            xbrl_files = find_xbrl_files(extract_dir)
+                members = read_zip_members(zip_ref, zip_path)
+            profile_end(span, members=len(members))
+            # The iXBRL documents keep inflating in the background: stop them on every path that
+            # does not hand the members on, since the caller may close an uploaded source next
+            try:
+                prep = prepare_members(zip_name, members, thread_labels, thread_priorities)
+            except BaseException:
+                close_zip_members(members)
+                raise
+            if prep is None:
+                close_zip_members(members)
+            return prep
+
+        def prepare_members(zip_name, members, thread_labels, thread_priorities):
+            # Filing metadata stage: documents, taxonomy year and standard in one pass
+            span = profile_begin('locate')
+            xbrl_files = locate_filing(members)
+            profile_end(span)
             if not xbrl_files:
                 return None
-                
-            taxonomy_year = None
-            if xbrl_files['pre']:
-                with open(xbrl_files['pre'], 'r', encoding='utf-8') as f:
-                    content = f.read(4000)
-                    m = _RE_TAXONOMY_YEAR.search(content)
-                    if m:
-                        year_str = m.group(1)
-                        taxonomy_year = '2021' if year_str == '2020' else year_str
-            
+
+            taxonomy_year = xbrl_files['taxonomy_year']
             if taxonomy_year:
+                span = profile_begin('taxonomy_load', year=taxonomy_year)
                 # Auto-update edinet_taxonomy_dict.py if XBRL references a newer taxonomy year
                 check_and_update_edinet_taxonomy(taxonomy_year)
                 std_labels, std_priorities = get_standard_labels(taxonomy_year)
-                thread_labels.update(std_labels)
-                thread_priorities.update(std_priorities)
-
-            # --- NEW: Detect Report-Level Accounting Standard (V13) ---
-            report_std = None # Default: None (don't assume until detected)
-            # Use list append + join for efficient string concatenation
-            search_content_parts = []
-            if xbrl_files.get('pre'):
-                with open(xbrl_files['pre'], 'r', encoding='utf-8', errors='ignore') as f:
-                    search_content_parts.append(f.read(40000).lower()) # Increased context
-            if xbrl_files.get('ixbrl'):
-                # Check first iXBRL file for standard indicators
-                with open(xbrl_files['ixbrl'][0], 'r', encoding='utf-8', errors='ignore') as f:
-                    search_content_parts.append(f.read(40000).lower())
-            search_content = ''.join(search_content_parts)
-            
-            if 'jpigp' in search_content or 'ifrs.org' in search_content or 'ifrs-full' in search_content: 
-                report_std = 'IFRS'
-            elif 'jpusp' in search_content or 'us-gaap' in search_content: 
-                report_std = 'US'
-            elif 'jpmis' in search_content: 
-                report_std = 'JMIS'
-            elif 'jppfs' in search_content:
-                report_std = 'JP'
-            
-            debug_log(f"  [DEBUG] Report standard detected as: {report_std} (from pre/ixbrl content)")
-
-
+                thread_labels.maps[1] = std_labels
+                thread_priorities.maps[1] = std_priorities
+                profile_end(span, labels=len(std_labels))
+
+            # Labels layered on top of the standard taxonomy labels: {element: (label, priority)}
+            # (kept separately so the warehouse can store them without the shared standard labels)
+            span = profile_begin('label_parse')
+            overlay_labels = {}
             for lf in xbrl_files.get('lab', []):
                 local_labels, local_priorities = parse_labels_file(lf)
                 for k, v in local_labels.items():
@@ -1662,124 +3241,220 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                     if k not in thread_labels or p < thread_priorities.get(k, 100):
                         thread_labels[k] = v
                         thread_priorities[k] = p
+                        overlay_labels[k] = (v, p)
             
             # Phase 2: Demote IFRS mapping priority
             for el_name, alias in IFRS_LABEL_MAPPING.items():
                 if el_name not in thread_labels or 20 < thread_priorities.get(el_name, 100):
                     thread_labels[el_name] = alias
                     thread_priorities[el_name] = 20
+                    overlay_labels[el_name] = (alias, 20)
             
-            contexts, units = parse_instance_contexts_and_units(xbrl_files['xbrl'], thread_labels)
-            
-            # Phase 3: Selective Parsing (Case-insensitive extension and dual format support)
-            public_doc_dir = os.path.dirname(xbrl_files['xbrl'])
-            all_files = os.listdir(public_doc_dir)
-            ix_files = []
-            for f in all_files:
-                fl = f.lower()
-                if '_ixbrl' in fl and (fl.endswith('.htm') or fl.endswith('.html')):
-                    ix_files.append(os.path.join(public_doc_dir, f))
-            ix_files = sorted(ix_files)
-
-            facts = parse_ixbrl_facts(ix_files, contexts, units) # Corrected: pass units, not labels
-            thread_facts.extend(facts)
-            debug_log(f"Worker for {os.path.basename(zip_path)} found {len(facts)} facts in {len(ix_files)} files")
-            
-            for f in facts:
-                el = f['element']
-                period = f['period']
-                dim = f.get('dimension', '')
-                val = f['value']
-                dim_label = dim if dim else "全体"
-                
-                # --- Granular Fact Tagging (V13) ---
-                fact_std = None
-                if el.startswith('jpigp_cor'): fact_std = 'IFRS'
-                elif el.startswith('jppfs_cor'): fact_std = 'JP'
-                elif el.startswith('jpusp_cor'): fact_std = 'US'
-                elif el.startswith('jpmis_cor'): fact_std = 'JMIS'
-                elif el.startswith('jpcrp_cor'):
-                    if 'IFRS' in el: fact_std = 'IFRS'
-                    elif 'USGAAP' in el: fact_std = 'US'
-                    elif 'JMIS' in el: fact_std = 'JMIS'
-                    else: fact_std = report_std # fallback to document standard for jpcrp elements (general metadata)
-                else:
-                    # Extension elements (e.g. E01766...)
-                    fact_std = report_std
-                
-                # Use standard-aware column key to separate identical periods (e.g. 2020 JP vs 2020 IFRS)
-                col_key = (fact_std, dim_label, period)
-                if el not in thread_values: thread_values[el] = {}
-                thread_values[el][col_key] = val
-                thread_periods.add(col_key)
-                # Store extra metadata (startDate) for periodStartLabel lookup
-                if 'start_date' in f:
-                    if '_metadata' not in thread_values: thread_values['_metadata'] = {}
-                    thread_values['_metadata'][col_key] = f['start_date']
-                
-            trees = parse_presentation_linkbase(xbrl_files['pre'])
-            
+            # Built once per filing: the shared base index plus this filing's overlay suffixes
+            suffix_index = build_suffix_index(thread_labels)
+            profile_end(span, files=len(xbrl_files.get('lab', [])), labels=len(overlay_labels))
+            reported_facts = set() if skip_covered_periods and fill_period_gaps else None
+            span = profile_begin('contexts')
+            contexts, units = parse_instance_contexts_and_units(xbrl_files['xbrl'], thread_labels, suffix_index,
+                                                                reported_facts)
+            profile_end(span, contexts=len(contexts), units=len(units))
+            # Statement selection: unselected roles are skipped while parsing
+            span = profile_begin('presentation')
+            trees = parse_presentation_linkbase(xbrl_files['pre'], role_filter)
+            profile_end(span, roles=len(trees), arcs=sum(len(arcs) for arcs in trees.values()))
+
             return {
+                'zip_name': zip_name,
+                'xbrl_files': xbrl_files,
                 'labels': thread_labels,
                 'priorities': thread_priorities,
-                'facts': thread_facts,
+                'overlay_labels': overlay_labels,
+                'suffix_index': suffix_index,
+                'contexts': contexts,
+                'units': units,
+                'reported_facts': reported_facts,
+                'trees': trees,
+                'members': members,
+            }
+
+        def process_single_zip(zip_idx, zip_path, prepared=None, covered_contexts=None):
+            prep = prepared if prepared is not None else prepare_single_zip(zip_path)
+            if not prep:
+                return None
+            try:
+                return parse_filing_facts(prep, covered_contexts)
+            finally:
+                # Members the manifest does not list (or left unread after an error) stop inflating
+                close_zip_members(prep['members'])
+
+        def parse_filing_facts(prep, covered_contexts):
+            xbrl_files = prep['xbrl_files']
+            zip_name = prep['zip_name']
+            report_std = xbrl_files['report_std']
+            trees = prep['trees']
+
+            # Phase 3: Selective Parsing (iXBRL files next to the instance, in manifest order)
+            ix_files = xbrl_files['ixbrl']
+
+            # Fact pruning: skip facts of elements that no accepted (and selected) role can render,
+            # and facts in periods covered by newer filings or outside the selection
+            relevant_elements = presentation_relevant_elements(trees) if prune_facts or role_filter else None
+            skip_contexts = dict(covered_contexts or {})
+            if scope or years:
+                merge_skip_contexts(skip_contexts, unselected_contexts(prep['contexts'], scope, years, trees))
+
+            span = profile_begin('ixbrl_facts', files=len(ix_files))
+            facts = parse_ixbrl_facts(ix_files, prep['contexts'], prep['units'], relevant_elements,
+                                      skip_contexts) # Corrected: pass units, not labels
+            profile_end(span, facts=len(facts))
+            debug_log(f"Worker for {zip_name} found {len(facts)} facts in {len(ix_files)} files")
+            
+            span = profile_begin('tag_values')
+            thread_values, thread_periods = tag_fact_values(facts, report_std)
+            profile_end(span, elements=len(thread_values), periods=len(thread_periods))
+            
+            return {
+                'labels': prep['labels'],
+                'priorities': prep['priorities'],
+                'facts': facts,
                 'periods': thread_periods,
                 'values': thread_values,
                 'trees': trees,
                 'member_seq': [], # Will fill below
-                'year': taxonomy_year,
-                'report_std': report_std
+                'year': xbrl_files['taxonomy_year'],
+                'report_std': report_std,
+                'overlay_labels': prep['overlay_labels'],
+                'suffix_index': prep['suffix_index'],
+                'latest_period': latest_report_period(prep['contexts']),
+                'edinet_code': detect_edinet_code(facts, source_name(xbrl_files['xbrl']))
             }
 
         # Multi-threading for performance (I/O and C-based lxml parsing)
         # Use a maximum of 4 workers to avoid memory exhaustion in CGI
         t_parallel_start = time.time()
-        with ThreadPoolExecutor(max_workers=min(len(zip_paths), 4)) as executor:
-            def process_single_zip_wrapper(p):
-                try:
-                    res = process_single_zip(p[0], p[1])
-                    if res:
-                        # Build suffix index for O(1) label lookups
-                        res_suffix_index = build_suffix_index(res['labels'])
-
-                        # Identify segment members in order from trees
-                        local_seq = []
-                        for role_name, arcs in res['trees'].items():
-                            rn_lower = role_name.lower()
-                            # Broaden detection to include Japanese terms and variants
-                            if 'segment' in rn_lower or 'セグメント' in role_name or '事業' in role_name:
-                                items = create_hierarchy(arcs)
-                                for el, path, depth, pref in items:
-                                    parts = el.split('_')
-                                    base = parts[-1]
-                                    label = None
-                                    if base in COMMON_DIMENSION_MAPPING:
-                                        label = COMMON_DIMENSION_MAPPING[base]
-                                    else:
-                                        for pr in ['', 'jpcrp_cor_', 'jppfs_cor_', 'jpigp_cor_', 'jpcrp030000-asr_']:
-                                            if pr + base in res['labels']:
-                                                label = res['labels'][pr + base]
-                                                break
-                                        
-                                        if not label and base in res_suffix_index:
-                                            # Use suffix index for O(1) lookup of company-specific members
-                                            _, label = res_suffix_index[base]
-                                    if label:
-                                        label = clean_label(label)
-                                        # Skip '全体' and headings that are likely just grouping nodes
-                                        if label not in local_seq and label != '全体' and not el.endswith('Abstract') and not el.endswith('Heading'):
-                                            local_seq.append(label)
-                        res['member_seq'] = local_seq
-                    return res
-                except Exception as e:
-                    debug_log(f"Worker failed for {p[1]}: {e}")
-                    return None
-            results = list(executor.map(process_single_zip_wrapper, enumerate(zip_paths)))
+        parse_progress_lock = Lock()
+        parsed_count = [0]
+        def process_single_zip_wrapper(p):
+            try:
+                with profile_span('zip', zip=os.path.basename(zip_source_name(p[1]))) as counts:
+                    res = process_single_zip(*p)
+                    counts['facts'] = len(res['facts']) if res else 0
+                if res:
+                    # Suffix index for O(1) label lookups (built by the worker)
+                    res_suffix_index = res['suffix_index']
+
+                    # Identify segment members in order from trees
+                    local_seq = []
+                    for role_name, arcs in res['trees'].items():
+                        rn_lower = role_name.lower()
+                        # Broaden detection to include Japanese terms and variants
+                        if 'segment' in rn_lower or 'セグメント' in role_name or '事業' in role_name:
+                            items = create_hierarchy(arcs)
+                            for el, path, depth, pref in items:
+                                parts = el.split('_')
+                                base = parts[-1]
+                                label = None
+                                if base in COMMON_DIMENSION_MAPPING:
+                                    label = COMMON_DIMENSION_MAPPING[base]
+                                else:
+                                    for pr in ['', 'jpcrp_cor_', 'jppfs_cor_', 'jpigp_cor_', 'jpcrp030000-asr_']:
+                                        if pr + base in res['labels']:
+                                            label = res['labels'][pr + base]
+                                            break
+                                    
+                                    if not label and base in res_suffix_index:
+                                        # Use suffix index for O(1) lookup of company-specific members
+                                        label = res['labels'][res_suffix_index[base]]
+                                if label:
+                                    label = clean_label(label)
+                                    # Skip '全体' and headings that are likely just grouping nodes
+                                    if label not in local_seq and label != '全体' and not el.endswith('Abstract') and not el.endswith('Heading'):
+                                        local_seq.append(label)
+                    res['member_seq'] = local_seq
+                return res
+            except Exception as e:
+                debug_log(f"Worker failed for {zip_source_name(p[1])}: {e}")
+                return None
+            finally:
+                with parse_progress_lock:
+                    parsed_count[0] += 1
+                    report_progress('parse', parsed_count[0], len(zip_jobs))
+
+        # Warehouse mode: ZIPs already ingested (same content hash) are not parsed again
+        zip_jobs = list(enumerate(zip_paths))
+        zip_hashes = {}
+        if warehouse:
+            wh_conn = open_warehouse(warehouse)
+            for p in zip_paths:
+                if not isinstance(p, str) or os.path.exists(p):
+                    zip_hashes[p] = file_sha256(p)
+            # One job per content hash: the same ZIP passed twice would be ingested twice
+            # (filings.sha256 is UNIQUE)
+            new_hashes = set()
+            unique_jobs = []
+            for i, p in zip_jobs:
+                sha256 = zip_hashes.get(p)
+                if sha256 is None or sha256 in new_hashes or warehouse_filing_id(wh_conn, sha256) is not None:
+                    continue
+                new_hashes.add(sha256)
+                unique_jobs.append((i, p))
+            zip_jobs = unique_jobs
+            debug_log(f"Warehouse {warehouse}: {len(zip_jobs)} of {len(zip_paths)} ZIPs need parsing")
+
+        def prepare_single_zip_wrapper(p):
+            try:
+                with profile_span('zip', zip=os.path.basename(zip_source_name(p[1])), stage='prepare'):
+                    return prepare_single_zip(p[1])
+            except Exception as e:
+                debug_log(f"Worker failed for {zip_source_name(p[1])}: {e}")
+                return None
+
+        results = []
+        report_progress('parse', 0, len(zip_jobs))
+        parse_span = profile_begin('parse', zips=len(zip_jobs))
+        if zip_jobs and skip_covered_periods:
+            # Covered period pruning: prepare every filing first (labels, contexts, presentation),
+            # then parse the facts of each filing without the periods newer filings already report.
+            # All prepared filings stay in memory until their facts are parsed
+            with ThreadPoolExecutor(max_workers=min(len(zip_jobs), 4)) as executor:
+                prepared = list(executor.map(bound_to_profile(prepare_single_zip_wrapper), zip_jobs))
+            fact_jobs = [(i, p, prep) for (i, p), prep in zip(zip_jobs, prepared) if prep]
+            # Newest first: taxonomy year DESC as in the merge below, then report period DESC
+            # (only a strictly later report period covers a context)
+            for _, _, prep in fact_jobs:
+                prep['report_period'] = latest_report_period(prep['contexts'])
+            merge_order = sorted(fact_jobs, key=lambda j: (str(j[2]['xbrl_files']['taxonomy_year'] or '0000'),
+                                                           j[2]['report_period'] or ''),
+                                 reverse=True)
+            coverage = covered_filing_contexts(
+                [(j[2]['xbrl_files']['report_std'], j[2]['contexts'], j[2]['reported_facts'], j[2]['report_period'])
+                 for j in merge_order],
+                fill_gaps=fill_period_gaps)
+            covered_by_idx = {j[0]: covered for j, covered in zip(merge_order, coverage)}
+            fact_jobs = [(i, p, prep, covered_by_idx[i]) for i, p, prep in fact_jobs]
+            del prepared, merge_order
+            if fact_jobs:
+                with ThreadPoolExecutor(max_workers=min(len(fact_jobs), 4)) as executor:
+                    results = list(executor.map(bound_to_profile(process_single_zip_wrapper), fact_jobs))
+        elif zip_jobs:
+            with ThreadPoolExecutor(max_workers=min(len(zip_jobs), 4)) as executor:
+                results = list(executor.map(bound_to_profile(process_single_zip_wrapper), zip_jobs))
+        profile_end(parse_span, facts=sum(len(r['facts']) for r in results if r))
 
         debug_log(f"Parallel ZIP processing completed in {time.time() - t_parallel_start:.2f}s")
 
+        if wh_conn is not None:
+            for (_, p), res in zip(zip_jobs, results):
+                if res:
+                    ingest_filing(wh_conn, res, zip_hashes[p], os.path.basename(zip_source_name(p)))
+            filing_ids = select_warehouse_filings(wh_conn, list(zip_hashes.values()), edinet_codes,
+                                                  include_all=state_path is not None)
+            results = load_filings(wh_conn, filing_ids)
+
         # Sort results by taxonomy year DESCENDING to ensure latest structure is prioritized
+        report_progress('merge')
         t_merge_start = time.time()
+        merge_span = profile_begin('merge', filings=len([r for r in results if r]))
         results = [r for r in results if r]
         results.sort(key=lambda x: str(x.get('year') or '0000'), reverse=True)
 
@@ -1788,13 +3463,32 @@ def process_xbrl_zips(zip_paths, output_dir=None):
             master_member_seq = merge_sequences(master_member_seq, res['member_seq'])
 
         report_stds = set()
+        merged_bases = set()
         for res in results:
             if res.get('report_std'):
                 report_stds.add(res['report_std'])
             
-            # Merge labels with priorities
-            for k, v in res['labels'].items():
-                p = res['priorities'].get(k, 100)
+            # Merge labels with priorities: each shared standard label base once, then the overlay.
+            # (Re-offering a base that was already merged cannot change anything, and overlay
+            # entries always beat the base entries they replace.)
+            overlay_labels, base_labels = res['labels'].maps
+            overlay_priorities, base_priorities = res['priorities'].maps
+            if id(base_labels) not in merged_bases:
+                merged_bases.add(id(base_labels))
+                if not labels_map:
+                    labels_map.update(base_labels)
+                    labels_map_priorities.update(base_priorities)
+                    if len(base_priorities) != len(base_labels):
+                        for k in base_labels.keys() - base_priorities.keys():
+                            labels_map_priorities[k] = 100
+                else:
+                    for k, v in base_labels.items():
+                        p = base_priorities.get(k, 100)
+                        if k not in labels_map or p < labels_map_priorities.get(k, 101):
+                            labels_map[k] = v
+                            labels_map_priorities[k] = p
+            for k, v in overlay_labels.items():
+                p = overlay_priorities.get(k, 100)
                 if k not in labels_map or p < labels_map_priorities.get(k, 101):
                     labels_map[k] = v
                     labels_map_priorities[k] = p
@@ -1831,12 +3525,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                     role = parts[0]
                 
                 # Filter relevant roles
-                is_accepted = (base_name.startswith('Consolidated') or base_name.startswith('Statement') or 
-                               base_name.startswith('BalanceSheet') or base_name.startswith('Notes') or 
-                               'BusinessResults' in base_name or 'SegmentInformation' in base_name or 
-                               'AnalysisOfOperatingResults' in base_name)
-                
-                if not is_accepted:
+                if not is_accepted_role(base_name):
                     continue
                 
                 # Normalize standalone roles: NonConsolidatedBalanceSheet -> BalanceSheet
@@ -1868,6 +3557,20 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                     if arc_key not in merged_trees[role]:
                         merged_trees[role][arc_key] = (float(o) + sub_role_idx, i)
 
+        # --- Period window: trim the merged values to the last `years` fiscal years of the upload ---
+        # (each worker only skipped periods outside its own filing's window)
+        latest_periods = [res['latest_period'] for res in results if res.get('latest_period')]
+        if years and latest_periods:
+            window_start = period_window_start(max(latest_periods), years)
+            periods_seen = {c for c in periods_seen if c[2] > window_start}
+            for el in list(global_element_period_values):
+                vals = global_element_period_values[el]
+                for col_key in [c for c in vals if c[2] <= window_start]:
+                    del vals[col_key]
+                if not vals:
+                    del global_element_period_values[el]
+            debug_log(f"Period window: {years} years after {window_start}")
+
         # --- Build element-to-statement-type mapping (FIX V7 - IMPROVED) ---
         # Use a smarter approach: if an element appears in multiple statement types,
         # remove it from the mapping (it's a shared element like Abstract, Heading, etc.)
@@ -1921,7 +3624,8 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                                     existing_type != statement_type):
                                     # Different main statement types - mark as shared (None)
                                     element_to_statement_type[element] = None
-                                    debug_log(f"  [Mapping] Element '{element}' appears in multiple statement types ({existing_type}, {statement_type}) - marked as shared")
+                                    log_count('Mapping', "Element '%s' appears in multiple statement types (%s, %s) - marked as shared",
+                                              element, existing_type, statement_type)
                                 # else: same type or one is Notes, keep existing mapping
                         else:
                             # First time seeing this element
@@ -1936,23 +3640,20 @@ def process_xbrl_zips(zip_paths, output_dir=None):
         debug_log(f"ERROR: Overall processing failure: {e}")
         import traceback
         debug_log(traceback.format_exc())
+        # A failed warehouse step (open / ingest / load) leaves no consistent set of filings
+        # to render, and without any facts there is nothing to write
+        if warehouse or not all_facts:
+            if save_state and not update_workbook and os.path.exists(state_path):
+                os.remove(state_path)
+            debug_log("ERROR: No output written")
+            return None
     finally:
-        shutil.rmtree(temp_base)
+        if wh_conn is not None:
+            wh_conn.close()
 
     # --- Fallback for old EDINET format (e.g. 2016-2018) ---
-    # build synthetic roles from the element appearance order in the known ixbrl files.
-    EDINET_DOC_ROLE_MAP = {
-        '0105010': 'rol_ConsolidatedBalanceSheet',
-        '0105020': 'rol_ConsolidatedStatementOfIncome',
-        '0105025': 'rol_ConsolidatedStatementOfComprehensiveIncome',
-        '0105040': 'rol_ConsolidatedStatementOfChangesInNetAssets',
-        '0105050': 'rol_ConsolidatedStatementOfCashFlows',
-        # Notes and Accounting Policies
-        '0106010': 'rol_NotesAccountingPolicies',
-        '0107010': 'rol_Notes',
-        # Segment Information
-        '0114010': 'rol_SegmentInformation',
-    }
+    # build synthetic roles from the element appearance order in the known ixbrl files
+    # (EDINET_DOC_ROLE_MAP, see XBRL LAYER).
 
     # Always try to capture facts from these critical documents as a fallback for structure
     roles_to_fill = EDINET_DOC_ROLE_MAP
@@ -2093,7 +3794,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                             ])
                             # Skip non-CF elements unless structural
                             if not is_cf_element and not is_structural_elem:
-                                debug_log(f"  [CF-Fallback-Filter] Skipped non-CF element: {elem}")
+                                log_count('CF-Fallback-Filter', "Skipped non-CF element: %s", elem)
                                 continue
 
                         if not is_standard_ns or is_detail_item:
@@ -2116,6 +3817,11 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                     merged_trees[role_name].update({(a['parent'], a['child'], a['preferredLabel']): (a['order'], a['index']) for a in arcs})
                     print(f"[Fallback] Merged synthetic role {role_name} from {doc_code} (Phase 1)", file=sys.stderr)
 
+    # --- Statement selection: drop unselected roles (incl. synthetic fallback roles) before planning ---
+    if role_filter:
+        for role_name in [r for r in merged_trees if not role_filter(r.split('_')[-1])]:
+            del merged_trees[role_name]
+
     # --- Clean up stub taxonomy roles from jumbo roles (FIX V5) ---
     # Jumbo roles create virtual taxonomy roles (e.g., jppfs_cor_ConsolidatedBalanceSheet)
     # but these often only contain Heading and TextBlock elements.
@@ -2153,9 +3859,13 @@ def process_xbrl_zips(zip_paths, output_dir=None):
         del merged_trees[role_name]
 
     debug_log(f"Data merging and tree processing completed in {time.time() - t_merge_start:.2f}s")
+    profile_end(merge_span, elements=len(global_element_period_values), periods=len(periods_seen),
+                roles=len(merged_trees))
 
     # Build hierarchical data structure for Excel sheets
+    report_progress('hierarchy')
     t_hierarchy_start = time.time()
+    hierarchy_span = profile_begin('hierarchy')
     all_years_data = {} # {role_name: {hierarchical_key: {period: value}}}
     role_to_order = {} # {role_name: [hierarchical_key1, ...]}
     
@@ -2292,7 +4002,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                     'BasicEarningsPerShare', 'DilutedEarningsPerShare',  # 1株当たり利益
                 )
                 if any(el.endswith(pattern) for pattern in pl_element_patterns):
-                    debug_log(f"  [BS-Filter] Skipping P/L element '{el}' in BalanceSheet role '{role}'")
+                    log_count('BS-Filter', "Skipping P/L element '%s' in BalanceSheet role '%s'", el, role)
                     should_stop = True
 
             # Balance Sheet elements that should never appear in P/L
@@ -2307,7 +4017,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                     'TotalEquity', 'ShareCapital', 'RetainedEarnings',  # 純資産、資本金、利益剰余金
                 )
                 if any(el.endswith(pattern) for pattern in bs_element_patterns):
-                    debug_log(f"  [PL-Filter] Skipping BS element '{el}' in StatementOfIncome role '{role}'")
+                    log_count('PL-Filter', "Skipping BS element '%s' in StatementOfIncome role '%s'", el, role)
                     should_stop = True
 
             if current_role_type and el in element_to_statement_type:
@@ -2315,7 +4025,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
 
                 if element_type is None:
                     # Element is not in mapping (shared/structural) - skip judgment, continue output
-                    debug_log(f"  [Skip-Judgment] Element '{el}' not in mapping (shared) - skipping judgment, continuing output")
+                    log_count('Skip-Judgment', "Element '%s' not in mapping (shared) - skipping judgment, continuing output", el)
                     # Do NOT stop, just continue to next element
                 elif element_type != current_role_type and element_type != 'Notes':
                     # Element belongs to a different specific statement type - stop here
@@ -2330,9 +4040,11 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                         'ExtraordinaryIncome', 'ExtraordinaryLosses'  # 特別損益
                     )
                     if any(el.endswith(suffix) for suffix in pl_element_suffixes):
-                        debug_log(f"  [Type-Filter-Skip] P/L element '{el}' type mismatch ignored (expected: {current_role_type}, mapped: {element_type})")
+                        log_count('Type-Filter-Skip', "P/L element '%s' type mismatch ignored (expected: %s, mapped: %s)",
+                                  el, current_role_type, element_type)
                     else:
-                        debug_log(f"  [Type-Filter] Found {element_type} element '{el}' in {current_role_type} role '{role}' - stopping output")
+                        log_count('Type-Filter', "Found %s element '%s' in %s role '%s' - stopping output",
+                                  element_type, el, current_role_type, role)
                         should_stop = True
 
             if should_stop:
@@ -2433,7 +4145,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
 
                         # Skip non-CF elements unless they are structural
                         if not is_cf_element and not is_structural:
-                            debug_log(f"  [CF-Filter] Skipped non-CF element in CashFlow role: {fp}")
+                            log_count('CF-Filter', "Skipped non-CF element in CashFlow role: %s", fp)
                             continue
 
                     role_to_order[primary].append(full_path_data)
@@ -2470,8 +4182,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
 
     # Try to find company name for filename
     company_name = "企業名不明"
-    name_suffixes = ['CompanyNameCoverPage', 'EntityNameCompanyName', 'EntityNameEntityReportingName']
-    for suffix in name_suffixes:
+    for suffix in COMPANY_NAME_SUFFIXES:
         found = False
         for el_name, vals in global_element_period_values.items():
             if el_name.endswith(suffix):
@@ -2492,6 +4203,481 @@ def process_xbrl_zips(zip_paths, output_dir=None):
         debug_log(f"DEBUG: Company discovery failed. Top 30 elements: {top_el}")
 
     debug_log(f"Hierarchical data structure built in {time.time() - t_hierarchy_start:.2f}s")
+    profile_end(hierarchy_span, roles=len(role_to_order), rows=sum(len(keys) for keys in role_to_order.values()))
+
+    # Hand the hierarchy phase result over to the selected output backend
+    xbrl_data = {
+        'company_name': company_name,
+        'labels_map': labels_map,
+        'values': global_element_period_values,
+        'periods': periods_seen,
+        'member_seq': master_member_seq,
+        'all_years_data': all_years_data,
+        'role_to_order': role_to_order,
+    }
+    if update_workbook:
+        xbrl_data['base_workbook'] = update_workbook
+        xbrl_data['previous_sheet_digests'] = load_sheet_digests(state_path)
+
+    report_progress('output')
+    out_file = None
+    try:
+        with profile_span('output', format=output_format):
+            out_file = OUTPUT_BACKENDS[output_format](xbrl_data, output_dir)
+        if state_path and out_file and 'sheet_digests' in xbrl_data:
+            save_sheet_digests(state_path, xbrl_data['sheet_digests'])
+    finally:
+        if save_state and not update_workbook:
+            if out_file:
+                os.replace(state_path, workbook_state_path(out_file))
+            else:
+                os.remove(state_path)
+    flush_log_counts()
+    debug_log(f"TOTAL: process_xbrl_zips completed in {time.time() - overall_start:.2f}s")
+    return out_file
+
+# ============================================================================
+# WAREHOUSE LAYER - SQLite Fact Warehouse
+# ============================================================================
+# 【将来の分割先】storage/warehouse.py
+#
+# process_single_zip の解析結果（ファクト・企業別ラベル・表示リンクのアーク）を
+# ZIPごとにSQLiteへ取り込み、出力はDBから読み戻した結果で生成する。
+# - 同じ内容のZIP（SHA-256一致）は再解析しない（新しい年度は1ZIPだけ解析）
+# - 標準タクソノミのラベルは年度ごとの standard_labels.json と共有するため保存しない
+#   （labels テーブルは企業別ラベル/IFRS別名などの上書き分のみ）
+# - facts は (edinet_code, element, period, dimension) で索引し、企業横断の検索が可能
+# - ワークブックのサイドカー状態（<workbook>.state.db）も同じ形式で、
+#   シートごとの入力ダイジェストを持ち、差分更新では変化したシートだけ再生成する
+# ============================================================================
+
+WAREHOUSE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS filings (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    source_name TEXT,
+    edinet_code TEXT,
+    taxonomy_year TEXT,
+    report_std TEXT,
+    member_seq TEXT,
+    ingested_at TEXT
+);
+CREATE TABLE IF NOT EXISTS facts (
+    id INTEGER PRIMARY KEY,
+    filing_id INTEGER NOT NULL REFERENCES filings(id) ON DELETE CASCADE,
+    edinet_code TEXT,
+    element TEXT NOT NULL,
+    context TEXT,
+    period TEXT,
+    start_date TEXT,
+    dimension TEXT,
+    value TEXT,
+    source_file TEXT,
+    elem_order INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_facts_lookup ON facts (edinet_code, element, period, dimension);
+CREATE INDEX IF NOT EXISTS idx_facts_filing ON facts (filing_id);
+CREATE TABLE IF NOT EXISTS labels (
+    filing_id INTEGER NOT NULL REFERENCES filings(id) ON DELETE CASCADE,
+    element TEXT NOT NULL,
+    label TEXT,
+    priority INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_labels_filing ON labels (filing_id);
+CREATE TABLE IF NOT EXISTS arcs (
+    id INTEGER PRIMARY KEY,
+    filing_id INTEGER NOT NULL REFERENCES filings(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    parent TEXT,
+    child TEXT,
+    arc_order REAL,
+    arc_index INTEGER,
+    preferred_label TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_arcs_filing ON arcs (filing_id);
+CREATE TABLE IF NOT EXISTS sheet_digests (
+    sheet_name TEXT PRIMARY KEY,
+    digest TEXT
+);
+"""
+
+def open_warehouse(db_path):
+    """Open (and create if needed) the SQLite fact warehouse."""
+    import sqlite3
+    db_dir = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(WAREHOUSE_SCHEMA)
+    return conn
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file path or seekable file-like object (read in _DOWNLOAD_CHUNK_SIZE chunks)."""
+    import hashlib
+    h = hashlib.sha256()
+    if not isinstance(path, str):
+        path.seek(0)
+        for chunk in iter(lambda: path.read(_DOWNLOAD_CHUNK_SIZE), b''):
+            h.update(chunk)
+        path.seek(0)
+        return h.hexdigest()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_DOWNLOAD_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def warehouse_filing_id(conn, sha256):
+    row = conn.execute("SELECT id FROM filings WHERE sha256 = ?", (sha256,)).fetchone()
+    return row[0] if row else None
+
+def ingest_filing(conn, res, sha256, source_name):
+    """Store one process_single_zip result. Returns the filing id."""
+    t_start = time.time()
+    edinet_code = res.get('edinet_code')
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO filings (sha256, source_name, edinet_code, taxonomy_year, report_std, member_seq, ingested_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (sha256, source_name, edinet_code, res.get('year'), res.get('report_std'),
+             json.dumps(res.get('member_seq', []), ensure_ascii=False),
+             time.strftime('%Y-%m-%dT%H:%M:%S')))
+        filing_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO facts (filing_id, edinet_code, element, context, period, start_date, dimension, value, source_file, elem_order) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((filing_id, edinet_code, f['element'], f.get('context'), f['period'], f.get('start_date'),
+              f.get('dimension', ''), f['value'], os.path.basename(f.get('source_file', '')), f.get('elem_order', 0))
+             for f in res['facts']))
+        conn.executemany(
+            "INSERT INTO labels (filing_id, element, label, priority) VALUES (?, ?, ?, ?)",
+            ((filing_id, k, v, p) for k, (v, p) in res.get('overlay_labels', {}).items()))
+        conn.executemany(
+            "INSERT INTO arcs (filing_id, role, parent, child, arc_order, arc_index, preferred_label) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((filing_id, role, a['parent'], a['child'], a['order'], a.get('index', 0), a.get('preferredLabel'))
+             for role, arcs in res['trees'].items() for a in arcs))
+    debug_log(f"Warehouse: ingested {source_name} ({edinet_code}, {len(res['facts'])} facts) in {time.time() - t_start:.2f}s")
+    return filing_id
+
+def select_warehouse_filings(conn, sha256_list, edinet_codes=None, include_all=False):
+    """Filing ids to render: the given ZIPs plus every filing of the same companies.
+
+    include_all selects every stored filing (used for workbook sidecar states).
+    """
+    if include_all:
+        return [r[0] for r in conn.execute("SELECT id FROM filings ORDER BY id")]
+    codes = set(edinet_codes or [])
+    ids = set()
+    for sha in sha256_list:
+        row = conn.execute("SELECT id, edinet_code FROM filings WHERE sha256 = ?", (sha,)).fetchone()
+        if row:
+            ids.add(row[0])
+            if row[1]:
+                codes.add(row[1])
+    for code in codes:
+        ids.update(r[0] for r in conn.execute("SELECT id FROM filings WHERE edinet_code = ?", (code,)))
+    return sorted(ids)
+
+def workbook_state_path(workbook_path):
+    """Sidecar state file saved next to a generated workbook."""
+    return workbook_path + '.state.db'
+
+def load_sheet_digests(db_path):
+    conn = open_warehouse(db_path)
+    try:
+        return dict(conn.execute("SELECT sheet_name, digest FROM sheet_digests"))
+    finally:
+        conn.close()
+
+def save_sheet_digests(db_path, sheet_digests):
+    conn = open_warehouse(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM sheet_digests")
+            conn.executemany("INSERT INTO sheet_digests (sheet_name, digest) VALUES (?, ?)", sheet_digests.items())
+    finally:
+        conn.close()
+
+def load_filings(conn, filing_ids):
+    """Rebuild process_single_zip results from the warehouse (ordered by source name)."""
+    t_start = time.time()
+    results = []
+    rows = conn.execute(
+        "SELECT id, source_name, edinet_code, taxonomy_year, report_std, member_seq FROM filings "
+        "WHERE id IN (%s) ORDER BY source_name, id" % ','.join('?' * len(filing_ids)), filing_ids).fetchall() if filing_ids else []
+    for filing_id, source_name, edinet_code, year, report_std, member_seq in rows:
+        labels, priorities = ChainMap({}, {}), ChainMap({}, {})
+        if year:
+            labels.maps[1], priorities.maps[1] = get_standard_labels(year)
+        for element, label, priority in conn.execute(
+                "SELECT element, label, priority FROM labels WHERE filing_id = ?", (filing_id,)):
+            labels[element] = label
+            priorities[element] = priority
+
+        facts = []
+        for element, context, period, start_date, dimension, value, source_file, elem_order in conn.execute(
+                "SELECT element, context, period, start_date, dimension, value, source_file, elem_order "
+                "FROM facts WHERE filing_id = ? ORDER BY id", (filing_id,)):
+            f = {'element': element, 'context': context, 'period': period, 'dimension': dimension,
+                 'value': value, 'source_file': source_file, 'elem_order': elem_order}
+            if start_date:
+                f['start_date'] = start_date
+            facts.append(f)
+        values, periods = tag_fact_values(facts, report_std)
+
+        trees = {}
+        for role, parent, child, arc_order, arc_index, pref_label in conn.execute(
+                "SELECT role, parent, child, arc_order, arc_index, preferred_label "
+                "FROM arcs WHERE filing_id = ? ORDER BY id", (filing_id,)):
+            trees.setdefault(role, []).append(
+                {'parent': parent, 'child': child, 'order': arc_order, 'index': arc_index, 'preferredLabel': pref_label})
+
+        results.append({
+            'labels': labels,
+            'priorities': priorities,
+            'facts': facts,
+            'periods': periods,
+            'values': values,
+            'trees': trees,
+            'member_seq': json.loads(member_seq) if member_seq else [],
+            'year': year,
+            'report_std': report_std,
+            'edinet_code': edinet_code,
+        })
+    debug_log(f"Warehouse: loaded {len(results)} filings in {time.time() - t_start:.2f}s")
+    return results
+
+# ============================================================================
+# OUTPUT LAYER - Output Backends
+# ============================================================================
+# 【将来の分割先】output/excel/writer.py, output/table.py
+#
+# process_xbrl_zips の階層構築フェーズの結果（xbrl_data）を受け取り、
+# ファイルに書き出すバックエンド群:
+# - write_excel_output: 従来の横展開Excel（XBRL_横展開_{company}.xlsx）
+# - write_csv_output / write_parquet_output: 縦持ちのファクトテーブル
+#
+# xbrl_data のキー:
+#   company_name, labels_map, values (global_element_period_values),
+#   periods, member_seq, all_years_data, role_to_order
+# ============================================================================
+
+def _excel_sheet_name(role, current_standard, labels_map):
+    """Sheet title for a (role, accounting standard) pair of the Excel backend.
+
+    Several roles may map to the same title; their rows are merged into one sheet.
+    """
+    base_name = role.split('_')[-1]
+    sheet_mapping = {
+        'ConsolidatedBalanceSheet': '連結貸借対照表',
+        'ConsolidatedStatementOfIncome': '連結損益計算書',
+        'ConsolidatedStatementOfComprehensiveIncome': '連結包括利益計算書',
+        'ConsolidatedStatementOfChangesInEquity': '連結株主資本等変動計算書',
+        'ConsolidatedStatementOfChangesInNetAssets': '連結株主資本等変動計算書',
+        'ConsolidatedStatementOfCashFlows': '連結キャッシュ・フロー計算書',
+        'ConsolidatedStatementOfCashFlows-indirect': '連結キャッシュ・フロー計算書',
+        'ConsolidatedStatementOfCashFlows-direct': '連結キャッシュ・フロー計算書',
+        'ConsolidatedStatementOfFinancialPositionIFRS': '連結貸借対照表',
+        'ConsolidatedStatementOfProfitOrLossIFRS': '連結損益計算書',
+        'ConsolidatedStatementOfComprehensiveIncomeIFRS': '連結包括利益計算書',
+        'ConsolidatedStatementOfChangesInEquityIFRS': '連結株主資本等変動計算書',
+        'ConsolidatedStatementOfCashFlowsIFRS': '連結キャッシュ・フロー計算書',
+        'BalanceSheet': '貸借対照表',
+        'StatementOfIncome': '損益計算書',
+        'StatementOfComprehensiveIncome': '包括利益計算書',
+        'StatementOfChangesInEquity': '株主資本等変動計算書',
+        'StatementOfChangesInNetAssets': '株主資本等変動計算書',
+        'StatementOfCashFlows': 'キャッシュ・フロー計算書',
+        'StatementOfCashFlows-indirect': 'キャッシュ・フロー計算書',
+        'StatementOfCashFlows-direct': 'キャッシュ・フロー計算書',
+        'SummaryOfBusinessResults': '主要な経営指標等の推移',
+        'BusinessResultsOfGroup': '主要な経営指標等の推移（連結）',
+        'BusinessResultsOfReportingCompany': '主要な経営指標等の推移（単体）',
+        # Note / Segment keywords (without '注記_' prefix, as it's added by logic)
+        'SegmentInformationConsolidatedFinancialStatementsIFRS': 'セグメント情報等',
+        'AnalysisOfOperatingResultsConsolidatedFinancialStatementsIFRS': 'セグメント情報',
+        'NotesSegmentInformationEtcConsolidatedFinancialStatements': 'セグメント情報等',
+        'NotesAnalysisOfOperatingResultsConsolidatedFinancialStatements': 'セグメント情報',
+        'StatementOfFinancialPositionIFRS': '連結貸借対照表',
+        'StatementOfProfitOrLossIFRS': '連結損益計算書',
+        'InventoriesConsolidatedFinancialStatementsIFRS': '棚卸資産',
+        'PropertyPlantAndEquipmentConsolidatedFinancialStatementsIFRS': '有形固定資産',
+        'GoodwillAndIntangibleAssetsConsolidatedFinancialStatementsIFRS': 'のれん及び無形資産',
+        'SellingGeneralAndAdministrativeExpensesConsolidatedFinancialStatementsIFRS': '販売費及び一般管理費',
+        'FinanceIncomeAndFinanceCostsConsolidatedFinancialStatementsIFRS': '金融収益及び金融費用',
+        'TradeAndOtherReceivablesConsolidatedFinancialStatementsIFRS': '営業債権及びその他の債権',
+        'TradeAndOtherPayablesConsolidatedFinancialStatementsIFRS': '営業債務及びその他の債務',
+        'OtherInvestmentsConsolidatedFinancialStatementsIFRS': 'その他の投資',
+        'ExpensesByNatureConsolidatedFinancialStatementsIFRS': '費用の性質別内訳'
+    }
+    
+    japanese_name = sheet_mapping.get(base_name)
+    if not japanese_name:
+        if base_name.startswith('Notes'):
+            sub_name = base_name[5:] # remove 'Notes'
+            # Dynamic lookup in labels_map for element names based on base_name
+            # Try multiple prefixes for IFRS and J-GAAP
+            prefixes = ["jpigp_cor_", "jpcrp_cor_", "jppfs_cor_"]
+            # Possible variations: Prefix + role_name + suffix, or Prefix + sub_name + suffix
+            search_terms = []
+            for p in prefixes:
+                for suffix in ["Heading", "TextBlock", ""]:
+                    search_terms.append(f"{p}{base_name}{suffix}")
+                    if base_name.startswith('Notes'):
+                        search_terms.append(f"{p}{base_name[5:]}{suffix}")
+                    else:
+                        search_terms.append(f"{p}Notes{base_name}{suffix}")
+            
+            for el in search_terms:
+                if el in labels_map:
+                    raw_label = labels_map[el]
+                    # Clean up: remove prefixes and standardize
+                    # Example: "注記事項－..." or suffix phrases
+                    cl_label = raw_label.split('、')[0].split(' [')[0].replace('注記事項－', '').strip()
+                    if cl_label:
+                        japanese_name = '注記_' + cl_label
+                        break
+
+            if not japanese_name:
+                lookup_name = base_name[5:] if base_name.startswith('Notes') else base_name
+                if 'SegmentInformation' in base_name:
+                    # Normalize for lookup
+                    m = _RE_SEGMENT_SUFFIX.search(lookup_name)
+                    segment_dict = {
+                        '01': '報告セグメントの概要等',
+                        '02': 'セグメント情報',
+                        '03': '差異調整事項等',
+                        '04': '関連情報',
+                        '05': '減損損失',
+                        '06': 'のれん',
+                        '07': '負ののれん'
+                    }
+                    if m and m.group(1) in segment_dict:
+                        inner_v = segment_dict[m.group(1)]
+                    elif m:
+                        inner_v = f'セグメント情報{int(m.group(1))}'
+                    else:
+                        inner_v = 'セグメント情報'
+                    
+                    japanese_name = sheet_mapping.get(lookup_name, inner_v)
+                else:
+                    japanese_name = sheet_mapping.get(lookup_name, lookup_name)
+        else:
+            japanese_name = base_name
+            
+    # --- Robust Naming Logic (V6) ---
+    # 1. Standard Suffix Suffix placement
+    suffix = ""
+    is_ifrs = (current_standard == 'IFRS')
+    is_jmis = (current_standard == 'JMIS')
+    is_us = (current_standard == 'US')
+    is_all = (current_standard == 'JP_ALL')
+    
+    if is_ifrs: suffix = '(IFRS)'
+    elif is_jmis: suffix = '(JMIS)'
+    elif is_us: suffix = '(US GAAP)'
+    elif not is_all: suffix = '(日本基準)'
+    
+    # 2. Handle Analytical Suffix (_分析)
+    analytical_suffix = ""
+    if 'AnalysisOfOperatingResults' in base_name:
+        analytical_suffix = "_分析"
+        
+    # 3. Assemble components
+    # Avoid doubling suffix if already present
+    if suffix and suffix in japanese_name:
+        suffix = ""
+        
+    final_sheet_name = f"{japanese_name}{suffix}{analytical_suffix}"
+    
+    # 4. Final '注記_' Prefixing for notes/segments
+    if base_name.startswith('Notes') or 'SegmentInformation' in base_name or 'AnalysisOfOperatingResults' in base_name:
+        if not final_sheet_name.startswith('注記_'):
+            final_sheet_name = '注記_' + final_sheet_name
+            
+    sheet_name = final_sheet_name
+    
+    # In Japanese, 31 characters maximum for sheet name
+    if len(sheet_name) > 31:
+        # If the name is too long, truncate it before the suffix and re-add suffix
+        # This logic needs to be careful with analytical_suffix and standard suffix
+        
+        # Calculate length available for the base name
+        total_suffix_len = len(suffix) + len(analytical_suffix)
+        allowed_base_len = 31 - total_suffix_len
+        
+        # Truncate the base part of the name
+        truncated_base_name = japanese_name[:allowed_base_len]
+        
+        # Reconstruct the sheet name
+        sheet_name = f"{truncated_base_name}{suffix}{analytical_suffix}"
+    return sheet_name
+
+def _analysis_sheet_name(sheet_name):
+    analysis_sheet_name = sheet_name + "_分析"
+    if len(analysis_sheet_name) > 31:
+        # Ensure it doesn't exceed 31 chars
+        analysis_sheet_name = sheet_name[:28] + "_分析"
+    return analysis_sheet_name
+
+def _excel_sheet_input_digest(role, ordered_keys, current_standard, xbrl_data, consolidated_standards, periods_with_standalone):
+    """Digest of everything one (role, standard) work item reads while rendering its sheet.
+
+    Used by incremental workbook updates to regenerate only sheets whose inputs changed.
+    """
+    import hashlib
+    role_data = xbrl_data['all_years_data'].get(role, {})
+    values = xbrl_data['values']
+    labels_map = xbrl_data['labels_map']
+    col_keys = set()
+    for vals in role_data.values():
+        col_keys.update(vals.keys())
+    elements = set()
+    for full_path, _ in ordered_keys:
+        for part in full_path.split('::'):
+            if part:
+                elements.add(part.split('|')[0])
+    metadata = values.get('_metadata', {})
+    periods = {c[-1] for c in col_keys}
+    payload = [
+        role, current_standard, ordered_keys,
+        sorted((fp, sorted(vals.items(), key=str)) for fp, vals in role_data.items()),
+        sorted((el, labels_map.get(el), sorted(values.get(el, {}).items(), key=str)) for el in elements),
+        sorted((c, metadata[c]) for c in col_keys if c in metadata),
+        sorted((p, sorted(consolidated_standards.get(p, ()))) for p in periods),
+        sorted(p for p in periods if p in periods_with_standalone),
+        xbrl_data['member_seq'],
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+def write_excel_output(xbrl_data, output_dir=None):
+    """Excel backend: write the horizontal multi-year workbook (existing layout).
+
+    When xbrl_data carries 'base_workbook' and 'previous_sheet_digests' (incremental
+    update), the existing workbook is loaded and only sheets whose input digest
+    changed are regenerated. The new digests are returned in xbrl_data['sheet_digests'].
+    """
+    global HAS_OPENPYXL
+    # Delay loading heavy libraries until the backend is actually used
+    try:
+        from openpyxl import Workbook, load_workbook
+        HAS_OPENPYXL = True
+    except ImportError:
+        Workbook = None
+        HAS_OPENPYXL = False
+
+    if not HAS_OPENPYXL:
+        print("Error: openpyxl is not installed. Excel generation is impossible.", file=sys.stderr)
+        return None
+
+    company_name = xbrl_data['company_name']
+    labels_map = xbrl_data['labels_map']
+    global_element_period_values = xbrl_data['values']
+    periods_seen = xbrl_data['periods']
+    master_member_seq = xbrl_data['member_seq']
+    all_years_data = xbrl_data['all_years_data']
+    role_to_order = xbrl_data['role_to_order']
 
     # ========================================================================
     # Phase 2: Excel生成
@@ -2515,11 +4701,13 @@ def process_xbrl_zips(zip_paths, output_dir=None):
     print(f"Generating Excel for {company_name}...", file=sys.stderr)
     # Note: write_only=True is faster but incompatible with sheet merging and formatting
     # Current implementation requires normal mode for merge operations
-    wb = Workbook()
-    default_sheet_removed = False
+    base_workbook = xbrl_data.get('base_workbook')
+    previous_sheet_digests = xbrl_data.get('previous_sheet_digests')
+    incremental = bool(base_workbook and previous_sheet_digests is not None and os.path.exists(base_workbook))
 
     # Identify periods and standards for sheet planning
     t_sheet_planning_start = time.time()
+    span = profile_begin('sheet_planning')
     # Identify periods that are standalone (not consolidated)
     periods_with_standalone = set()
     for role, ordered_keys_dict in all_years_data.items():
@@ -2648,164 +4836,48 @@ def process_xbrl_zips(zip_paths, output_dir=None):
         for std in standards_to_try:
             all_role_work.append((role, ordered_keys, std))
 
+    # Per-sheet input digests (several roles may be merged into one sheet)
+    sheet_digest_parts = {}
+    for role, ordered_keys, std in all_role_work:
+        sheet_digest_parts.setdefault(_excel_sheet_name(role, std, labels_map), []).append(
+            _excel_sheet_input_digest(role, ordered_keys, std, xbrl_data, consolidated_standards, periods_with_standalone))
+    sheet_digests = {name: '/'.join(parts) for name, parts in sheet_digest_parts.items()}
+    xbrl_data['sheet_digests'] = sheet_digests
+
+    kept_sheets = set()
+    if incremental:
+        # Keep sheets whose inputs are unchanged; drop changed and obsolete ones
+        wb = load_workbook(base_workbook)
+        kept_sheets = {name for name, digest in sheet_digests.items() if previous_sheet_digests.get(name) == digest}
+        kept_titles = kept_sheets | {_analysis_sheet_name(name) for name in kept_sheets}
+        for title in list(wb.sheetnames):
+            if title not in kept_titles:
+                wb.remove(wb[title])
+        debug_log(f"Incremental update: {len(sheet_digests) - len(kept_sheets)} of {len(sheet_digests)} sheets to regenerate")
+    else:
+        wb = Workbook()
+    default_sheet_removed = incremental
+
     debug_log(f"Sheet planning completed in {time.time() - t_sheet_planning_start:.2f}s ({len(all_role_work)} sheets to process)")
+    profile_end(span, sheets=len(all_role_work))
 
     # Generate Excel sheets
     t_sheet_generation_start = time.time()
+    span = profile_begin('sheet_generation')
     for role, ordered_keys, current_standard in all_role_work:
-        # Clean role name for sheet
         base_name = role.split('_')[-1]
-        sheet_mapping = {
-            'ConsolidatedBalanceSheet': '連結貸借対照表',
-            'ConsolidatedStatementOfIncome': '連結損益計算書',
-            'ConsolidatedStatementOfComprehensiveIncome': '連結包括利益計算書',
-            'ConsolidatedStatementOfChangesInEquity': '連結株主資本等変動計算書',
-            'ConsolidatedStatementOfChangesInNetAssets': '連結株主資本等変動計算書',
-            'ConsolidatedStatementOfCashFlows': '連結キャッシュ・フロー計算書',
-            'ConsolidatedStatementOfCashFlows-indirect': '連結キャッシュ・フロー計算書',
-            'ConsolidatedStatementOfCashFlows-direct': '連結キャッシュ・フロー計算書',
-            'ConsolidatedStatementOfFinancialPositionIFRS': '連結貸借対照表',
-            'ConsolidatedStatementOfProfitOrLossIFRS': '連結損益計算書',
-            'ConsolidatedStatementOfComprehensiveIncomeIFRS': '連結包括利益計算書',
-            'ConsolidatedStatementOfChangesInEquityIFRS': '連結株主資本等変動計算書',
-            'ConsolidatedStatementOfCashFlowsIFRS': '連結キャッシュ・フロー計算書',
-            'BalanceSheet': '貸借対照表',
-            'StatementOfIncome': '損益計算書',
-            'StatementOfComprehensiveIncome': '包括利益計算書',
-            'StatementOfChangesInEquity': '株主資本等変動計算書',
-            'StatementOfChangesInNetAssets': '株主資本等変動計算書',
-            'StatementOfCashFlows': 'キャッシュ・フロー計算書',
-            'StatementOfCashFlows-indirect': 'キャッシュ・フロー計算書',
-            'StatementOfCashFlows-direct': 'キャッシュ・フロー計算書',
-            'SummaryOfBusinessResults': '主要な経営指標等の推移',
-            'BusinessResultsOfGroup': '主要な経営指標等の推移（連結）',
-            'BusinessResultsOfReportingCompany': '主要な経営指標等の推移（単体）',
-            # Note / Segment keywords (without '注記_' prefix, as it's added by logic)
-            'SegmentInformationConsolidatedFinancialStatementsIFRS': 'セグメント情報等',
-            'AnalysisOfOperatingResultsConsolidatedFinancialStatementsIFRS': 'セグメント情報',
-            'NotesSegmentInformationEtcConsolidatedFinancialStatements': 'セグメント情報等',
-            'NotesAnalysisOfOperatingResultsConsolidatedFinancialStatements': 'セグメント情報',
-            'StatementOfFinancialPositionIFRS': '連結貸借対照表',
-            'StatementOfProfitOrLossIFRS': '連結損益計算書',
-            'InventoriesConsolidatedFinancialStatementsIFRS': '棚卸資産',
-            'PropertyPlantAndEquipmentConsolidatedFinancialStatementsIFRS': '有形固定資産',
-            'GoodwillAndIntangibleAssetsConsolidatedFinancialStatementsIFRS': 'のれん及び無形資産',
-            'SellingGeneralAndAdministrativeExpensesConsolidatedFinancialStatementsIFRS': '販売費及び一般管理費',
-            'FinanceIncomeAndFinanceCostsConsolidatedFinancialStatementsIFRS': '金融収益及び金融費用',
-            'TradeAndOtherReceivablesConsolidatedFinancialStatementsIFRS': '営業債権及びその他の債権',
-            'TradeAndOtherPayablesConsolidatedFinancialStatementsIFRS': '営業債務及びその他の債務',
-            'OtherInvestmentsConsolidatedFinancialStatementsIFRS': 'その他の投資',
-            'ExpensesByNatureConsolidatedFinancialStatementsIFRS': '費用の性質別内訳'
-        }
-        
-        japanese_name = sheet_mapping.get(base_name)
-        if not japanese_name:
-            if base_name.startswith('Notes'):
-                sub_name = base_name[5:] # remove 'Notes'
-                # Dynamic lookup in labels_map for element names based on base_name
-                # Try multiple prefixes for IFRS and J-GAAP
-                prefixes = ["jpigp_cor_", "jpcrp_cor_", "jppfs_cor_"]
-                # Possible variations: Prefix + role_name + suffix, or Prefix + sub_name + suffix
-                search_terms = []
-                for p in prefixes:
-                    for suffix in ["Heading", "TextBlock", ""]:
-                        search_terms.append(f"{p}{base_name}{suffix}")
-                        if base_name.startswith('Notes'):
-                            search_terms.append(f"{p}{base_name[5:]}{suffix}")
-                        else:
-                            search_terms.append(f"{p}Notes{base_name}{suffix}")
-                
-                for el in search_terms:
-                    if el in labels_map:
-                        raw_label = labels_map[el]
-                        # Clean up: remove prefixes and standardize
-                        # Example: "注記事項－..." or suffix phrases
-                        cl_label = raw_label.split('、')[0].split(' [')[0].replace('注記事項－', '').strip()
-                        if cl_label:
-                            japanese_name = '注記_' + cl_label
-                            break
+        sheet_name = _excel_sheet_name(role, current_standard, labels_map)
+        if sheet_name in kept_sheets:
+            continue
 
-                if not japanese_name:
-                    lookup_name = base_name[5:] if base_name.startswith('Notes') else base_name
-                    if 'SegmentInformation' in base_name:
-                        # Normalize for lookup
-                        m = _RE_SEGMENT_SUFFIX.search(lookup_name)
-                        segment_dict = {
-                            '01': '報告セグメントの概要等',
-                            '02': 'セグメント情報',
-                            '03': '差異調整事項等',
-                            '04': '関連情報',
-                            '05': '減損損失',
-                            '06': 'のれん',
-                            '07': '負ののれん'
-                        }
-                        if m and m.group(1) in segment_dict:
-                            inner_v = segment_dict[m.group(1)]
-                        elif m:
-                            inner_v = f'セグメント情報{int(m.group(1))}'
-                        else:
-                            inner_v = 'セグメント情報'
-                        
-                        japanese_name = sheet_mapping.get(lookup_name, inner_v)
-                    else:
-                        japanese_name = sheet_mapping.get(lookup_name, lookup_name)
-            else:
-                japanese_name = base_name
-                
-        # --- Robust Naming Logic (V6) ---
-        # 1. Standard Suffix Suffix placement
-        suffix = ""
-        is_ifrs = (current_standard == 'IFRS')
-        is_jmis = (current_standard == 'JMIS')
-        is_us = (current_standard == 'US')
-        is_all = (current_standard == 'JP_ALL')
-        
-        if is_ifrs: suffix = '(IFRS)'
-        elif is_jmis: suffix = '(JMIS)'
-        elif is_us: suffix = '(US GAAP)'
-        elif not is_all: suffix = '(日本基準)'
-        
-        # 2. Handle Analytical Suffix (_分析)
-        analytical_suffix = ""
-        if 'AnalysisOfOperatingResults' in base_name:
-            analytical_suffix = "_分析"
-            
-        # 3. Assemble components
-        # Avoid doubling suffix if already present
-        if suffix and suffix in japanese_name:
-            suffix = ""
-            
-        final_sheet_name = f"{japanese_name}{suffix}{analytical_suffix}"
-        
-        # 4. Final '注記_' Prefixing for notes/segments
-        if base_name.startswith('Notes') or 'SegmentInformation' in base_name or 'AnalysisOfOperatingResults' in base_name:
-            if not final_sheet_name.startswith('注記_'):
-                final_sheet_name = '注記_' + final_sheet_name
-                
-        sheet_name = final_sheet_name
-        
-        # In Japanese, 31 characters maximum for sheet name
-        if len(sheet_name) > 31:
-            # If the name is too long, truncate it before the suffix and re-add suffix
-            # This logic needs to be careful with analytical_suffix and standard suffix
-            
-            # Calculate length available for the base name
-            total_suffix_len = len(suffix) + len(analytical_suffix)
-            allowed_base_len = 31 - total_suffix_len
-            
-            # Truncate the base part of the name
-            truncated_base_name = japanese_name[:allowed_base_len]
-            
-            # Reconstruct the sheet name
-            sheet_name = f"{truncated_base_name}{suffix}{analytical_suffix}"
-        
         # Collect columns relevant to THIS role based on sheet type
         is_segment = 'SegmentInformation' in base_name or 'AnalysisOfOperatingResults' in base_name
         is_consolidated = 'Consolidated' in base_name or 'Group' in base_name or 'SummaryOfBusinessResults' in base_name
         is_non_consolidated = not is_consolidated and not is_segment
         
-        debug_log(f"[DEBUG] Processing sheet: {sheet_name} (role: {role}, std: {current_standard}, is_segment: {is_segment})")
-        debug_log(f"  [DEBUG] Role has {len(ordered_keys)} elements in presentation tree")
+        debug_log("[DEBUG] Processing sheet: %s (role: %s, std: %s, is_segment: %s)",
+                  sheet_name, role, current_standard, is_segment, level=logging.DEBUG)
+        debug_log("  [DEBUG] Role has %d elements in presentation tree", len(ordered_keys), level=logging.DEBUG)
 
         # --- Skip roles that only contain structural/non-data elements ---
         # Check if role contains only TextBlock, Abstract, Heading, Table, Axis, Member elements
@@ -3013,7 +5085,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
             # Common terminology translations as a fallback
             # Imported from edinet_taxonomy_dict.py (1,959 items)
             # Source: EDINET Taxonomy (https://disclosure2dl.edinet-fsa.go.jp/guide/static/disclosure/download/ESE140115.xlsx)
-            common_dict = EDINET_COMMON_DICT
+            common_dict = get_edinet_common_dict()
             
             parts = el.split('_')
             base_name = parts[-1] if len(parts) > 1 else el
@@ -3445,10 +5517,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                     
         # --- NEW: Formatted Segment Analysis Sheet ---
         if is_segment:
-            analysis_sheet_name = sheet_name + "_分析"
-            if len(analysis_sheet_name) > 31:
-                # Ensure it doesn't exceed 31 chars
-                analysis_sheet_name = sheet_name[:28] + "_分析"
+            analysis_sheet_name = _analysis_sheet_name(sheet_name)
             
             aws = wb.create_sheet(title=analysis_sheet_name)
             used_sheet_names.add(analysis_sheet_name)
@@ -3598,11 +5667,15 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                         cell.number_format = r'#,##0_ ;[Red]\-#,##0 '
 
     debug_log(f"Sheet generation completed in {time.time() - t_sheet_generation_start:.2f}s")
+    profile_end(span, sheets=len(wb.worksheets), rows=sum(ws.max_row for ws in wb.worksheets))
 
         # Auto-adjust column widths (optimized: sample first 100 rows only)
     t_colwidth_start = time.time()
+    span = profile_begin('column_widths')
     MAX_SAMPLE_ROWS = 100  # Only check first 100 rows for width calculation
     for out_ws in wb.worksheets:
+        if incremental and out_ws.title in kept_titles:
+            continue
         for col in out_ws.columns:
             max_length = 0
             column_letter = col[0].column_letter
@@ -3620,6 +5693,7 @@ def process_xbrl_zips(zip_paths, output_dir=None):
                 adjusted_width = 50
             out_ws.column_dimensions[column_letter].width = adjusted_width
     debug_log(f"Column width adjustment completed in {time.time() - t_colwidth_start:.2f}s")
+    profile_end(span)
 
     # シートの並び替え
     def get_sheet_order(title):
@@ -3665,7 +5739,15 @@ def process_xbrl_zips(zip_paths, output_dir=None):
 
         return (group, stmt_order, 0, std_order)
                 
-    wb._sheets.sort(key=lambda s: get_sheet_order(s.title))
+    # Ties (e.g. all note sheets) keep the planning order, so that --update (kept sheets first,
+    # regenerated ones appended) orders the sheets exactly like a full run
+    plan_order = {}
+    for role, ordered_keys, std in all_role_work:
+        name = _excel_sheet_name(role, std, labels_map)
+        if name not in plan_order:
+            plan_order[name] = 2 * len(plan_order)
+            plan_order[_analysis_sheet_name(name)] = plan_order[name] + 1
+    wb._sheets.sort(key=lambda s: get_sheet_order(s.title) + (plan_order.get(s.title, len(plan_order) * 2),))
 
     # Remove sheets with no numeric data (e.g., text-only note sheets)
     sheets_to_remove = []
@@ -3695,18 +5777,349 @@ def process_xbrl_zips(zip_paths, output_dir=None):
     for out_ws in wb.worksheets:
         debug_log(f"  - {out_ws.title}: {out_ws.max_row} rows")
 
-    out_file = f'XBRL_横展開_{company_name}.xlsx'
-    if output_dir:
-        out_file = os.path.join(output_dir, out_file)
+    if base_workbook:
+        out_file = base_workbook
+    else:
+        out_file = f'XBRL_横展開_{company_name}.xlsx'
+        if output_dir:
+            out_file = os.path.join(output_dir, out_file)
 
     debug_log(f"Excel generation (structure) completed in {time.time() - t_excel_start:.2f}s")
     t_save = time.time()
+    span = profile_begin('save')
     wb.save(out_file)
+    profile_end(span)
     debug_log(f"Excel file write (wb.save) completed in {time.time() - t_save:.2f}s")
     debug_log(f"SUCCESS: Excel saved to {out_file} in {time.time() - t_excel_start:.2f}s")
-    debug_log(f"TOTAL: process_xbrl_zips completed in {time.time() - overall_start:.2f}s")
     return out_file
 
+# Columns of the long-format fact table (one row per value cell of the workbook)
+FACT_TABLE_COLUMNS = ['company', 'role', 'path', 'element', 'standard', 'dimension', 'period', 'value']
+
+def build_fact_table(xbrl_data):
+    """Flatten the hierarchy phase result into long-format fact rows.
+
+    Each row corresponds to one (role, presentation path, column key) value,
+    i.e. the same data the Excel backend spreads horizontally, without any
+    openpyxl work. Rows follow the presentation order of each role.
+
+    Args:
+        xbrl_data: Hierarchy phase result built by process_xbrl_zips
+
+    Returns:
+        list[tuple]: Rows ordered as FACT_TABLE_COLUMNS
+    """
+    company_name = xbrl_data['company_name']
+    all_years_data = xbrl_data['all_years_data']
+    rows = []
+    for role, ordered_keys in xbrl_data['role_to_order'].items():
+        role_data = all_years_data.get(role, {})
+        for full_path, _ in ordered_keys:
+            period_vals = role_data.get(full_path)
+            if not period_vals:
+                continue
+            el = full_path.split('::')[-1]
+            if '|' in el: el = el.split('|')[0]
+            for col_key, val in period_vals.items():
+                # col_key is (standard, dim, period)
+                std, dim, period = col_key if len(col_key) == 3 else (None, col_key[0], col_key[1])
+                rows.append((company_name, role, full_path, el, std, dim, period, val))
+    return rows
+
+def _fact_table_path(company_name, extension, output_dir=None):
+    out_file = f'XBRL_facts_{company_name}.{extension}'
+    if output_dir:
+        out_file = os.path.join(output_dir, out_file)
+    return out_file
+
+def write_csv_output(xbrl_data, output_dir=None):
+    """CSV backend: write the long-format fact table as UTF-8 CSV."""
+    import csv
+    t_start = time.time()
+    rows = build_fact_table(xbrl_data)
+    out_file = _fact_table_path(xbrl_data['company_name'], 'csv', output_dir)
+    with profile_span('save', rows=len(rows)):
+        with open(out_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(FACT_TABLE_COLUMNS)
+            writer.writerows(rows)
+    debug_log(f"SUCCESS: CSV fact table ({len(rows)} rows) saved to {out_file} in {time.time() - t_start:.2f}s")
+    return out_file
+
+def write_parquet_output(xbrl_data, output_dir=None):
+    """Parquet backend: write the long-format fact table as a Parquet (Arrow) file.
+
+    Requires pandas plus a Parquet engine (pyarrow or fastparquet).
+    """
+    global HAS_PANDAS
+    try:
+        import pandas as pd
+        HAS_PANDAS = True
+    except ImportError:
+        HAS_PANDAS = False
+        print("Error: pandas is not installed. Parquet output is impossible.", file=sys.stderr)
+        return None
+
+    t_start = time.time()
+    rows = build_fact_table(xbrl_data)
+    out_file = _fact_table_path(xbrl_data['company_name'], 'parquet', output_dir)
+    df = pd.DataFrame(rows, columns=FACT_TABLE_COLUMNS)
+    try:
+        with profile_span('save', rows=len(rows)):
+            df.to_parquet(out_file, index=False)
+    except ImportError as e:
+        print(f"Error: Parquet output requires pyarrow or fastparquet ({e})", file=sys.stderr)
+        return None
+    debug_log(f"SUCCESS: Parquet fact table ({len(rows)} rows) saved to {out_file} in {time.time() - t_start:.2f}s")
+    return out_file
+
+# Output backends selectable via process_xbrl_zips(output_format=...) / --format
+OUTPUT_BACKENDS = {
+    'excel': write_excel_output,
+    'csv': write_csv_output,
+    'parquet': write_parquet_output,
+}
+
+# ============================================================================
+# BATCH LAYER - Per-Company Batch Conversion
+# ============================================================================
+# 【将来の分割先】batch.py
+#
+# 多数のZIPを企業（EDINETコード）ごとにまとめ、企業単位でプロセスプールにより並列変換する
+# - 出力先ディレクトリの batch_manifest.json に入力の指紋・出力ファイル・所要時間を記録
+# - 入力ZIP・変換オプション・変換エンジンが前回と同じ企業は再変換しない
+# - マニフェストは企業の変換が終わるたびに原子的に書き換えるため、中断後の再実行は続きから
+# ============================================================================
+
+BATCH_MANIFEST_NAME = 'batch_manifest.json'
+BATCH_MANIFEST_VERSION = 1
+
+def converter_version():
+    """Hash of the converter and taxonomy dictionary sources and the label cache format.
+
+    Keys the web response cache (app.py) and the batch fingerprints. Cached per process and
+    recomputed when either source's mtime/size changes, so a daemon worker picks up the
+    dictionary rewritten by a background refresh (check_and_update_edinet_taxonomy).
+    """
+    global _CONVERTER_VERSION
+    stamps = []
+    for name in ('convert_xbrl_to_excel.py', 'edinet_taxonomy_dict.py'):
+        try:
+            st = os.stat(os.path.join(SCRIPT_DIR, name))
+            stamps.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamps.append(None)
+    cached = _CONVERTER_VERSION
+    if cached is not None and cached[0] == stamps:
+        return cached[1]
+    import hashlib
+    h = hashlib.sha256()
+    for name in ('convert_xbrl_to_excel.py', 'edinet_taxonomy_dict.py'):
+        try:
+            with open(os.path.join(SCRIPT_DIR, name), 'rb') as f:
+                h.update(f.read())
+        except OSError:
+            h.update(name.encode('utf-8'))
+    h.update(STANDARD_LABELS_CACHE_VERSION.encode('ascii'))
+    version = h.hexdigest()
+    _CONVERTER_VERSION = (stamps, version)
+    return version
+
+# (source stamps, hash) of the last converter_version() computation
+_CONVERTER_VERSION = None
+
+def load_batch_manifest(path):
+    """Previous batch manifest, or an empty one when missing, unreadable or of another version."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('version') != BATCH_MANIFEST_VERSION:
+        return {}
+    return manifest
+
+def write_batch_manifest(path, manifest):
+    """Write the manifest to a temp file and os.replace() it, so a crash never leaves it half written."""
+    fd, tmp_path = tempfile.mkstemp(prefix='.batch_manifest.', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def group_zips_by_company(zip_files, previous_files=None):
+    """Group ZIP files by the EDINET code of their filing.
+
+    Files whose size and modification time match previous_files (the 'files' section of the
+    last manifest) reuse the recorded hash and company; only new or changed files are hashed
+    and inspected (inspect_filing).
+
+    Returns:
+        tuple: ({company key: [paths]}, {absolute path: file entry}, [{'file', 'error'}])
+            The company key is the EDINET code, or 'unknown_<ZIP name>' for a filing without one.
+    """
+    previous_files = previous_files or {}
+    groups, files, errors = {}, {}, []
+    for path in sorted(os.path.abspath(p) for p in zip_files):
+        st = os.stat(path)
+        entry = previous_files.get(path)
+        if not (entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns
+                and entry.get('company')):
+            info = inspect_filing(path)
+            if info.get('error'):
+                errors.append({'file': path, 'error': info['error']})
+                continue
+            stem = os.path.splitext(os.path.basename(path))[0]
+            entry = {
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'sha256': file_sha256(path),
+                'company': info.get('edinet_code') or f'unknown_{stem}',
+                'company_name': info.get('company_name'),
+            }
+        files[path] = entry
+        groups.setdefault(entry['company'], []).append(path)
+    return groups, files, errors
+
+def _convert_batch_company(job):
+    """Process pool worker: convert the ZIPs of one company and time the pipeline phases."""
+    key, paths, out_dir, options = job
+    phase_starts = {}
+
+    def on_progress(phase, done=None, total=None):
+        phase_starts.setdefault(phase, time.time())
+
+    t_start = time.time()
+    result = {'started': t_start}
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        out_file = process_xbrl_zips(paths, output_dir=out_dir, progress_callback=on_progress, **options)
+        if out_file:
+            result.update(status='done', output=os.path.abspath(out_file))
+        else:
+            result.update(status='failed', error='no output was produced')
+    except Exception as e:
+        debug_log(f"Batch conversion failed for {key}: {e}")
+        result.update(status='failed', error=f'{type(e).__name__}: {e}')
+    finally:
+        # Pool workers end with os._exit (no atexit): write this company's log records now
+        shutdown_logging()
+    t_end = time.time()
+    marks = sorted(phase_starts.items(), key=lambda kv: kv[1]) + [(None, t_end)]
+    result.update(
+        finished=t_end,
+        seconds=round(t_end - t_start, 3),
+        phases={phase: round(marks[i + 1][1] - t, 3) for i, (phase, t) in enumerate(marks[:-1])},
+    )
+    return result
+
+def run_batch(zip_files, output_dir, jobs=None, force=False, **options):
+    """Convert ZIPs company by company, one output file per company, resumably.
+
+    Each company (see group_zips_by_company) is converted by process_xbrl_zips in a process
+    pool into <output_dir>/<company key>/. Companies whose fingerprint (input hashes, options,
+    converter_version) matches a finished entry of the previous manifest, and whose output
+    still exists, are skipped unless force is set. The manifest is rewritten after every
+    company, so an interrupted run resumes with the companies that were not finished.
+
+    Args:
+        zip_files: ZIP paths
+        output_dir: Directory for the per-company directories and batch_manifest.json
+        jobs: Number of worker processes (default: min(4, CPU count))
+        force: Convert every company even if unchanged
+        **options: process_xbrl_zips options (output_format, prune_facts, statements, ...)
+
+    Returns:
+        dict: The written manifest
+    """
+    import hashlib
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, BATCH_MANIFEST_NAME)
+    previous = load_batch_manifest(manifest_path)
+    previous_companies = previous.get('companies', {})
+
+    t_start = time.time()
+    groups, files, errors = group_zips_by_company(zip_files, previous.get('files'))
+    version = converter_version()
+    options_key = json.dumps(options, sort_keys=True, default=list)
+
+    companies = {}
+    pending = []
+    for key, paths in sorted(groups.items()):
+        fingerprint = hashlib.sha256('\n'.join(
+            [version, options_key] + sorted(files[p]['sha256'] for p in paths)).encode('utf-8')).hexdigest()
+        prev = previous_companies.get(key, {})
+        entry = {
+            'company_name': next((files[p]['company_name'] for p in paths if files[p].get('company_name')), None),
+            'files': paths,
+            'fingerprint': fingerprint,
+        }
+        if (not force and prev.get('status') == 'done' and prev.get('fingerprint') == fingerprint
+                and prev.get('output') and os.path.exists(prev['output'])):
+            # Unchanged since the last run: keep its output and timings
+            entry.update({k: prev[k] for k in ('output', 'started', 'finished', 'seconds', 'phases') if k in prev})
+            entry.update(status='done', skipped=True)
+        else:
+            entry['status'] = 'pending'
+            pending.append((key, paths, os.path.join(output_dir, key), options))
+        companies[key] = entry
+
+    manifest = {
+        'version': BATCH_MANIFEST_VERSION,
+        'converter_version': version,
+        'options': json.loads(options_key),
+        'started': t_start,
+        'finished': None,
+        'files': files,
+        'errors': errors,
+        'companies': companies,
+    }
+    write_batch_manifest(manifest_path, manifest)
+    debug_log(f"Batch: {len(groups)} companies, {len(pending)} to convert, {len(errors)} unreadable ZIPs")
+
+    def record(key, result):
+        companies[key].update(result)
+        companies[key].pop('skipped', None)
+        write_batch_manifest(manifest_path, manifest)
+        debug_log(f"Batch: {key} {result['status']} in {result['seconds']:.2f}s")
+
+    max_workers = jobs or min(4, os.cpu_count() or 1)
+    if pending and max_workers == 1:
+        for job in pending:
+            record(job[0], _convert_batch_company(job))
+    elif pending:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+            futures = {executor.submit(_convert_batch_company, job): job[0] for job in pending}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # e.g. a worker killed by the OOM killer (BrokenProcessPool)
+                    result = {'status': 'failed', 'error': f'{type(e).__name__}: {e}',
+                              'finished': time.time(), 'seconds': 0.0}
+                record(futures[future], result)
+
+    statuses = [c['status'] for c in companies.values()]
+    manifest['finished'] = time.time()
+    manifest['seconds'] = round(manifest['finished'] - t_start, 3)
+    manifest['summary'] = {
+        'companies': len(companies),
+        'converted': sum(1 for c in companies.values() if c['status'] == 'done' and not c.get('skipped')),
+        'skipped': sum(1 for c in companies.values() if c.get('skipped')),
+        'failed': statuses.count('failed'),
+        'unreadable_zips': len(errors),
+    }
+    write_batch_manifest(manifest_path, manifest)
+    return manifest
+
 # ============================================================================
 # CLI ENTRY POINT
 # ============================================================================
@@ -3717,13 +6130,75 @@ def process_xbrl_zips(zip_paths, output_dir=None):
 # ============================================================================
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python convert_xbrl_to_excel.py <path_to_zip_or_dir1> [<path_to_zip_or_dir2> ...]", file=sys.stderr)
-        sys.exit(1)
-        
-    input_paths = sys.argv[1:]
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert EDINET XBRL ZIP files into a horizontal Excel workbook or a long-format fact table.')
+    parser.add_argument('paths', nargs='*', help='ZIP files or directories containing ZIP files')
+    parser.add_argument('--format', dest='output_format', choices=list(OUTPUT_BACKENDS), default='excel',
+                        help='Output backend (default: excel)')
+    parser.add_argument('--output-dir', default=None, help='Directory for the output file (default: current directory)')
+    parser.add_argument('--warehouse', default=None, metavar='DB',
+                        help='SQLite fact warehouse: ingest only new ZIPs and render from all stored filings of the same companies')
+    parser.add_argument('--company', dest='edinet_codes', action='append', default=[], metavar='EDINET_CODE',
+                        help='Render this company from the warehouse (repeatable; no ZIP needed)')
+    parser.add_argument('--save-state', action='store_true',
+                        help='Save a sidecar state file next to the workbook for later --update runs')
+    parser.add_argument('--update', dest='update_workbook', default=None, metavar='WORKBOOK',
+                        help='Merge the given ZIPs into WORKBOOK (saved with --save-state) and regenerate only changed sheets')
+    parser.add_argument('--prune-facts', action='store_true',
+                        help='Skip facts of elements outside the rendered presentation roles while parsing (faster)')
+    parser.add_argument('--skip-covered-periods', action='store_true',
+                        help='Skip facts of older filings in periods that a newer given filing already reports (faster)')
+    parser.add_argument('--fill-gaps', action='store_true',
+                        help='With --skip-covered-periods, still take values the newer filing does not report from older filings')
+    parser.add_argument('--statements', default=None, metavar='TYPES',
+                        help=f"Comma-separated statement types to convert ({','.join(STATEMENT_TYPES)}; default: all)")
+    parser.add_argument('--scope', choices=['consolidated', 'standalone'], default=None,
+                        help='Convert only consolidated or only standalone statements (default: both)')
+    parser.add_argument('--years', type=int, default=None, metavar='N',
+                        help='Keep only the last N fiscal years')
+    parser.add_argument('--inspect', action='store_true',
+                        help='Print company, periods, standards and statements of the ZIPs as JSON without converting')
+    parser.add_argument('--batch', action='store_true',
+                        help='Group the ZIPs by EDINET code and write one output per company under --output-dir, '
+                             f'skipping unchanged companies (progress and timings in {BATCH_MANIFEST_NAME})')
+    parser.add_argument('--jobs', type=int, default=None, metavar='N',
+                        help='With --batch, number of worker processes (default: min(4, CPU count))')
+    parser.add_argument('--force', action='store_true',
+                        help='With --batch, convert every company even if its inputs are unchanged')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help='Write per-phase timings, counts and peak memory of the conversion to FILE')
+    parser.add_argument('--profile-format', choices=list(PROFILE_FORMATS), default='json',
+                        help='Profile format: span tree with summary, or Chrome trace (chrome://tracing, Perfetto)')
+    args = parser.parse_args()
+    if args.edinet_codes and not args.warehouse:
+        parser.error('--company requires --warehouse')
+    if args.warehouse and (args.save_state or args.update_workbook):
+        parser.error('--warehouse cannot be combined with --save-state / --update')
+    if (args.prune_facts or args.skip_covered_periods) and (args.warehouse or args.save_state or args.update_workbook):
+        parser.error('--prune-facts / --skip-covered-periods cannot be combined with --warehouse / --save-state / --update')
+    if args.fill_gaps and not args.skip_covered_periods:
+        parser.error('--fill-gaps requires --skip-covered-periods')
+    statements = None
+    if args.statements:
+        statements = [t.strip().lower() for t in args.statements.split(',') if t.strip()]
+        unknown = [t for t in statements if t not in STATEMENT_TYPES]
+        if unknown or not statements:
+            parser.error(f"--statements: unknown type {', '.join(unknown)} (choose from {','.join(STATEMENT_TYPES)})")
+    if args.years is not None and args.years < 1:
+        parser.error('--years must be a positive number')
+    if (statements or args.scope or args.years) and (args.warehouse or args.save_state or args.update_workbook):
+        parser.error('--statements / --scope / --years cannot be combined with --warehouse / --save-state / --update')
+    if args.batch and (args.warehouse or args.save_state or args.update_workbook or args.inspect):
+        parser.error('--batch cannot be combined with --warehouse / --save-state / --update / --inspect')
+    if (args.jobs is not None or args.force) and not args.batch:
+        parser.error('--jobs / --force require --batch')
+    if args.jobs is not None and args.jobs < 1:
+        parser.error('--jobs must be a positive number')
+    if args.profile and (args.batch or args.inspect):
+        parser.error('--profile cannot be combined with --batch / --inspect')
+
     zip_files = []
-    for p in input_paths:
+    for p in args.paths:
         if os.path.isfile(p) and p.lower().endswith('.zip'):
             zip_files.append(p)
         elif os.path.isdir(p):
@@ -3733,11 +6208,43 @@ def main():
                     if f.lower().endswith('.zip'):
                         zip_files.append(os.path.join(root, f))
     
-    if not zip_files:
+    if args.inspect:
+        if not zip_files:
+            print("Error: No ZIP files found in provided paths.", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps([inspect_filing(p) for p in sorted(zip_files)], ensure_ascii=False, indent=2))
+        return
+
+    if not zip_files and not args.edinet_codes and not args.update_workbook:
         print("Error: No ZIP files found in provided paths.", file=sys.stderr)
         sys.exit(1)
-        
-    process_xbrl_zips(zip_files)
+
+    if args.batch:
+        manifest = run_batch(zip_files, args.output_dir or '.', jobs=args.jobs, force=args.force,
+                             output_format=args.output_format, prune_facts=args.prune_facts,
+                             skip_covered_periods=args.skip_covered_periods, fill_period_gaps=args.fill_gaps,
+                             statements=statements, scope=args.scope, years=args.years)
+        for key, entry in sorted(manifest['companies'].items()):
+            state = 'skipped' if entry.get('skipped') else entry['status']
+            detail = entry.get('output') if entry['status'] == 'done' else entry.get('error')
+            print(f"{key}\t{state}\t{entry.get('seconds', 0):.2f}s\t{detail}")
+        for err in manifest['errors']:
+            print(f"-\tunreadable\t-\t{err['file']}: {err['error']}")
+        summary = manifest['summary']
+        print(f"{summary['companies']} companies: {summary['converted']} converted, {summary['skipped']} skipped, "
+              f"{summary['failed']} failed in {manifest['seconds']:.2f}s", file=sys.stderr)
+        if summary['failed'] or summary['unreadable_zips']:
+            sys.exit(1)
+        return
+
+    from contextlib import nullcontext
+    with profiling(args.profile, args.profile_format, zips=len(zip_files)) if args.profile else nullcontext():
+        process_xbrl_zips(zip_files, output_dir=args.output_dir, output_format=args.output_format,
+                          warehouse=args.warehouse, edinet_codes=args.edinet_codes,
+                          save_state=args.save_state, update_workbook=args.update_workbook,
+                          prune_facts=args.prune_facts, skip_covered_periods=args.skip_covered_periods,
+                          fill_period_gaps=args.fill_gaps, statements=statements, scope=args.scope,
+                          years=args.years)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -16,12 +16,17 @@ XBRL to Excel Converter - CGI Entry Point
    - パス設定（アプリケーションディレクトリ、仮想環境）
    - 将来の分割先: deploy/cgi/index.cgi
 
-2. IMPORT PHASE (24-31行)
+2. FORWARD PHASE
+   - 常駐ワーカー（xbrl_daemon.py）が起動していれば、Unixソケット経由でリクエストを転送して終了
+   - XBRL_DAEMON_AUTOSTART=1 の場合、未起動ならバックグラウンドで起動（このリクエストは従来どおり処理）
+   - 将来の分割先: deploy/cgi/forward.py
+
+3. IMPORT PHASE (24-31行)
    - Flask アプリケーションのインポート
    - エラーハンドリング（診断情報出力）
    - 将来の分割先: deploy/cgi/index.cgi
 
-3. EXECUTION PHASE (33-41行)
+4. EXECUTION PHASE (33-41行)
    - CGIハンドラーによるアプリケーション実行
    - エラーハンドリング（診断情報出力）
    - 将来の分割先: deploy/cgi/index.cgi
@@ -34,6 +39,7 @@ XBRL to Excel Converter - CGI Entry Point
 
 【依存関係】
 - app.py (Flask Application)
+- xbrl_daemon.py (Persistent Worker Daemon, optional)
 - venv/lib/python3.x/site-packages (Virtual Environment)
 
 【注意事項】
@@ -65,6 +71,25 @@ for py_ver in ['3.10', '3.9']:
     if os.path.exists(venv_site_packages):
         sys.path.insert(0, venv_site_packages)
 
+# ========================================================================
+# FORWARD PHASE
+# ========================================================================
+# 【将来の分割先】deploy/cgi/forward.py
+
+# 常駐ワーカーが使えれば Flask 等を import せずに転送する（CGIの起動コストを回避）
+if __name__ == '__main__' and os.environ.get('XBRL_DAEMON', '1') != '0':
+    try:
+        import xbrl_daemon
+        if xbrl_daemon.forward_cgi_request():
+            sys.exit(0)
+        if os.environ.get('XBRL_DAEMON_AUTOSTART') == '1':
+            xbrl_daemon.autostart()
+    except SystemExit:
+        raise
+    except Exception:
+        # 転送に失敗した場合は従来どおりこのプロセスで処理する
+        traceback.print_exc(file=sys.stderr)
+
 # ========================================================================
 # IMPORT PHASE
 # ========================================================================
@@ -88,6 +113,13 @@ except Exception:
 if __name__ == '__main__':
     try:
         CGIHandler().run(app)
+        # 応答を完了させる: 標準出力を閉じてサーバーに応答終了を伝える。
+        # 非同期ジョブ（POST /jobs）がある場合、プロセスはジョブ完了まで残る
+        # （ThreadPoolExecutor のワーカーは終了時に join される）
+        sys.stdout.flush()
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
     except Exception:
         print("Content-Type: text/plain; charset=utf-8\n")
         print("--- Diagnostic Info: Error during CGI Execution ---")
@@ -26,7 +26,7 @@ EDINET Taxonomy Dictionary Auto-Update Script
    - 将来の分割先: taxonomy/updater.py
 
 4. DOWNLOAD & HASH (225-395行)
-   - タクソノミファイルのダウンロード
+   - タクソノミファイルのダウンロード（convert_xbrl_to_excel.download_file: 再開・条件付きGET・共有キャッシュ）
    - ハッシュ検証
    - 将来の分割先: taxonomy/updater.py
 
@@ -60,6 +60,8 @@ Features:
     - Efficient HEAD request to check for updates without downloading
     - Conditional GET (If-None-Match/If-Modified-Since) for 304 optimization
     - SHA256 hash verification for downloaded files
+    - Resumable downloads (HTTP Range) through the shared download cache
+      (edinet_taxonomies/downloads/, shared with convert_xbrl_to_excel.py)
     - Metadata tracking to avoid unnecessary downloads
 
 Update Detection Strategy (Hybrid Approach):
@@ -71,12 +73,14 @@ Update Detection Strategy (Hybrid Approach):
     6. Regenerate dictionary only if hash changed
 
 Usage:
-    python3 update_edinet_taxonomy.py [--force] [--debug]
+    python3 update_edinet_taxonomy.py [--force] [--debug] [--if-idle]
 
 Options:
     --force    Force update even if the file hasn't changed
                (skips remote check and hash verification)
     --debug    Enable debug-level logging (verbose output)
+    --if-idle  Exit immediately if another update holds the lock
+               (instead of waiting for it and checking again)
 
 Exit Codes:
     0 - Success (updated or no update needed)
@@ -160,7 +164,7 @@ logger = None
 # ============================================================================
 
 @contextmanager
-def file_lock(lock_path):
+def file_lock(lock_path, blocking=True):
     """
     Cross-process file lock using fcntl (Unix/Linux/Mac).
 
@@ -169,9 +173,10 @@ def file_lock(lock_path):
 
     Args:
         lock_path: Path to lock file
+        blocking: If False, do not wait for another holder (yields False instead)
 
     Yields:
-        None
+        bool: True if the lock is held (always True when blocking)
 
     Note:
         On Windows (where fcntl is unavailable), this becomes a no-op.
@@ -183,23 +188,29 @@ def file_lock(lock_path):
             # Create lock file if it doesn't exist
             lock_file = open(lock_path, 'w')
 
-            # Acquire exclusive lock (blocks until available)
+            # Acquire exclusive lock (blocks until available unless blocking=False)
             # LOCK_EX: exclusive lock
             # This will wait if another process holds the lock
             try:
                 logger.debug(f"Acquiring file lock: {lock_path}")
-                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
                 logger.debug(f"File lock acquired: {lock_path}")
             except IOError as e:
+                if not blocking:
+                    logger.debug(f"File lock is held by another process: {lock_path}")
+                    lock_file.close()
+                    lock_file = None
+                    yield False
+                    return
                 logger.warning(f"Could not acquire file lock: {e}")
                 # Continue anyway (non-fatal)
 
-            yield
+            yield True
         else:
             # Windows: no file lock available
             # User must ensure no concurrent update processes
             logger.debug("fcntl not available, skipping file lock (ensure no concurrent updates on Windows)")
-            yield
+            yield True
     finally:
         if lock_file:
             try:
@@ -307,110 +318,70 @@ def check_remote_update():
 def download_taxonomy(use_conditional_request=False, metadata=None):
     """
     Download EDINET taxonomy file with optional conditional request.
-    Uses atomic rename to prevent partial file corruption.
+
+    The transfer goes through convert_xbrl_to_excel.download_file, which keeps the file
+    in the shared download cache (edinet_taxonomies/downloads/), resumes interrupted
+    downloads with HTTP Range and revalidates with If-None-Match/If-Modified-Since.
+    TAXONOMY_FILE is then replaced atomically from the cached copy.
 
     Args:
-        use_conditional_request: If True, use If-None-Match or If-Modified-Since headers
-        metadata: Previous metadata dict with ETag/Last-Modified
+        use_conditional_request: If True, revalidate the cached copy (304 optimization);
+            if False, download again regardless of the cache (--force)
+        metadata: Previous metadata dict with ETag/Last-Modified (saved again on 304)
 
     Returns:
         tuple: (success: bool, was_modified: bool)
     """
     logger.info(f"Downloading EDINET taxonomy from: {EDINET_TAXONOMY_URL}")
 
-    # Use temporary file for atomic download
-    import tempfile
-    temp_fd, temp_path = tempfile.mkstemp(suffix='.xlsx', prefix='edinet_taxonomy_')
-
     try:
-        req = urllib.request.Request(EDINET_TAXONOMY_URL)
+        from convert_xbrl_to_excel import download_file
+        result = download_file(EDINET_TAXONOMY_URL, force=not use_conditional_request)
+    except Exception as e:
+        logger.error(f"✗ Download failed: {e}")
+        return False, False
 
-        # Add conditional headers if available
-        if use_conditional_request and metadata:
-            if metadata.get('etag'):
-                req.add_header('If-None-Match', metadata['etag'])
-                logger.debug(f"  Using If-None-Match: {metadata['etag']}")
-            elif metadata.get('last_modified'):
-                req.add_header('If-Modified-Since', metadata['last_modified'])
-                logger.debug(f"  Using If-Modified-Since: {metadata['last_modified']}")
+    if not result['modified'] and os.path.exists(TAXONOMY_FILE):
+        # 304 Not Modified (or network unavailable with a cached copy) - no need to download
+        logger.info("✓ Remote file unchanged (304 Not Modified)")
 
-        try:
-            with urllib.request.urlopen(req, timeout=30) as response:
-                # Download to temporary file first (atomic operation)
-                with os.fdopen(temp_fd, 'wb') as f:
-                    f.write(response.read())
-
-                # Verify file was written successfully
-                if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
-                    raise IOError("Downloaded file is empty or missing")
-
-                # Atomic rename: only replace original file if download succeeded
-                # This prevents partial/corrupted files
-                backup_path = None
-                if os.path.exists(TAXONOMY_FILE):
-                    # Backup old file before replacing (optional safety measure)
-                    backup_path = TAXONOMY_FILE + '.bak'
-                    if os.path.exists(backup_path):
-                        os.remove(backup_path)
-                    os.rename(TAXONOMY_FILE, backup_path)
-
-                # Atomic rename from temp to final location
-                os.rename(temp_path, TAXONOMY_FILE)
-
-                # Remove backup if everything succeeded
-                if backup_path and os.path.exists(backup_path):
-                    os.remove(backup_path)
-
-                logger.info(f"✓ Downloaded: {TAXONOMY_FILE}")
-
-                # Save new metadata
-                new_metadata = {
-                    'etag': response.headers.get('ETag'),
-                    'last_modified': response.headers.get('Last-Modified'),
-                    'content_length': response.headers.get('Content-Length'),
-                    'downloaded_at': datetime.now().isoformat()
-                }
-                save_metadata(new_metadata)
-
-                return True, True
-
-        except urllib.error.HTTPError as e:
-            if e.code == 304:
-                # 304 Not Modified - no need to download
-                logger.info("✓ Remote file unchanged (304 Not Modified)")
-
-                # Update metadata even on 304 to track last check time
-                # The metadata passed in contains the latest ETag/Last-Modified from HEAD request
-                if metadata:
-                    updated_metadata = metadata.copy()
-                    updated_metadata['checked_at'] = datetime.now().isoformat()
-                    save_metadata(updated_metadata)
-
-                # Clean up temp file
-                try:
-                    os.close(temp_fd)
-                except:
-                    pass
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                return True, False
-            else:
-                raise
+        # Update metadata even on 304 to track last check time
+        # The metadata passed in contains the latest ETag/Last-Modified from HEAD request
+        if metadata:
+            updated_metadata = metadata.copy()
+            updated_metadata['checked_at'] = datetime.now().isoformat()
+            save_metadata(updated_metadata)
+        return True, False
 
+    # Atomic replace: copy next to TAXONOMY_FILE first so a reader never sees a partial file
+    import shutil
+    import tempfile
+    temp_fd, temp_path = tempfile.mkstemp(suffix='.xlsx', prefix='edinet_taxonomy_',
+                                          dir=os.path.dirname(os.path.abspath(TAXONOMY_FILE)))
+    try:
+        with os.fdopen(temp_fd, 'wb') as f, open(result['path'], 'rb') as src:
+            shutil.copyfileobj(src, f)
+        os.replace(temp_path, TAXONOMY_FILE)
     except Exception as e:
-        logger.error(f"✗ Download failed: {e}")
-        # Clean up temp file on error
-        try:
-            os.close(temp_fd)
-        except:
-            pass
-        try:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        except:
-            pass
+        logger.error(f"✗ Could not copy downloaded file: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
         return False, False
 
+    logger.info(f"✓ Downloaded: {TAXONOMY_FILE}")
+    logger.debug(f"  Cached copy: {result['path']} (SHA256 {result['sha256'][:16]}...)")
+
+    # Save new metadata
+    new_metadata = {
+        'etag': result['etag'],
+        'last_modified': result['last_modified'],
+        'content_length': str(result['size']),
+        'downloaded_at': datetime.now().isoformat()
+    }
+    save_metadata(new_metadata)
+
+    return True, True
+
 def save_metadata(metadata):
     """Save remote file metadata (ETag, Last-Modified, etc.)"""
     try:
@@ -489,13 +460,13 @@ def get_column_index_map(ws, header_row=2):
     This makes the code resilient to column reordering.
 
     Args:
-        ws: openpyxl worksheet
+        ws: openpyxl worksheet (read-only worksheets are supported)
         header_row: Row number containing headers (1-indexed)
 
     Returns:
         dict: {column_name: index}
     """
-    headers = [cell.value for cell in ws[header_row]]
+    headers = next(ws.iter_rows(min_row=header_row, max_row=header_row, values_only=True), ())
     idx_map = {name: i for i, name in enumerate(headers) if name}
     return idx_map
 
@@ -515,72 +486,126 @@ def get_column_index_map(ws, header_row=2):
 #       将来的に output/mappings.py で統合
 # ============================================================================
 
-def generate_dictionary():
+# Skip metadata sheets (not taxonomy data)
+SKIP_SHEETS = ['目次', '勘定科目リストについて']
+
+# Required header columns (row 2) of every industry sheet
+REQUIRED_COLUMNS = ['要素名', '名前空間プレフィックス', '標準ラベル（日本語）']
+
+# Namespace filtering: Use BLACKLIST instead of whitelist
+# This allows IFRS, extensions, and future taxonomies
+#
+# Design rationale:
+# - EDINET taxonomy may add new namespaces in the future (jpigp_cor, ifrs_full, etc.)
+# - Whitelist approach would require code changes for each taxonomy update
+# - Blacklist approach automatically accepts valid namespaces from EDINET
+# - Company-specific extensions (e.g., jpcrp030000-asr_E01225-000) won't match
+#   during XBRL parsing anyway (element names differ)
+NAMESPACE_BLACKLIST = {
+    '名前空間プレフィックス',  # Header itself (not actual data)
+    None,                      # Empty namespace
+    '',                        # Empty string
+    # Add more here if needed (e.g., internal test namespaces)
+}
+
+# Worker processes for per-sheet parsing (1 = parse sheets sequentially in this process)
+PARSE_JOBS = max(1, int(os.environ.get('EDINET_TAXONOMY_JOBS', '1')))
+
+
+def parse_sheet_entries(ws):
+    """
+    Stream one industry sheet and return its (element_name, label, namespace) rows in order.
+
+    ws must come from a read-only workbook (rows are streamed from the XML, no cell
+    objects are kept).
+
+    Returns:
+        tuple: (entries, missing_columns) - entries is empty when required columns are missing
+    """
+    # Build column index map from header (row 2)
+    # This makes code resilient to column reordering
+    idx_map = get_column_index_map(ws, header_row=2)
+
+    # Validate required columns exist
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in idx_map]
+    if missing_columns:
+        return [], missing_columns
+    element_idx = idx_map['要素名']
+    namespace_idx = idx_map['名前空間プレフィックス']
+    label_idx = idx_map['標準ラベル（日本語）']
+    width = max(element_idx, namespace_idx, label_idx) + 1
+
+    entries = []
+    for row in ws.iter_rows(min_row=3, values_only=True):
+        # Read-only rows can be shorter than the header (trailing empty cells)
+        if len(row) < width:
+            row = tuple(row) + (None,) * (width - len(row))
+        # Use header-based indexing instead of hard-coded positions
+        element_name = row[element_idx]
+        namespace = row[namespace_idx]
+        jp_label = row[label_idx]
+
+        # Apply blacklist filter (more permissive than whitelist)
+        # This captures: jppfs_cor, jpigp_cor, ifrs_full, jpcrp_cor, extensions, etc.
+        if not element_name or not jp_label or namespace in NAMESPACE_BLACKLIST:
+            continue
+        entries.append((element_name, str(jp_label), namespace))
+    return entries, []
+
+
+def read_sheet_entries(taxonomy_file, sheet_name):
+    """
+    Open the workbook and parse one sheet (worker process entry for per-sheet parallel parsing).
+
+    Returns:
+        tuple: (entries, missing_columns) - see parse_sheet_entries
+    """
+    wb = openpyxl.load_workbook(taxonomy_file, read_only=True, data_only=True)
+    try:
+        return parse_sheet_entries(wb[sheet_name])
+    finally:
+        wb.close()
+
+
+def generate_dictionary(jobs=None):
     """Generate dictionary from EDINET taxonomy (all industry sheets)"""
     logger.info(f"Generating dictionary from: {TAXONOMY_FILE}")
+    jobs = PARSE_JOBS if jobs is None else max(1, jobs)
 
     try:
-        wb = openpyxl.load_workbook(TAXONOMY_FILE, data_only=True)
-
-        # Skip metadata sheets (not taxonomy data)
-        SKIP_SHEETS = ['目次', '勘定科目リストについて']
+        # Read-only mode: rows are streamed per sheet
+        wb = openpyxl.load_workbook(TAXONOMY_FILE, read_only=True, data_only=True)
+        try:
+            sheet_names = [name for name in wb.sheetnames if name not in SKIP_SHEETS]
+
+            # Extract from ALL industry sheets (not just '一般商工業')
+            # This ensures we capture industry-specific elements (banking, insurance, etc.)
+            if jobs > 1 and len(sheet_names) > 1:
+                # Each worker process opens its own workbook
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=min(jobs, len(sheet_names))) as pool:
+                    sheet_entries = list(pool.map(read_sheet_entries, [TAXONOMY_FILE] * len(sheet_names), sheet_names))
+            else:
+                sheet_entries = [parse_sheet_entries(wb[name]) for name in sheet_names]
+        finally:
+            wb.close()
 
-        # Extract from ALL industry sheets (not just '一般商工業')
-        # This ensures we capture industry-specific elements (banking, insurance, etc.)
         edinet_dict = {}
         sheets_processed = []
         namespace_stats = {}  # Track namespace usage for transparency
 
-        for sheet_name in wb.sheetnames:
-            if sheet_name in SKIP_SHEETS:
-                continue
-
-            ws = wb[sheet_name]
-            sheet_count = 0
-
-            # Build column index map from header (row 2)
-            # This makes code resilient to column reordering
-            idx_map = get_column_index_map(ws, header_row=2)
-
-            # Validate required columns exist
-            required_columns = ['要素名', '名前空間プレフィックス', '標準ラベル（日本語）']
-            missing_columns = [col for col in required_columns if col not in idx_map]
+        # Merge in workbook order so that the first occurrence still wins
+        for sheet_name, (entries, missing_columns) in zip(sheet_names, sheet_entries):
             if missing_columns:
                 logger.warning(f"  ⚠ Skipping sheet '{sheet_name}': Missing columns {missing_columns}")
                 continue
 
-            # Namespace filtering: Use BLACKLIST instead of whitelist
-            # This allows IFRS, extensions, and future taxonomies
-            #
-            # Design rationale:
-            # - EDINET taxonomy may add new namespaces in the future (jpigp_cor, ifrs_full, etc.)
-            # - Whitelist approach would require code changes for each taxonomy update
-            # - Blacklist approach automatically accepts valid namespaces from EDINET
-            # - Company-specific extensions (e.g., jpcrp030000-asr_E01225-000) won't match
-            #   during XBRL parsing anyway (element names differ)
-            NAMESPACE_BLACKLIST = {
-                '名前空間プレフィックス',  # Header itself (not actual data)
-                None,                      # Empty namespace
-                '',                        # Empty string
-                # Add more here if needed (e.g., internal test namespaces)
-            }
-
-            for row in ws.iter_rows(min_row=3, values_only=True):
-                # Use header-based indexing instead of hard-coded positions
-                element_name = row[idx_map['要素名']]
-                namespace = row[idx_map['名前空間プレフィックス']]
-                jp_label = row[idx_map['標準ラベル（日本語）']]
-
-                # Apply blacklist filter (more permissive than whitelist)
-                # This captures: jppfs_cor, jpigp_cor, ifrs_full, jpcrp_cor, extensions, etc.
-                if not element_name or not jp_label or namespace in NAMESPACE_BLACKLIST:
-                    continue
-
+            sheet_count = 0
+            for element_name, label, namespace in entries:
                 # Skip if already exists (first occurrence wins - usually from '一般商工業')
                 if element_name in edinet_dict:
                     continue
 
-                label = str(jp_label)
                 # Shorten labels with "or loss" notation
                 if '又は' in label and ('損失' in label or '損' in label) and '（△）' in label:
                     parts = label.split('又は')
@@ -716,11 +741,12 @@ def generate_dictionary():
 # ============================================================================
 
 def write_dictionary_file(final_dict, edinet_count, custom_count):
-    """Write dictionary to Python file"""
+    """Write dictionary to Python file (atomically: readers never see a partial file)"""
     logger.info(f"Writing dictionary to: {OUTPUT_FILE}")
 
+    tmp_file = OUTPUT_FILE + '.tmp'
     try:
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
             f.write('#!/usr/bin/env python3\n')
             f.write('# -*- coding: utf-8 -*-\n')
             f.write('"""\n')
@@ -750,13 +776,22 @@ def write_dictionary_file(final_dict, edinet_count, custom_count):
 
             f.write('}\n')
 
+        os.replace(tmp_file, OUTPUT_FILE)
         logger.info(f"✓ Dictionary written to: {OUTPUT_FILE}")
-        return True
-
     except Exception as e:
         logger.error(f"✗ File write failed: {e}")
         return False
 
+    # Compact binary copy alongside the .py, so the converter never has to compile the literal
+    try:
+        from convert_xbrl_to_excel import write_edinet_dict_artifact, _EDINET_DICT_ARTIFACT
+        write_edinet_dict_artifact(final_dict, os.path.abspath(OUTPUT_FILE))
+        logger.info(f"✓ Binary dictionary written to: {os.path.basename(_EDINET_DICT_ARTIFACT)}")
+    except Exception as e:
+        # Non-fatal: convert_xbrl_to_excel.py rebuilds it from the .py on first use
+        logger.warning(f"  ⚠ Could not write binary dictionary: {e}")
+    return True
+
 # ============================================================================
 # MAIN FUNCTION
 # ============================================================================
@@ -780,6 +815,9 @@ def main():
     # Parse command-line arguments
     force = '--force' in sys.argv
     debug = '--debug' in sys.argv
+    # --if-idle: exit right away if another update is already running
+    # (used by convert_xbrl_to_excel.py's background refresh to deduplicate refreshers)
+    if_idle = '--if-idle' in sys.argv
 
     # Setup logging (must be done first)
     logger = setup_logging(debug=debug)
@@ -794,7 +832,10 @@ def main():
     # - Multiple cron jobs run simultaneously
     # - Manual update runs while cron job is active
     # - convert_xbrl_to_excel.py reads files being updated
-    with file_lock(LOCK_FILE):
+    with file_lock(LOCK_FILE, blocking=not if_idle) as acquired:
+        if not acquired:
+            logger.info("Another update is already running - nothing to do")
+            return 0
         return _main_locked(force, debug)
 
 def _main_locked(force, debug):
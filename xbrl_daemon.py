@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+XBRL to Excel Converter - Persistent Worker Daemon
+
+CGIではリクエストごとに Python を起動し、Flask / werkzeug / lxml / openpyxl / 変換エンジンを
+importし直す。このデーモンはそれらとタクソノミ辞書を一度だけ読み込み、fork した常駐ワーカーで
+リクエストを処理する。index.cgi は Unix ソケットが使えればリクエストをここへ転送し、
+使えなければ従来どおり自プロセスで処理する（フォールバック）。
+
+【プログラム構成】
+このファイルは以下の機能ブロックで構成されています:
+
+1. SETTINGS
+   - ソケットパス、ワーカー数、ワーカーの再起動間隔（環境変数）
+   - 将来の分割先: deploy/daemon/settings.py
+
+2. PRELOAD
+   - Flask アプリ、変換エンジン、lxml / openpyxl、共通辞書・キャッシュ済みタクソノミの事前読み込み
+   - 将来の分割先: deploy/daemon/preload.py
+
+3. WORKER
+   - 転送されたCGIリクエスト（環境変数＋リクエストボディ）を WSGI アプリで処理し、CGI形式の応答を返す
+   - 将来の分割先: deploy/daemon/worker.py
+
+4. MASTER (PRE-FORK)
+   - ソケットを開いてワーカーを fork、終了したワーカーの再起動、SIGTERM で全体を停止
+   - 将来の分割先: deploy/daemon/master.py
+
+5. FORWARDING CLIENT
+   - index.cgi から呼ばれる転送処理（軽量: socket / json / wsgiref.handlers のみ使用）
+   - 将来の分割先: deploy/cgi/forward.py
+
+6. CLI ENTRY POINT
+   - 起動（--detach でバックグラウンド化）、停止（--stop）
+
+【プロトコル】
+index.cgi → デーモン: 1行目にJSON（CGI環境変数）、続けてリクエストボディ（CONTENT_LENGTH バイト）
+デーモン → index.cgi: CGIHandler と同じ形式の応答（Status: / ヘッダー / 本文）。接続を閉じたら終了
+
+【依存関係】
+- app.py (Flask Application)
+- convert_xbrl_to_excel.py (Core Logic)
+- index.cgi (転送元)
+
+Usage:
+    ./venv/bin/python xbrl_daemon.py            # フォアグラウンドで起動
+    ./venv/bin/python xbrl_daemon.py --detach   # バックグラウンドで起動（cron の @reboot 等から）
+    ./venv/bin/python xbrl_daemon.py --stop     # 停止
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import signal
+import socket
+
+# ========================================================================
+# SETTINGS
+# ========================================================================
+# 【将来の分割先】deploy/daemon/settings.py
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DAEMON_SOCKET = os.environ.get('XBRL_DAEMON_SOCKET') or os.path.join(APP_DIR, '.xbrl_daemon.sock')
+DAEMON_WORKERS = max(1, int(os.environ.get('XBRL_DAEMON_WORKERS', '2')))
+# メモリリーク対策: この件数を処理したワーカーは（実行中のジョブ完了後に）入れ替える
+DAEMON_MAX_REQUESTS = max(1, int(os.environ.get('XBRL_DAEMON_MAX_REQUESTS', '500')))
+DAEMON_LOG_FILE = os.path.join(APP_DIR, 'xbrl_daemon.log')
+
+
+def _lock_path(sock_path):
+    return sock_path + '.lock'
+
+
+def _log(message):
+    sys.stderr.write(time.strftime('%Y-%m-%d %H:%M:%S ') + f'[xbrl_daemon {os.getpid()}] {message}\n')
+    sys.stderr.flush()
+
+
+# ========================================================================
+# PRELOAD
+# ========================================================================
+# 【将来の分割先】deploy/daemon/preload.py
+
+def preload():
+    """Import the app and heavy libraries and warm the taxonomy caches (runs once, before fork)."""
+    t_start = time.time()
+
+    # 仮想環境 (venv) のパッケージパスを追加 (index.cgi と同じ)
+    for py_ver in ['3.10', '3.9']:
+        venv_site_packages = os.path.join(APP_DIR, f'venv/lib/python{py_ver}/site-packages')
+        if os.path.exists(venv_site_packages) and venv_site_packages not in sys.path:
+            sys.path.insert(0, venv_site_packages)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+
+    from app import app
+    import convert_xbrl_to_excel
+    import openpyxl  # noqa: F401  (used lazily by the Excel backend)
+
+    convert_xbrl_to_excel.get_edinet_common_dict()
+
+    # Standard labels of every taxonomy year already cached on disk
+    cache_dir = os.path.join(APP_DIR, 'edinet_taxonomies')
+    years = []
+    if os.path.isdir(cache_dir):
+        for name in sorted(os.listdir(cache_dir)):
+            if name.isdigit() and os.path.exists(os.path.join(cache_dir, name, 'standard_labels.json')):
+                convert_xbrl_to_excel.get_standard_labels(name)
+                years.append(name)
+
+    _log(f"preloaded app, converter and taxonomies {years} in {time.time() - t_start:.2f}s")
+    return app
+
+
+# ========================================================================
+# WORKER
+# ========================================================================
+# 【将来の分割先】deploy/daemon/worker.py
+
+def serve_connection(conn, app):
+    """Run one forwarded CGI request through the WSGI app and write the CGI response back."""
+    from wsgiref.handlers import BaseCGIHandler
+
+    class ForwardedCGIHandler(BaseCGIHandler):
+        # The request environment comes from index.cgi, not from the daemon's own os.environ
+        os_environ = {}
+        wsgi_run_once = False
+
+    stdin = conn.makefile('rb')
+    stdout = conn.makefile('wb')
+    try:
+        header = stdin.readline()
+        if not header:
+            return
+        environ = json.loads(header.decode('utf-8'))['environ']
+        handler = ForwardedCGIHandler(stdin, stdout, sys.stderr, environ,
+                                      multithread=True, multiprocess=True)
+        handler.run(app)
+        stdout.flush()
+    finally:
+        stdout.close()
+        stdin.close()
+
+
+def worker_loop(listener, app):
+    stopping = []
+
+    def on_term(signum, frame):
+        stopping.append(signum)
+        listener.close()  # wakes up accept()
+
+    signal.signal(signal.SIGTERM, on_term)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    served = 0
+    while not stopping and served < DAEMON_MAX_REQUESTS:
+        try:
+            conn, _ = listener.accept()
+        except OSError as e:
+            if stopping:
+                break
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        try:
+            serve_connection(conn, app)
+        except Exception as e:
+            _log(f"request failed: {e}")
+        finally:
+            try:
+                conn.close()
+            except OSError:
+                pass
+        served += 1
+
+    # 実行中・待機中の変換ジョブを最後まで処理してから終了する
+    import app as app_module
+    if app_module._job_executor is not None:
+        app_module._job_executor.shutdown(wait=True)
+    _flush_converter_logs()
+    os._exit(0)
+
+
+def _flush_converter_logs():
+    """os._exit skips atexit: write out the converter's queued log records first."""
+    converter = sys.modules.get('convert_xbrl_to_excel')
+    if converter is not None:
+        try:
+            converter.shutdown_logging()
+        except Exception:
+            pass
+
+
+# ========================================================================
+# MASTER (PRE-FORK)
+# ========================================================================
+# 【将来の分割先】deploy/daemon/master.py
+
+def _spawn_worker(listener, app):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            worker_loop(listener, app)
+        finally:
+            _flush_converter_logs()
+            os._exit(1)
+    return pid
+
+
+def run_master(sock_path=DAEMON_SOCKET, workers=DAEMON_WORKERS):
+    import fcntl
+
+    # 二重起動防止（ロックファイルにはPIDを書く。--stop で使用）
+    lock_file = open(_lock_path(sock_path), 'a+')
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        _log(f"already running ({_lock_path(sock_path)} is locked)")
+        return 0
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+
+    app = preload()
+
+    if os.path.exists(sock_path):
+        os.remove(sock_path)
+    old_umask = os.umask(0o077)  # ソケットは同じユーザー（CGIの実行ユーザー）のみ接続可
+    try:
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(sock_path)
+    finally:
+        os.umask(old_umask)
+    listener.listen(64)
+
+    children = set()
+    stopping = []
+
+    def on_term(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, on_term)
+    signal.signal(signal.SIGINT, on_term)
+
+    for _ in range(workers):
+        children.add(_spawn_worker(listener, app))
+    _log(f"listening on {sock_path} with {workers} workers")
+
+    # シグナルハンドラーは例外を投げないため（PEP 475 で wait が再開される）、ポーリングで監視する
+    while children and not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+        children.discard(pid)
+        if not stopping:
+            children.add(_spawn_worker(listener, app))
+
+    # 停止: 新しい接続を受け付けないようにしてから、ワーカーの終了（ジョブ完了）を待つ
+    listener.close()
+    if os.path.exists(sock_path):
+        os.remove(sock_path)
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in children:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    _log("stopped")
+    return 0
+
+
+def detach():
+    """Double-fork into the background; stdout/stderr go to xbrl_daemon.log."""
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    log_fd = os.open(DAEMON_LOG_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    os.dup2(devnull, 0)
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    os.close(devnull)
+    os.close(log_fd)
+
+
+def stop(sock_path=DAEMON_SOCKET):
+    try:
+        with open(_lock_path(sock_path), 'r') as f:
+            pid = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        pid = 0
+    if not pid:
+        print("xbrl_daemon is not running.", file=sys.stderr)
+        return 1
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        print("xbrl_daemon is not running.", file=sys.stderr)
+        return 1
+    print(f"Sent SIGTERM to xbrl_daemon (pid {pid}).")
+    return 0
+
+
+# ========================================================================
+# FORWARDING CLIENT
+# ========================================================================
+# 【将来の分割先】deploy/cgi/forward.py
+
+def forward_cgi_request(sock_path=DAEMON_SOCKET, stdin=None, stdout=None):
+    """Forward the current CGI request to the daemon and relay its response.
+
+    Returns False (without consuming stdin) when the daemon is not reachable, so the
+    caller can handle the request in-process instead.
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(sock_path):
+        return False
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(sock_path)
+    except OSError:
+        conn.close()
+        return False
+
+    from wsgiref.handlers import read_environ
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+    body_read = relayed = False
+    try:
+        # Same environ as CGIHandler would build (bytes values transcoded the WSGI way)
+        header = json.dumps({'environ': read_environ()}) + '\n'
+        conn.sendall(header.encode('utf-8'))
+
+        remaining = int(os.environ.get('CONTENT_LENGTH') or 0)
+        while remaining > 0:
+            chunk = stdin.read(min(remaining, 65536))
+            body_read = True
+            if not chunk:
+                break
+            conn.sendall(chunk)
+            remaining -= len(chunk)
+        conn.shutdown(socket.SHUT_WR)
+
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            stdout.write(chunk)
+            relayed = True
+        stdout.flush()
+    except OSError as e:
+        error = e
+    else:
+        error = 'no response'
+    finally:
+        conn.close()
+
+    if not relayed:
+        # Nothing consumed yet (e.g. a worker was killed): the caller can still serve the request itself
+        if not body_read:
+            return False
+        stdout.write(b'Status: 502 Bad Gateway\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n'
+                     + f'xbrl_daemon connection failed: {error}\n'.encode('utf-8'))
+        stdout.flush()
+    return True
+
+
+def autostart(sock_path=DAEMON_SOCKET):
+    """Start the daemon in the background (no-op if it is already running)."""
+    import subprocess
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--detach', '--socket', sock_path],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True, close_fds=True, cwd=APP_DIR,
+    )
+
+
+# ========================================================================
+# CLI ENTRY POINT
+# ========================================================================
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Persistent pre-forked worker daemon for index.cgi.')
+    parser.add_argument('--socket', default=DAEMON_SOCKET, help=f'Unix socket path (default: {DAEMON_SOCKET})')
+    parser.add_argument('--workers', type=int, default=DAEMON_WORKERS, help=f'worker processes (default: {DAEMON_WORKERS})')
+    parser.add_argument('--detach', action='store_true', help='run in the background (log: xbrl_daemon.log)')
+    parser.add_argument('--stop', action='store_true', help='stop a running daemon')
+    args = parser.parse_args()
+
+    if args.stop:
+        return stop(args.socket)
+    if args.detach:
+        detach()
+    return run_master(args.socket, max(1, args.workers))
+
+
+if __name__ == '__main__':
+    sys.exit(main())